@@ -5,7 +5,7 @@ from app.schemas.media import MediaCreate, MediaUpdate, MediaResponse, MediaAnal
 from firebase_admin import storage
 from datetime import datetime, timezone
 import logging
-import base64
+import time
 import json
 
 try:
@@ -15,6 +15,8 @@ except ImportError:
     GENAI_AVAILABLE = False
 
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.utils.image_ingest import blob_path_from_url, ingest_image, image_mime_type, is_rendition_path, prepare_for_analysis
 
 logger = logging.getLogger(__name__)
 
@@ -148,6 +150,38 @@ async def analyze_media(media_id: str, media_model: MediaModel = Depends(get_med
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch image: {str(e)}")
 
+@router.post("/{media_id}/renditions", response_model=MediaResponse)
+def create_media_renditions(media_id: str, media_model: MediaModel = Depends(get_media_model)):
+    """
+    Create the thumbnail and working copy for an existing image.
+    Used to backfill media ingested before renditions existed.
+    """
+    media_item = media_model.get(media_id)
+    if media_item is None:
+        raise HTTPException(status_code=404, detail="Media item not found")
+
+    if media_item.get("type") != "image":
+        raise HTTPException(status_code=400, detail="Media item is not an image")
+
+    storage_url = media_item.get("storage_url")
+    if not storage_url:
+        raise HTTPException(status_code=400, detail="No storage URL found")
+
+    try:
+        bucket = storage.bucket()
+        blob_path = blob_path_from_url(storage_url, bucket.name)
+        image_bytes = bucket.blob(blob_path).download_as_bytes()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch image: {str(e)}")
+
+    rendition_urls = ingest_image(image_bytes, blob_path, bucket)
+    if not rendition_urls.get("thumb_url"):
+        raise HTTPException(status_code=500, detail="Failed to create renditions")
+
+    # working_url stays unset when the original is already the smaller file
+    media_model.update(media_id, rendition_urls)
+    return media_model.get(media_id)
+
 @router.post("/analyze-new")
 async def analyze_new_upload(request: MediaAnalyzeRequest, media_model: MediaModel = Depends(get_media_model)):
     """
@@ -156,7 +190,8 @@ async def analyze_new_upload(request: MediaAnalyzeRequest, media_model: MediaMod
     This endpoint:
     1. Creates a Firestore entry with the image metadata
     2. Fetches the image from storage
-    3. Analyzes it with Gemini (TODO)
+    3. Uploads a thumbnail and a 1080p working copy next to it
+    4. Analyzes it with Gemini
     """
     logger.info("=" * 80)
     logger.info("🚀 ANALYZE-NEW ENDPOINT CALLED")
@@ -172,28 +207,24 @@ async def analyze_new_upload(request: MediaAnalyzeRequest, media_model: MediaMod
         bucket = storage.bucket()
 
         # Extract blob path from storage_url
-        # URL format: https://storage.googleapis.com/bucket-name/path/to/file.jpg
-        # Split on .app/ to get the path after the bucket name
-        if ".firebasestorage.app/" in storage_url:
-            blob_path = storage_url.split(".firebasestorage.app/")[-1]
-        elif ".appspot.com/" in storage_url:
-            blob_path = storage_url.split(".appspot.com/")[-1]
-        else:
-            # Fallback: try to extract from the URL
-            blob_path = storage_url.split(f"/{bucket.name}/")[-1]
-
-        # URL decode the blob path (to handle spaces and special characters)
-        from urllib.parse import unquote
-        blob_path = unquote(blob_path)
+        blob_path = blob_path_from_url(storage_url, bucket.name)
 
         logger.info(f"📁 Blob path: {blob_path}")
 
+        if is_rendition_path(blob_path):
+            # Our own thumbnail/working copy, not a new photo
+            logger.info("⏭️  Skipping ingest rendition")
+            return {"message": "Skipped rendition upload", "storage_url": storage_url}
+
         blob = bucket.blob(blob_path)
 
         # Download image bytes
         image_bytes = blob.download_as_bytes()
         logger.info(f"✅ Image downloaded successfully! Size: {len(image_bytes)} bytes")
 
+        # Thumbnail and working copy, uploaded next to the original
+        rendition_urls = ingest_image(image_bytes, blob_path, bucket)
+
         # Call Gemini API to analyze the image
         logger.info("🤖 Analyzing image with Gemini...")
 
@@ -204,10 +235,14 @@ async def analyze_new_upload(request: MediaAnalyzeRequest, media_model: MediaMod
             # Initialize Gemini model
             model = genai.GenerativeModel('gemini-2.5-flash')
 
-            # Prepare image for Gemini
+            # Prepare image for Gemini: downscaled JPEG, passed as raw bytes (the SDK encodes it for the wire)
+            if settings.GEMINI_IMAGE_PREPROCESS:
+                analysis_bytes, mime_type = prepare_for_analysis(image_bytes, blob.content_type)
+            else:
+                analysis_bytes, mime_type = image_bytes, image_mime_type(image_bytes, blob.content_type)
             image_parts = [{
-                'mime_type': 'image/jpeg',
-                'data': base64.b64encode(image_bytes).decode('utf-8')
+                'mime_type': mime_type,
+                'data': analysis_bytes
             }]
 
             # Create prompt for structured output
@@ -224,7 +259,12 @@ Respond in JSON format with this structure:
 }"""
 
             # Generate content
+            started = time.time()
             response = model.generate_content([prompt, image_parts[0]])
+            # Compare GEMINI_IMAGE_PREPROCESS on and off
+            variant = "preprocessed" if settings.GEMINI_IMAGE_PREPROCESS else "original"
+            metrics.observe(f"gemini.analyze_image.{variant}", time.time() - started)
+            metrics.incr(f"gemini.analyze_image.{variant}.bytes", len(analysis_bytes))
 
             # Parse JSON response (handle markdown code blocks if present)
             response_text = response.text.strip()
@@ -262,6 +302,7 @@ Respond in JSON format with this structure:
             media_data = {
                 "type": request.type,
                 "storage_url": storage_url,
+                **rendition_urls,
                 "ts": datetime.now(timezone.utc),
                 "summary": analysis_result.get("summary"),
                 "elements": analysis_result.get("elements"),
@@ -284,6 +325,7 @@ Respond in JSON format with this structure:
             media_data = {
                 "type": request.type,
                 "storage_url": storage_url,
+                **rendition_urls,
                 "ts": datetime.now(timezone.utc),
                 "error": str(gemini_error)
             }
@@ -302,6 +344,7 @@ Respond in JSON format with this structure:
             "message": "Image analyzed successfully",
             "media_id": doc_id,
             "storage_url": storage_url,
+            **rendition_urls,
             "image_size_bytes": len(image_bytes),
             "analysis": {
                 "summary": analysis_result.get("summary"),
@@ -325,7 +368,8 @@ async def recommend_song(media_id: str, media_model: MediaModel = Depends(get_me
         media_id: The ID of the media document in Firestore
     """
     from app.models.questionnaire import QuestionnaireModel
-    from app.utils.spotify import search_track
+    from app.utils.spotify import resolve_candidates
+    from app.utils.track_catalog import get_track_catalog
 
     logger.info("=" * 80)
     logger.info("🎵 RECOMMEND-SONG ENDPOINT CALLED")
@@ -386,7 +430,24 @@ async def recommend_song(media_id: str, media_model: MediaModel = Depends(get_me
         if questionnaire_data:
             questionnaire_str = "\n".join([f"Q: {qa['question']}\nA: {qa['answer']}" for qa in questionnaire_data])
 
-        prompt = f"""You are a music recommendation expert. Based on the following information, recommend ONE song that would be perfect for this moment.
+        candidate_count = max(1, settings.SONG_RECOMMENDATION_CANDIDATES)
+
+        # Songs picked before for this mood, as a hint; the model's choices are still resolved as usual
+        catalog = get_track_catalog()
+        mood_hint = ""
+        if catalog:
+            try:
+                mood_tracks = catalog.by_mood(image_mood, user_mood, limit=candidate_count)
+            except Exception as e:
+                logger.warning(f"⚠️ Track catalog mood lookup failed: {str(e)}")
+                mood_tracks = []
+            if mood_tracks:
+                logger.info(f"📚 {len(mood_tracks)} catalog tracks picked before for mood '{image_mood}'")
+                mood_hint = "\n\nSONGS PICKED BEFORE FOR THIS MOOD (found on Spotify; include any that fit, but prefer the best match):\n" + "\n".join(
+                    f"- {track['song']} by {track['song_artist']}" for track in mood_tracks
+                )
+
+        prompt = f"""You are a music recommendation expert. Based on the following information, recommend songs that would be perfect for this moment.
 
 USER PREFERENCES (from questionnaire):
 {questionnaire_str if questionnaire_str else "No questionnaire data available"}
@@ -396,14 +457,15 @@ USER'S CURRENT MOOD: {user_mood}
 IMAGE CONTEXT:
 - Image Mood: {image_mood}
 - Image Summary: {image_summary}
-- Elements in Image: {', '.join(image_elements) if image_elements else 'None'}
+- Elements in Image: {', '.join(image_elements) if image_elements else 'None'}{mood_hint}
 
-Based on all this context, recommend a single song available on Spotify that would resonate with the user right now. The name of the song must be the same name that is available on Spotify.
+Based on all this context, recommend {candidate_count} songs available on Spotify that would resonate with the user right now, ranked from best fit to worst. The name of each song must be the same name that is available on Spotify.
 
 Respond in JSON format with this exact structure:
 {{
-    "name": "Song Title",
-    "artist": "Artist Name"
+    "songs": [
+        {{"name": "Song Title", "artist": "Artist Name"}}
+    ]
 }}"""
 
         response = model.generate_content(prompt)
@@ -415,16 +477,31 @@ Respond in JSON format with this exact structure:
         elif response_text.startswith('```'):
             response_text = response_text.split('```')[1].split('```')[0].strip()
 
-        song_recommendation = json.loads(response_text)
-
-        logger.info(f"✅ Song Recommendation: {song_recommendation.get('name')} by {song_recommendation.get('artist')}")
+        parsed = json.loads(response_text)
+        # Accept a bare {"name", "artist"} object too
+        candidates = parsed.get("songs", [parsed]) if isinstance(parsed, dict) else parsed
+        candidates = [c for c in candidates if isinstance(c, dict) and c.get("name")][:candidate_count]
+        if not candidates:
+            raise Exception("Gemini returned no song candidates")
+
+        for rank, candidate in enumerate(candidates, start=1):
+            logger.info(f"✅ Song Candidate {rank}: {candidate.get('name')} by {candidate.get('artist')}")
+
+        # Search Spotify for all candidates at once; the best-ranked confident match wins
+        logger.info(f"🎧 Searching Spotify for {len(candidates)} recommended songs...")
+        resolved = await resolve_candidates(candidates)
+        if resolved:
+            chosen, spotify_data = resolved
+        else:
+            chosen, spotify_data = 0, None
+        song_recommendation = candidates[chosen]
 
-        # Search for the song on Spotify
-        logger.info("🎧 Searching Spotify for the recommended song...")
-        spotify_data = search_track(
-            song_name=song_recommendation.get("name"),
-            artist_name=song_recommendation.get("artist")
-        )
+        # Index the chosen track under the moods it was picked for
+        if catalog and spotify_data and spotify_data.get("spotify_id"):
+            try:
+                catalog.record_mood(spotify_data["spotify_id"], image_mood, user_mood)
+            except Exception as e:
+                logger.warning(f"⚠️ Track catalog write failed: {str(e)}")
 
         # Update media object with song data and user mood
         if spotify_data:
@@ -438,7 +515,7 @@ Respond in JSON format with this exact structure:
             media_model.update(media_id, update_data)
             logger.info(f"✅ Media object updated with song: {spotify_data.get('song')}")
         else:
-            logger.warning(f"⚠️ No Spotify data found for query: '{song_recommendation.get('name')}' by '{song_recommendation.get('artist')}', media object not updated")
+            logger.warning(f"⚠️ No Spotify data found for any of {len(candidates)} candidates, media object not updated")
 
         logger.info("=" * 80)
 
@@ -449,6 +526,9 @@ Respond in JSON format with this exact structure:
                 "name": song_recommendation.get("name"),
                 "artist": song_recommendation.get("artist")
             },
+            "candidates": [
+                {"name": c.get("name"), "artist": c.get("artist", "")} for c in candidates
+            ],
             "context": {
                 "user_mood": user_mood,
                 "image_mood": image_mood,
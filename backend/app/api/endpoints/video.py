@@ -1,167 +1,88 @@
 from fastapi import APIRouter, HTTPException, Depends
-from app.schemas.video import VideoGenerateRequest, VideoGenerateResponse
-from app.models.media import MediaModel
-from app.utils.lyria import generate_music
-from app.utils.video_generator import create_video_from_images
-from firebase_admin import storage
+from typing import List
+from app.schemas.video import VideoGenerateRequest, VideoJobResponse
+from app.models.video_job import VideoJobModel, JOB_STAGES
+from app.utils.video_jobs import submit_video_job, cancel_video_job
+from app.utils.workspace import ensure_workspace_capacity
 import logging
-import os
-import tempfile
-from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-def get_media_model():
-    """Dependency to get MediaModel instance"""
-    return MediaModel()
+def get_video_job_model():
+    """Dependency to get VideoJobModel instance"""
+    return VideoJobModel()
 
-@router.post("/generate", response_model=VideoGenerateResponse)
-async def generate_video(request: VideoGenerateRequest, media_model: MediaModel = Depends(get_media_model)):
+@router.post("/generate", response_model=VideoJobResponse, status_code=202)
+def generate_video(request: VideoGenerateRequest, job_model: VideoJobModel = Depends(get_video_job_model)):
     """
-    Generate a video from a list of media IDs with AI-generated music.
-    Each image is displayed for 2 seconds with transitions.
+    Queue a video generation job for a list of media IDs with AI-generated music.
+    Returns the job right away; poll GET /jobs/{job_id} for progress and the video_url.
+    quality="draft" renders a quick 480p preview without calling Lyria.
+    renditions lists extra sizes (e.g. ["720p", "480p"]) encoded from the same render.
+    output_format="hls" publishes the job's playlist_url while the video is still rendering.
+    montage_id appends to a stored montage, rendering only the newly added images.
     """
     logger.info("=" * 80)
     logger.info("🎬 VIDEO GENERATION ENDPOINT CALLED")
     logger.info(f"📋 Media IDs: {request.media_ids}")
     logger.info(f"🎵 Music Prompt: {request.music_prompt}")
+    logger.info(f"🎚️  Quality: {request.quality}")
+    logger.info(f"📐 Renditions: {request.renditions}")
     logger.info("=" * 80)
 
-    try:
-        # Fetch media items and get their storage URLs
-        logger.info(f"🔍 Fetching media items for {len(request.media_ids)} IDs...")
-        image_urls = []
-        for media_id in request.media_ids:
-            try:
-                logger.info(f"  📄 Fetching media ID: {media_id}")
-                media_item = media_model.get(media_id)
-                if not media_item:
-                    logger.warning(f"  ⚠️ Media item not found: {media_id}")
-                    continue
-
-                if media_item.get("type") != "image":
-                    logger.warning(f"  ⚠️ Media item is not an image: {media_id} (type: {media_item.get('type')})")
-                    continue
-
-                storage_url = media_item.get("storage_url")
-                if storage_url:
-                    image_urls.append(storage_url)
-                    logger.info(f"  ✅ Got storage URL for {media_id}")
-                else:
-                    logger.warning(f"  ⚠️ No storage URL for media: {media_id}")
-            except Exception as e:
-                logger.error(f"  ❌ Error fetching media {media_id}: {str(e)}", exc_info=True)
-                continue
-
-        if not image_urls:
-            logger.error("❌ No valid images found from provided media IDs")
-            raise HTTPException(status_code=400, detail="No valid images found from provided media IDs")
-
-        logger.info(f"✅ Found {len(image_urls)} valid images")
-
-        # Generate music with Lyria
-        try:
-            logger.info("🎵 Generating music with Lyria...")
-            logger.info(f"  Prompt: {request.music_prompt}")
-            logger.info(f"  Negative prompt: {request.negative_prompt}")
-            temp_audio_path = os.path.join(tempfile.gettempdir(), "generated_music.wav")
-            logger.info(f"  Temp audio path: {temp_audio_path}")
-
-            audio_path = generate_music(
-                prompt=request.music_prompt,
-                negative_prompt=request.negative_prompt,
-                sample_count=1,
-                output_path=temp_audio_path
-            )
-
-            if not audio_path:
-                logger.error("❌ Failed to generate music - generate_music returned None")
-                raise HTTPException(status_code=500, detail="Failed to generate music")
-
-            logger.info(f"✅ Music generated: {audio_path}")
-        except HTTPException:
-            raise
-        except Exception as e:
-            logger.error(f"❌ Music generation exception: {str(e)}", exc_info=True)
-            raise HTTPException(status_code=500, detail=f"Failed to generate music: {str(e)}")
-
-        # Create video
-        try:
-            logger.info("🎬 Creating video from images...")
-            logger.info(f"  Number of images: {len(image_urls)}")
-            temp_video_path = os.path.join(tempfile.gettempdir(), "generated_video.mp4")
-            logger.info(f"  Temp video path: {temp_video_path}")
-
-            success = create_video_from_images(
-                image_urls=image_urls,
-                audio_path=audio_path,
-                output_path=temp_video_path,
-                duration_per_image=2.0,
-                transition_duration=0.5
-            )
-
-            if not success:
-                logger.error("❌ Failed to create video - create_video_from_images returned False")
-                raise HTTPException(status_code=500, detail="Failed to create video")
+    if not request.media_ids:
+        raise HTTPException(status_code=400, detail="No media IDs provided")
 
-            logger.info(f"✅ Video created: {temp_video_path}")
-        except HTTPException:
-            raise
-        except Exception as e:
-            logger.error(f"❌ Video creation exception: {str(e)}", exc_info=True)
-            raise HTTPException(status_code=500, detail=f"Failed to create video: {str(e)}")
-
-        # Upload video to Firebase Storage in videos folder
-        try:
-            logger.info("☁️ Uploading video to Firebase Storage...")
-            bucket = storage.bucket()
-            logger.info(f"  Bucket: {bucket.name}")
-
-            # Generate unique filename
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            blob_path = f"videos/video_{timestamp}.mp4"
-            logger.info(f"  Blob path: {blob_path}")
-
-            blob = bucket.blob(blob_path)
-
-            # Upload file
-            logger.info(f"  Uploading file from: {temp_video_path}")
-            blob.upload_from_filename(temp_video_path, content_type='video/mp4')
-            logger.info("  ✅ File uploaded")
-
-            # Make the blob publicly accessible
-            blob.make_public()
-            logger.info("  ✅ Blob made public")
-
-            video_url = blob.public_url
-            logger.info(f"✅ Video uploaded to: {video_url}")
-        except Exception as e:
-            logger.error(f"❌ Firebase upload exception: {str(e)}", exc_info=True)
-            raise HTTPException(status_code=500, detail=f"Failed to upload video to Firebase: {str(e)}")
-
-        # Cleanup temp files
-        try:
-            logger.info("🧹 Cleaning up temp files...")
-            os.remove(temp_audio_path)
-            os.remove(temp_video_path)
-            logger.info("  ✅ Temp files removed")
-        except Exception as e:
-            logger.warning(f"  ⚠️ Failed to cleanup temp files: {str(e)}")
-
-        logger.info("=" * 80)
-
-        return {
-            "message": "Video generated successfully",
-            "video_url": video_url,
-            "media_ids": request.media_ids
-        }
-
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"❌ Video generation failed with unexpected error: {str(e)}", exc_info=True)
-        logger.info("=" * 80)
-        raise HTTPException(status_code=500, detail=f"Failed to generate video: {str(e)}")
+    # Refuse up front if this host has no disk left for another render
+    try:
+        ensure_workspace_capacity()
+    except RuntimeError as e:
+        logger.warning(f"⚠️ Video job rejected: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e))
+
+    job_id = job_model.create({
+        "status": "queued",
+        "request": request.model_dump(),
+        "media_ids": request.media_ids,
+        "quality": request.quality,
+        "stages": {stage: 0.0 for stage in JOB_STAGES}
+    })
 
+    try:
+        submit_video_job(job_id, quality=request.quality)
+    except RuntimeError as e:
+        logger.warning(f"⚠️ Video job rejected: {str(e)}")
+        job_model.update(job_id, {"status": "failed", "error": str(e)})
+        raise HTTPException(status_code=429, detail=str(e))
+
+    logger.info(f"✅ Video job queued: {job_id}")
+    return job_model.get(job_id)
+
+@router.get("/jobs", response_model=List[VideoJobResponse])
+def get_video_jobs(limit: int = 20, job_model: VideoJobModel = Depends(get_video_job_model)):
+    """Get the most recent video jobs"""
+    return job_model.get_all(limit=limit)
+
+@router.get("/jobs/{job_id}", response_model=VideoJobResponse)
+def get_video_job(job_id: str, job_model: VideoJobModel = Depends(get_video_job_model)):
+    """Get the state, per-stage progress and (once completed) the video_url of a job"""
+    job = job_model.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Video job not found")
+    return job
+
+@router.post("/jobs/{job_id}/cancel", response_model=VideoJobResponse)
+def cancel_video(job_id: str, job_model: VideoJobModel = Depends(get_video_job_model)):
+    """Cancel a queued or running job; its workspace is cleaned up"""
+    job = job_model.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Video job not found")
+    if job.get("status") in ("completed", "failed", "cancelled"):
+        raise HTTPException(status_code=409, detail=f"Video job already {job.get('status')}")
+
+    if not cancel_video_job(job_id):
+        # Not running on this process (e.g. queued before a restart): mark it directly
+        job_model.update(job_id, {"status": "cancelled"})
+    return job_model.get(job_id)
@@ -23,8 +23,81 @@ class Settings(BaseSettings):
     # External APIs
     SPOTIFY_CLIENT_ID: str = ""
     SPOTIFY_CLIENT_SECRET: str = ""
+    SPOTIFY_TOKEN_REFRESH_MARGIN_SECONDS: int = 60  # Fetch a new token this long before expires_in runs out
+    SPOTIFY_SEARCH_CACHE_BACKEND: str = "memory"  # "memory", "disk" (SQLite, shared across workers) or "none"
+    SPOTIFY_SEARCH_CACHE_PATH: str = ""  # Disk backend file; defaults to <tmp>/soundtrack_cache/spotify_search.sqlite3
+    SPOTIFY_SEARCH_CACHE_MAX_ENTRIES: int = 5000
+    SPOTIFY_SEARCH_CACHE_TTL_HOURS: float = 168
+    SPOTIFY_SEARCH_CACHE_NEGATIVE_TTL_MINUTES: float = 60  # "Not found" is retried sooner
     GEMINI_API_KEY: str = ""
+    SONG_RECOMMENDATION_CANDIDATES: int = 5  # Ranked songs requested from Gemini and searched on Spotify at once
+    TRACK_CATALOG_ENABLED: bool = True  # Local index of resolved tracks, checked before searching Spotify
+    TRACK_CATALOG_PATH: str = ""  # Defaults to <tmp>/soundtrack_cache/track_catalog.sqlite3
     OPENAI_API_KEY: str = ""
+    GOOGLE_TOKEN_REFRESH_AHEAD_SECONDS: int = 300  # Refresh the cached OAuth token in the background this early
+    GOOGLE_TOKEN_MIN_TTL_SECONDS: int = 60  # Below this remaining lifetime callers wait for a fresh token
+
+    # Outbound HTTP (shared keep-alive pools for Spotify, Lyria and Google)
+    HTTP_CONNECT_TIMEOUT: float = 5.0
+    HTTP_READ_TIMEOUT: float = 30.0
+    HTTP_RETRIES: int = 3  # Connection errors always; read errors and 429/5xx for idempotent methods only
+    HTTP_POOL_HOSTS: int = 10  # Hosts with a kept-alive pool per session
+    HTTP_POOL_MAXSIZE: int = 10  # Connections kept alive per host
+    LYRIA_READ_TIMEOUT: float = 180.0  # Generation can take well over a minute
+
+    # Video rendering
+    VIDEO_ENCODER: str = "ffmpeg"  # "ffmpeg" (raw frame pipe) or "moviepy"
+    FFMPEG_BINARY: str = ""  # Defaults to the imageio-ffmpeg binary, then PATH
+    IMAGE_DOWNLOAD_WORKERS: int = 8  # Concurrent image fetches per video
+    IMAGE_DOWNLOAD_TIMEOUT: float = 20.0  # Seconds per request (connect and read)
+    IMAGE_DOWNLOAD_RETRIES: int = 3
+    VIDEO_JOB_WORKERS: int = 2  # Background render jobs run at once (each in its own workspace)
+    VIDEO_DRAFT_JOB_WORKERS: int = 1  # Separate pool so previews don't wait behind full renders
+    VIDEO_DRAFT_AUDIO_PATH: str = ""  # Placeholder track for drafts (silent if unset)
+    VIDEO_JOB_MAX_PENDING: int = 20  # Queued + running jobs accepted per process
+    VIDEO_WORKSPACE_DIR: str = ""  # Defaults to <tmp>/soundtrack_jobs
+    VIDEO_WORKSPACE_QUOTA_MB: int = 10240  # Total disk all job workspaces may use
+    VIDEO_WORKSPACE_JOB_MB: int = 1024  # Disk reserved per job at admission
+    VIDEO_WORKSPACE_MIN_FREE_MB: int = 2048
+    VIDEO_WORKSPACE_MAX_AGE_HOURS: float = 6.0  # Janitor removes workspaces older than this
+    VIDEO_WORKSPACE_JANITOR_MINUTES: float = 15.0
+    VIDEO_RENDER_WORKERS: int = 1  # Segment render processes per video (0 = one per CPU core)
+    VIDEO_FRAME_MEMORY_BUDGET_MB: int = 512  # Decoded images kept in RAM before spilling to disk
+    VIDEO_HLS_SEGMENT_SECONDS: float = 2.0  # Segment length for output_format="hls"
+    VIDEO_STREAM_UPLOAD: bool = True  # Upload MP4s while they are encoded (fragmented MP4)
+    VIDEO_UPLOAD_CHUNK_MB: int = 8  # Resumable upload chunk size (multiple of 0.25 MB)
+    MONTAGE_CACHE_DIR: str = ""  # Local copies of stored montage segments and music; defaults to <tmp>/soundtrack_cache/montage_files
+    MONTAGE_CACHE_MAX_MB: int = 2048  # Least recently used copies are evicted (and downloaded again when needed)
+    IMAGE_CACHE_ENABLED: bool = True
+    IMAGE_CACHE_DIR: str = ""  # Defaults to <tmp>/soundtrack_cache/images
+    IMAGE_CACHE_MAX_MB: int = 2048
+    IMAGE_WORKING_MAX_WIDTH: int = 1920  # Working copy made at ingest fits the full-quality frame
+    IMAGE_WORKING_MAX_HEIGHT: int = 1080
+    IMAGE_WORKING_QUALITY: int = 88
+    IMAGE_THUMB_MAX_EDGE: int = 320
+    IMAGE_THUMB_QUALITY: int = 80
+    GEMINI_IMAGE_PREPROCESS: bool = True  # Downscale and re-encode images before Gemini analysis
+    GEMINI_IMAGE_MAX_EDGE: int = 1024  # Plenty for a summary and mood; fewer bytes and image tiles
+    GEMINI_IMAGE_QUALITY: int = 85
+    VIDEO_AUDIO_FADE_SECONDS: float = 1.5  # Fade-out at the end of the montage's audio
+    VIDEO_AUDIO_BITRATE: str = "192k"
+    AUDIO_CACHE_ENABLED: bool = True  # Reuse prepared AAC tracks per (music, duration)
+    AUDIO_CACHE_DIR: str = ""  # Defaults to <tmp>/soundtrack_cache/audio
+    AUDIO_CACHE_MAX_MB: int = 512
+    MUSIC_CACHE_ENABLED: bool = True  # Reuse Lyria tracks for repeated (prompt, negative_prompt)
+    MUSIC_CACHE_DIR: str = ""  # Defaults to <tmp>/soundtrack_cache/music
+    MUSIC_CACHE_MAX_MB: int = 1024
+    MUSIC_CACHE_TTL_HOURS: float = 0  # 0 = tracks never expire
+    MUSIC_POOL_ENABLED: bool = True  # Keep unused Lyria tracks ready for MUSIC_POOL_PROMPTS, refilled in the background
+    MUSIC_POOL_DIR: str = ""  # Defaults to <tmp>/soundtrack_cache/music_pool
+    MUSIC_POOL_SIZE: int = 3  # Ready tracks kept per prompt
+    MUSIC_POOL_BATCH: int = 4  # Lyria sample_count per refill request
+    MUSIC_POOL_REFILL_BELOW: int = 1  # Refill a prompt once fewer tracks than this are ready
+    MUSIC_POOL_PROMPTS: str = ""  # "|"-separated prompts (mood presets) to pool; others generate on demand
+
+    def get_music_pool_prompts(self) -> List[str]:
+        """Parse MUSIC_POOL_PROMPTS into a list"""
+        return [prompt.strip() for prompt in self.MUSIC_POOL_PROMPTS.split("|") if prompt.strip()]
 
     # Security
     SECRET_KEY: str = "your-secret-key-here-change-in-production"
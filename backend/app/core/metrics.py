@@ -0,0 +1,52 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict
+
+
+class Metrics:
+    """Process-wide counters and timings, exposed at GET /metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._timings: Dict[str, Dict[str, float]] = {}
+
+    def incr(self, name: str, value: float = 1):
+        """Increase counter `name` by `value`"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float):
+        """Record one duration sample for timing `name`"""
+        with self._lock:
+            timing = self._timings.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+            timing["count"] += 1
+            timing["total"] += seconds
+            timing["max"] = max(timing["max"], seconds)
+
+    @contextmanager
+    def timer(self, name: str):
+        """Time the enclosed block into timing `name`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def get(self, name: str) -> float:
+        """Current value of counter `name`"""
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Copy of all counters and timings (with averages)"""
+        with self._lock:
+            timings = {
+                name: {**timing, "avg": timing["total"] / timing["count"] if timing["count"] else 0.0}
+                for name, timing in self._timings.items()
+            }
+            return {"counters": dict(self._counters), "timings": timings}
+
+
+metrics = Metrics()
@@ -3,6 +3,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.api.endpoints import media, moods, questionnaire, biometric, video
 from app.core.config import settings
 from app.core.database import initialize_firebase
+from app.core.metrics import metrics
 
 app = FastAPI(
     title="SoundTrack API",
@@ -29,6 +30,27 @@ async def startup_event():
     initialize_firebase()
     logger.info("✅ Firebase initialized")
 
+    # Pick up video jobs interrupted by the last shutdown, and sweep their workspaces
+    from app.utils.video_jobs import resume_pending_jobs, active_job_ids
+    from app.utils.workspace import start_workspace_janitor
+    start_workspace_janitor(active_job_ids)
+    try:
+        resume_pending_jobs()
+    except Exception as e:
+        logger.error(f"❌ Failed to resume video jobs: {str(e)}")
+
+    # Pre-generate music for the pooled prompts in the background
+    from app.utils.music_pool import start_music_pool
+    try:
+        start_music_pool()
+    except Exception as e:
+        logger.error(f"❌ Failed to start music pool: {str(e)}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    from app.utils.http_client import close_async_client
+    await close_async_client()
+
 # Include routers
 app.include_router(media.router, prefix="/api/media", tags=["media"])
 app.include_router(moods.router, prefix="/api/moods", tags=["moods"])
@@ -42,4 +64,9 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "database": "firebase"}
\ No newline at end of file
+    return {"status": "healthy", "database": "firebase"}
+
+@app.get("/metrics")
+async def get_metrics():
+    """Process-wide counters (cache hits/misses, refreshes) and timings"""
+    return metrics.snapshot()
\ No newline at end of file
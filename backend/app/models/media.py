@@ -20,6 +20,7 @@ class MediaModel:
             "type": media_data.get("type"),  # 'image' or 'clip'
             "storage_url": media_data.get("storage_url"),
             "thumb_url": media_data.get("thumb_url"),
+            "working_url": media_data.get("working_url"),  # Downscaled copy used for rendering
             "duration_sec": media_data.get("duration_sec"),
             "summary": media_data.get("summary"),
             "elements": media_data.get("elements", []),  # ["trees","book"]
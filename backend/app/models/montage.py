@@ -0,0 +1,76 @@
+from datetime import datetime
+from typing import Optional, Dict, Any
+from app.core.database import get_db
+
+class MontageModel:
+    """
+    Firestore document model for an incrementally built montage (e.g. one per day).
+
+    Records what has been rendered so far so that appending images only
+    renders the new clips: the media in order, each clip's motion effect, the
+    render settings, and the stored video-only segments with their frame ranges.
+    """
+
+    COLLECTION_NAME = "montages"
+
+    def __init__(self):
+        self.db = get_db()
+        self.collection = self.db.collection(self.COLLECTION_NAME)
+
+    def to_dict(self, montage_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Convert montage data to Firestore document format"""
+        return {
+            "media_ids": montage_data.get("media_ids", []),  # Clips rendered so far, in order
+            "effects": montage_data.get("effects", []),  # Motion effect per clip
+            "quality": montage_data.get("quality", "full"),
+            "video_size": montage_data.get("video_size"),  # [width, height]
+            "fps": montage_data.get("fps"),
+            "duration_per_image": montage_data.get("duration_per_image"),
+            "transition": montage_data.get("transition"),
+            # [{"first_clip", "last_clip", "start_frame", "stop_frame", "blob_path"}]; the
+            # last clip always has a segment of its own since it is re-rendered on append
+            "segments": montage_data.get("segments", []),
+            "music_prompt": montage_data.get("music_prompt"),
+            "negative_prompt": montage_data.get("negative_prompt"),
+            "audio_blob": montage_data.get("audio_blob"),
+            "video_url": montage_data.get("video_url"),
+            "created_at": montage_data.get("created_at", datetime.utcnow()),
+            "updated_at": datetime.utcnow()
+        }
+
+    def get(self, montage_id: str) -> Optional[Dict[str, Any]]:
+        """Get a montage document by ID (with its update_time, for save_if_unchanged)"""
+        doc = self.collection.document(montage_id).get()
+        if doc.exists:
+            data = doc.to_dict()
+            data['id'] = doc.id
+            data['update_time'] = doc.update_time
+            return data
+        return None
+
+    def save(self, montage_id: str, montage_data: Dict[str, Any]) -> bool:
+        """Create or replace the montage document"""
+        self.collection.document(montage_id).set(self.to_dict(montage_data))
+        return True
+
+    def save_if_unchanged(self, montage_id: str, montage_data: Dict[str, Any], previous: Optional[Dict[str, Any]]) -> bool:
+        """
+        Save the montage only if the document is still as read in `previous`
+        (None: only if it doesn't exist yet), so renders on other processes
+        or hosts can't overwrite each other's state.
+
+        Returns:
+            True if saved, False if the document changed in the meantime
+        """
+        from google.api_core.exceptions import Conflict, FailedPrecondition, NotFound
+
+        doc_ref = self.collection.document(montage_id)
+        try:
+            if previous is None:
+                doc_ref.create(self.to_dict(montage_data))
+            else:
+                option = self.db.write_option(last_update_time=previous["update_time"])
+                doc_ref.update(self.to_dict(montage_data), option=option)
+            return True
+        except (Conflict, FailedPrecondition, NotFound):
+            return False
@@ -0,0 +1,85 @@
+from datetime import datetime
+from typing import Optional, List, Dict, Any
+from uuid import uuid4
+from app.core.database import get_db
+
+# Pipeline stages in execution order
+JOB_STAGES = ["fetch_media", "music", "render", "upload"]
+
+class VideoJobModel:
+    """Firestore video generation job document model"""
+
+    COLLECTION_NAME = "video_jobs"
+
+    def __init__(self):
+        self.db = get_db()
+        self.collection = self.db.collection(self.COLLECTION_NAME)
+
+    def to_dict(self, job_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Convert job data to Firestore document format"""
+        return {
+            "status": job_data.get("status", "queued"),  # queued | running | completed | failed | cancelled
+            "quality": job_data.get("quality", "full"),
+            "stage": job_data.get("stage"),
+            "stages": job_data.get("stages", {stage: 0.0 for stage in JOB_STAGES}),
+            "request": job_data.get("request", {}),
+            "media_ids": job_data.get("media_ids", []),
+            "video_url": job_data.get("video_url"),
+            "playlist_url": job_data.get("playlist_url"),
+            "result": job_data.get("result"),
+            "error": job_data.get("error"),
+            "attempts": job_data.get("attempts", 0),
+            "created_at": datetime.utcnow(),
+            "updated_at": datetime.utcnow()
+        }
+
+    def create(self, job_data: Dict[str, Any]) -> str:
+        """Create a new job document"""
+        doc_id = str(uuid4())
+        doc_data = self.to_dict(job_data)
+        self.collection.document(doc_id).set(doc_data)
+        return doc_id
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """Get a job document by ID"""
+        doc = self.collection.document(doc_id).get()
+        if doc.exists:
+            data = doc.to_dict()
+            data['id'] = doc.id
+            return data
+        return None
+
+    def update(self, doc_id: str, update_data: Dict[str, Any]) -> bool:
+        """Update a job document"""
+        doc_ref = self.collection.document(doc_id)
+
+        # Add updated_at timestamp
+        update_data['updated_at'] = datetime.utcnow()
+
+        doc_ref.update(update_data)
+        return True
+
+    def get_by_status(self, statuses: List[str], limit: int = 100) -> List[Dict[str, Any]]:
+        """Get jobs whose status is one of `statuses`, oldest first"""
+        docs = self.collection.where("status", "in", statuses).limit(limit).stream()
+
+        results = []
+        for doc in docs:
+            data = doc.to_dict()
+            data['id'] = doc.id
+            results.append(data)
+
+        results.sort(key=lambda job: job["created_at"].timestamp() if job.get("created_at") else 0)
+        return results
+
+    def get_all(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Get the most recent jobs"""
+        docs = self.collection.order_by("created_at", direction="DESCENDING").limit(limit).stream()
+
+        results = []
+        for doc in docs:
+            data = doc.to_dict()
+            data['id'] = doc.id
+            results.append(data)
+
+        return results
@@ -6,6 +6,7 @@ class MediaBase(BaseModel):
     type: str
     storage_url: str
     thumb_url: Optional[str] = None
+    working_url: Optional[str] = None
     duration_sec: Optional[int] = None
     summary: Optional[str] = None
     elements: Optional[List[str]] = None
@@ -46,4 +47,5 @@ class SongRecommendationResponse(BaseModel):
     message: str
     media_id: str
     recommendation: SongRecommendation
+    candidates: List[SongRecommendation] = []  # Ranked songs Gemini suggested; recommendation is the one found on Spotify
     context: dict
\ No newline at end of file
@@ -1,12 +1,39 @@
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, Field
+from typing import List, Dict, Literal, Optional
+from datetime import datetime
 
 class VideoGenerateRequest(BaseModel):
     media_ids: List[str]  # List of media IDs in order
     music_prompt: str = "Exciting music at a competition. High tempo, rich harmonies. tension is building"
     negative_prompt: str = ""
+    refresh_music: bool = False  # Generate new music even if this prompt has a cached track
+    quality: Literal["full", "draft"] = "full"  # "draft": 480p/12fps preview without Lyria
+    renditions: List[Literal["1080p", "720p", "480p"]] = []  # Extra sizes encoded from the same render
+    output_format: Literal["mp4", "hls"] = "mp4"  # "hls": segments are published while rendering
+    # Append to a stored montage (e.g. the day, "2026-10-16"): media_ids is the full list and
+    # only the images added since the last render of this montage are rendered
+    montage_id: Optional[str] = Field(default=None, pattern=r"^[A-Za-z0-9_-]{1,64}$")
 
 class VideoGenerateResponse(BaseModel):
     message: str
     video_url: str
     media_ids: List[str]
+    renditions: Dict[str, str] = {}  # Rendition name -> URL
+    playlist_url: Optional[str] = None  # HLS playlist (output_format="hls")
+
+class VideoJobResponse(BaseModel):
+    id: str
+    status: str  # queued | running | completed | failed | cancelled
+    quality: str = "full"
+    stage: Optional[str] = None
+    stages: Dict[str, float] = {}  # Per-stage progress, 0.0 to 1.0
+    media_ids: List[str]
+    video_url: Optional[str] = None
+    playlist_url: Optional[str] = None  # Set as soon as the first HLS segment is uploaded
+    result: Optional[VideoGenerateResponse] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
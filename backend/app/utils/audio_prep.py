@@ -0,0 +1,166 @@
+import hashlib
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import wave
+from typing import Optional, Tuple
+import numpy as np
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.utils.ffmpeg_encoder import get_ffmpeg_exe
+from app.utils.file_cache import FileCache, hash_file, link_or_copy
+
+logger = logging.getLogger(__name__)
+
+# Rate/layout non-WAV sources are decoded to
+DECODE_RATE = 48000
+DECODE_CHANNELS = 2
+
+
+def decode_audio(audio_path: str) -> Tuple[np.ndarray, int]:
+    """
+    Decode an audio file into an (n_samples, channels) int16 array.
+
+    16-bit PCM WAV (what Lyria returns) is read straight into NumPy; anything
+    else is decoded by ffmpeg.
+
+    Returns:
+        The samples and the sample rate
+    """
+    try:
+        with wave.open(audio_path, "rb") as wav:
+            if wav.getsampwidth() == 2:
+                channels = wav.getnchannels()
+                frames = wav.readframes(wav.getnframes())
+                samples = np.frombuffer(frames, dtype="<i2").reshape(-1, channels)
+                return samples, wav.getframerate()
+    except (wave.Error, EOFError):
+        pass
+
+    ffmpeg_exe = get_ffmpeg_exe()
+    if not ffmpeg_exe:
+        raise RuntimeError("ffmpeg binary not found")
+    result = subprocess.run(
+        [
+            ffmpeg_exe, "-v", "error", "-i", audio_path,
+            "-f", "s16le", "-acodec", "pcm_s16le",
+            "-ar", str(DECODE_RATE), "-ac", str(DECODE_CHANNELS), "pipe:1"
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not decode {audio_path}: {result.stderr.decode('utf-8', errors='replace')[-500:]}")
+    return np.frombuffer(result.stdout, dtype="<i2").reshape(-1, DECODE_CHANNELS), DECODE_RATE
+
+
+def fit_to_duration(samples: np.ndarray, rate: int, duration: float, fade_seconds: float = 0.0) -> np.ndarray:
+    """
+    Loop or trim samples to exactly `duration` seconds and fade out the end.
+
+    The output is the only array allocated: whole repeats are written through
+    a broadcast view, then the remainder, then the fade is applied in place.
+    """
+    n = int(round(duration * rate))
+    length, channels = samples.shape
+    if length == 0:
+        raise ValueError("Audio track is empty")
+
+    out = np.empty((n, channels), dtype=samples.dtype)
+    repeats, remainder = divmod(n, length)
+    if repeats:
+        out[:repeats * length].reshape(repeats, length, channels)[:] = samples
+    out[repeats * length:] = samples[:remainder]
+
+    fade = min(int(fade_seconds * rate), n)
+    if fade:
+        ramp = np.linspace(1.0, 0.0, fade, dtype=np.float32)[:, None]
+        tail = out[n - fade:]
+        np.multiply(tail, ramp, out=tail, casting="unsafe")
+    return out
+
+
+def encode_aac(samples: np.ndarray, rate: int, output_path: str, bitrate: str = "192k"):
+    """Encode int16 samples to an AAC .m4a by piping raw PCM into ffmpeg"""
+    ffmpeg_exe = get_ffmpeg_exe()
+    if not ffmpeg_exe:
+        raise RuntimeError("ffmpeg binary not found")
+    cmd = [
+        ffmpeg_exe, "-y", "-v", "error",
+        "-f", "s16le", "-ar", str(rate), "-ac", str(samples.shape[1]), "-i", "pipe:0",
+        "-c:a", "aac", "-b:a", bitrate, "-movflags", "+faststart", output_path
+    ]
+    result = subprocess.run(
+        cmd,
+        input=memoryview(np.ascontiguousarray(samples)).cast("B"),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"AAC encode failed: {result.stderr.decode('utf-8', errors='replace')[-500:]}")
+
+
+_audio_cache: Optional[FileCache] = None
+_audio_cache_lock = threading.Lock()
+
+def get_audio_cache() -> Optional[FileCache]:
+    """Process-wide cache of prepared AAC tracks, or None if disabled"""
+    global _audio_cache
+    if not settings.AUDIO_CACHE_ENABLED:
+        return None
+
+    with _audio_cache_lock:
+        if _audio_cache is None:
+            root = settings.AUDIO_CACHE_DIR or os.path.join(tempfile.gettempdir(), "soundtrack_cache", "audio")
+            _audio_cache = FileCache(root, settings.AUDIO_CACHE_MAX_MB * 1024 * 1024, ".m4a", "audio_cache")
+        return _audio_cache
+
+
+def prepare_audio_track(audio_path: str, duration: float, output_path: str) -> Optional[str]:
+    """
+    Produce the montage's final audio track: the source looped/trimmed to
+    `duration`, faded out and encoded to AAC, ready to mux with stream copy.
+
+    Tracks are cached by (audio content hash, duration), so re-rendering with
+    the same music skips the decode and encode entirely.
+
+    Args:
+        audio_path: Source track (WAV or anything ffmpeg reads)
+        duration: Length of the video in seconds
+        output_path: Where the prepared track is written (encoded on a cache
+            miss, linked or copied from the cache on a hit)
+
+    Returns:
+        output_path, or None if preparation failed. It is the caller's own
+        file, so another job evicting the cache entry can't remove it mid-mux
+    """
+    fade = settings.VIDEO_AUDIO_FADE_SECONDS
+    bitrate = settings.VIDEO_AUDIO_BITRATE
+    cache = get_audio_cache()
+
+    try:
+        started = time.time()
+        raw_key = f"{hash_file(audio_path)}|{duration:.3f}|{fade:.2f}|{bitrate}"
+        key = hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+        if cache:
+            cached = cache.get(key)
+            if cached:
+                logger.info(f"🎵 Reusing prepared audio track {cached}")
+                return link_or_copy(cached, output_path)
+
+        samples, rate = decode_audio(audio_path)
+        track = fit_to_duration(samples, rate, duration, fade_seconds=fade)
+        encode_aac(track, rate, output_path, bitrate=bitrate)
+        metrics.observe("audio_prep.encode", time.time() - started)
+        logger.info(f"🎵 Prepared {duration:.1f}s audio track in {time.time() - started:.2f}s")
+
+        if cache:
+            cache.put(key, output_path)
+        return output_path
+
+    except Exception as e:
+        logger.warning(f"⚠️ Audio preparation failed, muxing the source track instead: {str(e)}")
+        return None
@@ -0,0 +1,369 @@
+import logging
+import os
+import shutil
+import subprocess
+import threading
+from collections import deque
+from typing import BinaryIO, Iterable, List, Optional
+import numpy as np
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from ffmpeg's stdout per write to an output stream
+STREAM_READ_SIZE = 1024 * 1024
+
+
+class EncodeCancelled(Exception):
+    """Raised by a frame source to stop an encode; the encoder is killed and the exception propagates"""
+
+
+def get_ffmpeg_exe() -> Optional[str]:
+    """Locate the ffmpeg binary (explicit setting, imageio-ffmpeg, then PATH)"""
+    if settings.FFMPEG_BINARY:
+        return settings.FFMPEG_BINARY
+
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        pass
+
+    return shutil.which("ffmpeg")
+
+
+class EncodeTarget:
+    """
+    One output file of an encode: its size, x264 preset and optional bitrate.
+
+    With hls_time set, path is an HLS playlist and the stream is cut into
+    keyframe-aligned segments of about hls_time seconds written next to it.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        video_size: tuple,
+        preset: str = "medium",
+        bitrate: Optional[str] = None,
+        codec: str = "libx264",
+        hls_time: Optional[float] = None
+    ):
+        self.path = path
+        self.video_size = tuple(video_size)
+        self.preset = preset
+        self.bitrate = bitrate  # e.g. "2500k"; None leaves x264 in its default CRF mode
+        self.codec = codec
+        self.hls_time = hls_time
+
+    def with_path(self, path: str) -> "EncodeTarget":
+        """Same encode settings, different output file"""
+        return EncodeTarget(
+            path,
+            self.video_size,
+            preset=self.preset,
+            bitrate=self.bitrate,
+            codec=self.codec,
+            hls_time=self.hls_time
+        )
+
+
+class FFmpegEncoder:
+    """
+    Long-lived ffmpeg process fed raw RGB frames over stdin.
+
+    The audio track (if any) is looped/trimmed to `duration` and muxed by the
+    same process, so no temp audio file is written. With audio_codec="copy"
+    the track is expected to be prepared already and is muxed as is. Frames are written
+    straight to the pipe, so memory stays at the pipe buffer plus the frame
+    being written no matter how long the video is.
+
+    Extra `renditions` are encoded by the same process from the same frames:
+    the input is split and scaled inside ffmpeg, so each frame is rendered and
+    piped once however many output sizes are written.
+
+    With an `output_stream`, the main output is written as fragmented MP4 to
+    ffmpeg's stdout and copied to the stream as it is produced (e.g. into a
+    resumable upload), so it never has to exist as a complete file.
+    """
+
+    def __init__(
+        self,
+        output_path: str,
+        video_size: tuple,
+        fps: int = 24,
+        audio_path: Optional[str] = None,
+        duration: Optional[float] = None,
+        codec: str = "libx264",
+        preset: str = "medium",
+        audio_codec: str = "aac",
+        renditions: Optional[List[EncodeTarget]] = None,
+        hls_time: Optional[float] = None,
+        output_stream: Optional[BinaryIO] = None
+    ):
+        self.output_path = output_path
+        self.video_size = tuple(video_size)
+        self.fps = fps
+        self.audio_path = audio_path
+        self.duration = duration
+        self.codec = codec
+        self.preset = preset
+        self.audio_codec = audio_codec
+        self.targets = [
+            EncodeTarget(output_path, video_size, preset=preset, codec=codec, hls_time=hls_time)
+        ] + list(renditions or [])
+        self.output_stream = output_stream
+        self.frames_written = 0
+
+        self._process: Optional[subprocess.Popen] = None
+        self._stderr_tail: deque = deque(maxlen=50)
+        self._stderr_thread: Optional[threading.Thread] = None
+        self._stdout_thread: Optional[threading.Thread] = None
+        self._stream_error: Optional[Exception] = None
+
+    def build_command(self, ffmpeg_exe: str) -> List[str]:
+        """Build the ffmpeg command line for this encode"""
+        width, height = self.video_size
+        cmd = [
+            ffmpeg_exe, "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "rgb24",
+            "-s", f"{width}x{height}", "-r", str(self.fps),
+            "-i", "pipe:0",
+        ]
+
+        if self.audio_path:
+            if self.audio_codec != "copy":
+                # Loop the track forever; -t below trims it to the video length
+                cmd += ["-stream_loop", "-1"]
+            cmd += ["-i", self.audio_path]
+
+        video_maps = ["0:v:0"]
+        if len(self.targets) > 1:
+            # Fan the piped frames out to one scaled stream per output
+            labels = [f"[s{i}]" for i in range(len(self.targets))]
+            filters = [f"[0:v]split={len(self.targets)}{''.join(labels)}"]
+            video_maps = []
+            for i, target in enumerate(self.targets):
+                if target.video_size == self.video_size:
+                    video_maps.append(labels[i])
+                else:
+                    filters.append(f"{labels[i]}scale={target.video_size[0]}:{target.video_size[1]}[v{i}]")
+                    video_maps.append(f"[v{i}]")
+            cmd += ["-filter_complex", ";".join(filters)]
+
+        for i, (target, video_map) in enumerate(zip(self.targets, video_maps)):
+            cmd += self._output_args(target, video_map, to_stdout=i == 0 and self.output_stream is not None)
+        return cmd
+
+    def _output_args(self, target: EncodeTarget, video_map: str, to_stdout: bool = False) -> List[str]:
+        width, height = target.video_size
+        args = ["-map", video_map]
+        if self.audio_path:
+            args += ["-map", "1:a:0", "-c:a", self.audio_codec]
+
+        args += ["-c:v", target.codec, "-preset", target.preset]
+        if target.bitrate:
+            args += ["-b:v", target.bitrate, "-maxrate", target.bitrate, "-bufsize", target.bitrate]
+        if target.codec == "libx264" and width % 2 == 0 and height % 2 == 0:
+            args += ["-pix_fmt", "yuv420p"]
+
+        if self.duration:
+            args += ["-t", f"{self.duration:.3f}"]
+
+        if target.hls_time:
+            # Force a keyframe at every segment boundary so each segment starts cleanly;
+            # temp_file makes segments and playlist appear only once fully written
+            segment_pattern = os.path.join(os.path.dirname(os.path.abspath(target.path)), "segment_%05d.ts")
+            args += [
+                "-force_key_frames", f"expr:gte(t,n_forced*{target.hls_time})",
+                "-f", "hls",
+                "-hls_time", str(target.hls_time),
+                "-hls_playlist_type", "event",
+                "-hls_flags", "independent_segments+temp_file",
+                "-hls_segment_filename", segment_pattern,
+                target.path
+            ]
+            return args
+
+        if to_stdout:
+            # A pipe can't be seeked back to write the moov atom, so write fragments
+            args += ["-movflags", "frag_keyframe+empty_moov+default_base_moof", "-f", "mp4", "pipe:1"]
+            return args
+
+        args += ["-movflags", "+faststart", target.path]
+        return args
+
+    def _drain_stderr(self):
+        for line in iter(self._process.stderr.readline, b""):
+            self._stderr_tail.append(line.decode("utf-8", errors="replace").rstrip())
+
+    def _pump_stdout(self):
+        stdout = self._process.stdout
+        try:
+            for chunk in iter(lambda: stdout.read(STREAM_READ_SIZE), b""):
+                self.output_stream.write(chunk)
+        except Exception as e:
+            # Stop ffmpeg so the frame writer fails fast instead of filling the pipe
+            self._stream_error = e
+            logger.error(f"❌ Output stream failed: {str(e)}")
+            self._process.kill()
+
+    def start(self):
+        """Spawn the ffmpeg process"""
+        ffmpeg_exe = get_ffmpeg_exe()
+        if not ffmpeg_exe:
+            raise RuntimeError("ffmpeg binary not found")
+
+        cmd = self.build_command(ffmpeg_exe)
+        logger.info(f"🎞️  Starting ffmpeg encoder: {' '.join(cmd)}")
+        self._process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE if self.output_stream is not None else subprocess.DEVNULL,
+            stderr=subprocess.PIPE
+        )
+        self._stderr_thread = threading.Thread(target=self._drain_stderr, daemon=True)
+        self._stderr_thread.start()
+        if self.output_stream is not None:
+            self._stdout_thread = threading.Thread(target=self._pump_stdout, daemon=True)
+            self._stdout_thread.start()
+
+    def write(self, frame: np.ndarray):
+        """Write one HxWx3 uint8 frame to the encoder"""
+        if frame.dtype != np.uint8 or not frame.flags.c_contiguous:
+            frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        self._process.stdin.write(memoryview(frame).cast("B"))
+        self.frames_written += 1
+
+    def finish(self) -> bool:
+        """Close stdin and wait for ffmpeg to flush the output"""
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = self._process.wait()
+        self._stderr_thread.join(timeout=5)
+        if self._stdout_thread:
+            # The stream may still be sending its last chunks
+            self._stdout_thread.join()
+            if self._stream_error is not None:
+                return False
+
+        if returncode != 0:
+            logger.error(f"❌ ffmpeg exited with code {returncode}: {' | '.join(self._stderr_tail)}")
+            return False
+        return True
+
+    def abort(self):
+        """Kill the ffmpeg process without waiting for the output"""
+        if self._process and self._process.poll() is None:
+            self._process.kill()
+            self._process.wait()
+        if self._stdout_thread:
+            self._stdout_thread.join(timeout=5)
+
+    def error_output(self) -> str:
+        """Last lines ffmpeg wrote to stderr"""
+        return "\n".join(self._stderr_tail)
+
+
+def encode_frames(
+    frames: Iterable[np.ndarray],
+    output_path: str,
+    video_size: tuple,
+    fps: int = 24,
+    audio_path: Optional[str] = None,
+    duration: Optional[float] = None,
+    codec: str = "libx264",
+    preset: str = "medium",
+    renditions: Optional[List[EncodeTarget]] = None,
+    hls_time: Optional[float] = None,
+    output_stream: Optional[BinaryIO] = None,
+    audio_codec: str = "aac"
+) -> bool:
+    """
+    Encode a frame generator (and optional audio) to output_path through one
+    ffmpeg pipe, plus any extra renditions scaled from the same frames.
+    With hls_time set, output_path is written as an HLS playlist; with
+    output_stream, the main output goes to the stream instead of output_path.
+
+    Returns:
+        True if successful, False otherwise
+    """
+    encoder = FFmpegEncoder(
+        output_path,
+        video_size,
+        fps=fps,
+        audio_path=audio_path,
+        duration=duration,
+        codec=codec,
+        preset=preset,
+        renditions=renditions,
+        hls_time=hls_time,
+        output_stream=output_stream,
+        audio_codec=audio_codec
+    )
+    try:
+        encoder.start()
+        for frame in frames:
+            encoder.write(frame)
+    except EncodeCancelled:
+        encoder.abort()
+        raise
+    except Exception as e:
+        logger.error(f"❌ ffmpeg pipe encode failed after {encoder.frames_written} frames: {str(e)} {encoder.error_output()}")
+        encoder.abort()
+        return False
+
+    return encoder.finish()
+
+
+def concat_segments(
+    segment_paths: List[str],
+    output_path: str,
+    audio_path: Optional[str] = None,
+    duration: Optional[float] = None,
+    audio_codec: str = "aac"
+) -> bool:
+    """
+    Join encoded video segments with the concat demuxer (stream copy, no
+    re-encode) and mux the looped/trimmed audio track in the same pass.
+
+    Returns:
+        True if successful, False otherwise
+    """
+    ffmpeg_exe = get_ffmpeg_exe()
+    if not ffmpeg_exe:
+        logger.error("❌ ffmpeg binary not found")
+        return False
+
+    list_path = f"{output_path}.segments.txt"
+    with open(list_path, "w") as f:
+        for path in segment_paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+    cmd = [ffmpeg_exe, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_path]
+    if audio_path:
+        if audio_codec != "copy":
+            cmd += ["-stream_loop", "-1"]
+        cmd += ["-i", audio_path]
+    cmd += ["-map", "0:v:0", "-c:v", "copy"]
+    if audio_path:
+        cmd += ["-map", "1:a:0", "-c:a", audio_codec]
+    if duration:
+        cmd += ["-t", f"{duration:.3f}"]
+    cmd += ["-movflags", "+faststart", output_path]
+
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    finally:
+        try:
+            os.remove(list_path)
+        except OSError:
+            pass
+
+    if result.returncode != 0:
+        logger.error(f"❌ ffmpeg concat failed: {result.stderr.decode('utf-8', errors='replace')[-2000:]}")
+        return False
+    return True
@@ -0,0 +1,185 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Optional
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """sha256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_or_copy(src_path: str, dst_path: str) -> str:
+    """
+    Give dst_path its own directory entry for src_path's contents: a hard link
+    when both are on one filesystem, else a copy. Evicting or replacing the
+    source afterwards doesn't affect it.
+    """
+    try:
+        os.remove(dst_path)
+    except OSError:
+        pass
+    try:
+        os.link(src_path, dst_path)
+    except OSError:
+        shutil.copyfile(src_path, dst_path)
+    return dst_path
+
+
+class DiskCache:
+    """
+    Base of the on-disk LRU caches: entries are files named by key under
+    `root`, their total size is tracked in memory, and the least recently used
+    (by the later of atime and mtime) are evicted once it passes `max_bytes`.
+    """
+
+    def __init__(self, root: str, max_bytes: int, suffix: str, name: str):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.name = name  # Metric prefix, e.g. "audio_cache"
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._size = self._scan_size()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}{self.suffix}")
+
+    def _scan_size(self) -> int:
+        total = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                try:
+                    total += os.path.getsize(os.path.join(dirpath, filename))
+                except OSError:
+                    pass
+        return total
+
+    def _temp_path(self, key: str) -> str:
+        """Temp file next to key's entry; write it, then _commit it"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        os.close(fd)
+        return tmp_path
+
+    def _commit(self, tmp_path: str, key: str) -> str:
+        """Move a fully written temp file into place as key's entry, evicting past the quota"""
+        path = self._path(key)
+        size = os.path.getsize(tmp_path)
+        with self._lock:
+            try:
+                # Replacing an entry (e.g. a forced refresh) frees the old copy
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            os.replace(tmp_path, path)
+            self._size += size - replaced
+            metrics.incr(f"{self.name}.writes")
+            if self._size > self.max_bytes:
+                self._evict()
+        return path
+
+    def remove(self, key: str):
+        """Drop the entry for key if present"""
+        path = self._path(key)
+        with self._lock:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except OSError:
+                return
+            self._size -= size
+
+    def _evict(self):
+        """Remove least recently used entries down to 90% of max_bytes; caller holds the lock"""
+        entries = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if not filename.endswith(self.suffix):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((max(stat.st_atime, stat.st_mtime), stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        # Leave some headroom so we don't evict on every write
+        target = int(self.max_bytes * 0.9)
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                metrics.incr(f"{self.name}.evictions")
+            except OSError:
+                pass
+
+        self._size = total
+        logger.info(f"🧹 {self.name} evicted down to {total // (1024 * 1024)} MB")
+
+
+class FileCache(DiskCache):
+    """
+    On-disk cache of whole files (encoded audio, generated tracks) keyed by hash.
+
+    Reads set the file atime and the least recently used entries are evicted
+    once the directory grows past `max_bytes`. The mtime keeps the time the
+    entry was written, so entries older than `ttl` seconds (if set) expire.
+    """
+
+    def __init__(self, root: str, max_bytes: int, suffix: str, name: str, ttl: Optional[float] = None):
+        super().__init__(root, max_bytes, suffix, name)
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the path of the cached file for key, or None on a miss"""
+        path = self._path(key)
+        try:
+            stat = os.stat(path)
+            now = time.time()
+            if self.ttl and now - stat.st_mtime > self.ttl:
+                metrics.incr(f"{self.name}.expired")
+                self.remove(key)
+                raise FileNotFoundError(path)
+            os.utime(path, (now, stat.st_mtime))
+        except OSError:
+            metrics.incr(f"{self.name}.misses")
+            return None
+
+        metrics.incr(f"{self.name}.hits")
+        return path
+
+    def put(self, key: str, src_path: str) -> str:
+        """
+        Copy a finished file into the cache under key.
+
+        Returns:
+            The path of the cached copy (which eviction may remove at any time)
+        """
+        # Copy to a temp file first so readers never see a partial entry
+        tmp_path = self._temp_path(key)
+        try:
+            with open(tmp_path, "wb") as dst, open(src_path, "rb") as src:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            return self._commit(tmp_path, key)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
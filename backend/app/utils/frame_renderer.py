@@ -0,0 +1,198 @@
+import logging
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+from PIL import Image
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Ken Burns style motion effects (all images get continuous motion)
+MOTION_EFFECTS = [
+    'zoom_and_pan_right',
+    'zoom_and_pan_left',
+    'zoom_and_pan_down',
+    'zoom_and_pan_up',
+    'slow_zoom_in',
+    'slow_zoom_out',
+    'diagonal_drift_1',
+    'diagonal_drift_2'
+]
+
+# (start scale, end scale) of every motion effect, eased with ease_in_out.
+# concatenate_videoclips(method="compose") re-centres every clip, so the
+# on-screen motion of each effect is a centred zoom between these scales.
+MOTION_ZOOM: Dict[str, Tuple[float, float]] = {
+    'zoom_and_pan_right': (1.0, 1.15),
+    'zoom_and_pan_left': (1.0, 1.15),
+    'zoom_and_pan_down': (1.0, 1.15),
+    'zoom_and_pan_up': (1.0, 1.15),
+    'slow_zoom_in': (1.0, 1.2),
+    'slow_zoom_out': (1.2, 1.0),
+    'diagonal_drift_1': (1.15, 1.15),
+    'diagonal_drift_2': (1.15, 1.15),
+}
+DEFAULT_ZOOM = (1.0, 1.1)
+
+# Largest scale any effect reaches; sources are pre-scaled to this once
+MAX_ZOOM = max(max(zoom) for zoom in MOTION_ZOOM.values())
+
+ImageSource = Union[str, Image.Image]
+
+
+def ease_in_out(t):
+    """Smooth easing function for natural motion"""
+    return t * t * (3 - 2 * t)
+
+
+def build_motion_table(effect_type: str, duration: float, fps: int, video_size: tuple) -> np.ndarray:
+    """
+    Precompute the per-frame crop/scale boxes of a motion effect.
+
+    Row i is the (left, top, right, bottom) box of the source pre-scaled to
+    MAX_ZOOM that gets scaled onto frame i. The geometry matches moviepy's
+    resize + centred blit: the image is scaled to int(w * s) x int(h * s) and
+    placed at int((w - ws) / 2), int((h - hs) / 2).
+    """
+    start_scale, end_scale = MOTION_ZOOM.get(effect_type, DEFAULT_ZOOM)
+    width, height = video_size
+    source_width, source_height = prescaled_size(video_size)
+
+    n_frames = max(1, int(round(duration * fps)))
+    progress = ease_in_out(np.arange(n_frames) / fps / duration)
+    scales = start_scale + (end_scale - start_scale) * progress
+
+    scaled_width = (width * scales).astype(np.int64)
+    scaled_height = (height * scales).astype(np.int64)
+    offset_x = np.trunc((width - scaled_width) / 2)
+    offset_y = np.trunc((height - scaled_height) / 2)
+    step_x = source_width / scaled_width
+    step_y = source_height / scaled_height
+
+    table = np.empty((n_frames, 4), dtype=np.float64)
+    table[:, 0] = -offset_x * step_x
+    table[:, 1] = -offset_y * step_y
+    table[:, 2] = (width - offset_x) * step_x
+    table[:, 3] = (height - offset_y) * step_y
+    return table
+
+
+def prescaled_size(video_size: tuple) -> Tuple[int, int]:
+    """Size of a source image pre-scaled to MAX_ZOOM"""
+    return int(round(video_size[0] * MAX_ZOOM)), int(round(video_size[1] * MAX_ZOOM))
+
+
+def prescale_source(image: ImageSource, video_size: tuple) -> Image.Image:
+    """Load a letterboxed image and scale it once to MAX_ZOOM for the renderer"""
+    if isinstance(image, str):
+        image = Image.open(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    if image.size == prescaled_size(video_size):
+        # Already pre-scaled (e.g. loaded from the image cache)
+        return image
+    if image.size != video_size:
+        image = image.resize(video_size, Image.LANCZOS)
+    return image.resize(prescaled_size(video_size), Image.LANCZOS)
+
+
+class MontageRenderer:
+    """
+    Renders the Ken Burns montage frame by frame.
+
+    Each source is pre-scaled once to MAX_ZOOM and every frame is a single
+    crop/scale of that source looked up from a precomputed table.
+    Clips overlap by `transition` seconds like the moviepy composition: the
+    incoming clip is drawn over the outgoing one, the first clip fades in and
+    every clip fades out to black. Only the sources of the clip being drawn
+    are kept decoded, so memory does not grow with the number of images.
+    """
+
+    def __init__(
+        self,
+        images: Sequence[ImageSource],
+        effects: List[str],
+        duration_per_image: float,
+        transition: float,
+        fps: int = 24,
+        video_size: tuple = (1920, 1080)
+    ):
+        if len(images) == 0:
+            raise ValueError("MontageRenderer needs at least one image")
+        if len(effects) != len(images):
+            raise ValueError("MontageRenderer needs one motion effect per image")
+
+        self.images = images
+        self.effects = list(effects)
+        self.duration_per_image = duration_per_image
+        self.transition = transition
+        self.fps = fps
+        self.video_size = tuple(video_size)
+
+        step = duration_per_image - transition
+        self.clip_starts = np.array([i * step for i in range(len(images))])
+        self.duration = float(self.clip_starts[-1] + duration_per_image)
+        self.n_frames = int(self.duration * fps)
+
+        self._tables: Dict[str, np.ndarray] = {}
+        self._source_index: Optional[int] = None
+        self._source: Optional[Image.Image] = None
+
+    def _motion_table(self, effect_type: str) -> np.ndarray:
+        table = self._tables.get(effect_type)
+        if table is None:
+            table = build_motion_table(effect_type, self.duration_per_image, self.fps, self.video_size)
+            self._tables[effect_type] = table
+        return table
+
+    def _prepared_source(self, index: int) -> Image.Image:
+        if self._source_index != index:
+            self._source = prescale_source(self.images[index], self.video_size)
+            self._source_index = index
+        return self._source
+
+    def clip_at(self, t: float) -> int:
+        """Index of the clip drawn on top at time t"""
+        index = int(np.searchsorted(self.clip_starts, t + 1e-9, side='right')) - 1
+        return min(max(index, 0), len(self.images) - 1)
+
+    def clip_frame_starts(self) -> List[int]:
+        """First frame index on which each clip is drawn on top"""
+        times = np.arange(self.n_frames) / self.fps
+        clip_per_frame = np.searchsorted(self.clip_starts, times + 1e-9, side='right') - 1
+        return [int(np.searchsorted(clip_per_frame, i, side='left')) for i in range(len(self.images))]
+
+    def _fade(self, index: int, local_t: float) -> float:
+        fading = 1.0
+        if index == 0 and local_t < self.transition:
+            fading *= local_t / self.transition
+        remaining = self.duration_per_image - local_t
+        if remaining < self.transition:
+            fading *= max(remaining, 0.0) / self.transition
+        return fading
+
+    def frame_at(self, frame_index: int) -> np.ndarray:
+        """Render frame `frame_index` of the montage as an HxWx3 uint8 array"""
+        t = frame_index / self.fps
+        index = self.clip_at(t)
+        local_t = t - self.clip_starts[index]
+
+        table = self._motion_table(self.effects[index])
+        row = min(int(round(local_t * self.fps)), len(table) - 1)
+
+        source = self._prepared_source(index)
+        frame = source.resize(self.video_size, Image.BILINEAR, box=tuple(table[row]))
+        pixels = np.asarray(frame)
+
+        fading = self._fade(index, local_t)
+        if fading < 1.0:
+            pixels = (pixels * fading).astype(np.uint8)
+        return pixels
+
+    def make_frame(self, t: float) -> np.ndarray:
+        """moviepy-compatible frame callback"""
+        return self.frame_at(min(int(t * self.fps + 1e-6), max(self.n_frames - 1, 0)))
+
+    def iter_frames(self, start: int = 0, stop: Optional[int] = None) -> Iterator[np.ndarray]:
+        """Yield frames [start, stop) in order"""
+        stop = self.n_frames if stop is None else min(stop, self.n_frames)
+        for frame_index in range(start, stop):
+            yield self.frame_at(frame_index)
@@ -0,0 +1,101 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from typing import Dict, Optional
+from PIL import Image
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class FrameStore:
+    """
+    Letterboxed source images for one render, indexed by position.
+
+    Images are kept decoded in memory until `memory_budget` bytes are used;
+    anything beyond that is spilled losslessly to .npy files and memory-mapped
+    back on access. The spill directory is only created on the first spill,
+    so renders that fit in the budget never touch the disk.
+    """
+
+    def __init__(self, memory_budget: int, spill_dir: Optional[str] = None):
+        self.memory_budget = memory_budget
+        self.memory_used = 0
+        self.spilled = 0
+
+        self._spill_root = spill_dir
+        self._spill_dir: Optional[str] = None
+        self._owns_spill_dir = False
+        self._images: Dict[int, Image.Image] = {}
+        self._spill_paths: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def _spill_path(self, index: int) -> str:
+        if self._spill_dir is None:
+            if self._spill_root:
+                os.makedirs(self._spill_root, exist_ok=True)
+                self._spill_dir = self._spill_root
+            else:
+                self._spill_dir = tempfile.mkdtemp(prefix="frames_")
+                self._owns_spill_dir = True
+        return os.path.join(self._spill_dir, f"image_{index}.npy")
+
+    def put(self, index: int, image: Image.Image):
+        """Store the letterboxed image for position `index`"""
+        size = image.width * image.height * len(image.getbands())
+        with self._lock:
+            if self.memory_used + size <= self.memory_budget:
+                self._images[index] = image
+                self.memory_used += size
+                return
+            path = self._spill_path(index)
+            self._spill_paths[index] = path
+            self.spilled += 1
+
+        np.save(path, np.asarray(image))
+
+    def get(self, index: int) -> Image.Image:
+        """Return the image stored for position `index`"""
+        image = self._images.get(index)
+        if image is not None:
+            return image
+        return Image.fromarray(np.load(self._spill_paths[index], mmap_mode='r'))
+
+    def indices(self):
+        """Stored positions in order"""
+        return sorted(list(self._images) + list(self._spill_paths))
+
+    def compact(self) -> "CompactFrameStore":
+        """View of the stored images renumbered 0..n-1 (missing positions dropped)"""
+        return CompactFrameStore(self, self.indices())
+
+    def close(self):
+        """Drop in-memory images and remove spilled files"""
+        with self._lock:
+            self._images.clear()
+            for path in self._spill_paths.values():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._spill_paths.clear()
+            if self._owns_spill_dir and self._spill_dir:
+                shutil.rmtree(self._spill_dir, ignore_errors=True)
+            self._spill_dir = None
+            self.memory_used = 0
+
+
+class CompactFrameStore:
+    """Sequence view over a FrameStore that skips positions that failed to load"""
+
+    def __init__(self, store: FrameStore, indices):
+        self.store = store
+        self._indices = list(indices)
+
+    def __len__(self) -> int:
+        return len(self._indices)
+
+    def __getitem__(self, position: int) -> Image.Image:
+        return self.store.get(self._indices[position])
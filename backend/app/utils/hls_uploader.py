@@ -0,0 +1,121 @@
+import logging
+import os
+import threading
+from typing import Callable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class HLSUploader:
+    """
+    Uploads an HLS stream to Firebase Storage while ffmpeg is still writing it.
+
+    A background thread polls the local playlist. Every segment it lists is
+    uploaded before the playlist itself, so the published playlist never
+    references a segment that isn't in the bucket yet. The playlist is sent
+    with no-cache so players polling it see new segments.
+    """
+
+    def __init__(
+        self,
+        local_dir: str,
+        playlist_name: str,
+        bucket,
+        blob_prefix: str,
+        on_playlist: Optional[Callable[[str], None]] = None,
+        poll_interval: float = 0.5
+    ):
+        self.local_dir = local_dir
+        self.playlist_name = playlist_name
+        self.bucket = bucket
+        self.blob_prefix = blob_prefix.rstrip("/")
+        self.on_playlist = on_playlist
+        self.poll_interval = poll_interval
+        self.playlist_url: Optional[str] = None
+        self.segments_uploaded = 0
+
+        self._uploaded: Set[str] = set()
+        self._last_playlist: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start polling in the background"""
+        self._thread = threading.Thread(target=self._run, name="hls-uploader", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sync()
+            except Exception as e:
+                # Retried on the next poll; finish() does a last sync that raises
+                logger.warning(f"⚠️ HLS upload failed, will retry: {str(e)}")
+            self._stop.wait(self.poll_interval)
+
+    def _upload_segment(self, name: str):
+        # publicRead in the upload itself saves a make_public round trip per segment
+        blob = self.bucket.blob(f"{self.blob_prefix}/{name}")
+        blob.upload_from_filename(
+            os.path.join(self.local_dir, name),
+            content_type="video/mp2t",
+            predefined_acl="publicRead"
+        )
+
+    def sync(self):
+        """Upload any new segments, then the playlist if it changed"""
+        playlist_path = os.path.join(self.local_dir, self.playlist_name)
+        try:
+            with open(playlist_path) as f:
+                playlist = f.read()
+        except FileNotFoundError:
+            return
+
+        if playlist == self._last_playlist:
+            return
+
+        for line in playlist.splitlines():
+            name = line.strip()
+            if not name or name.startswith("#") or name in self._uploaded:
+                continue
+            self._upload_segment(name)
+            self._uploaded.add(name)
+            self.segments_uploaded += 1
+
+        blob = self.bucket.blob(f"{self.blob_prefix}/{self.playlist_name}")
+        blob.cache_control = "no-cache, max-age=0"
+        # Each overwrite is a new object generation, so the ACL is set on every upload
+        blob.upload_from_string(
+            playlist,
+            content_type="application/vnd.apple.mpegurl",
+            predefined_acl="publicRead"
+        )
+        if self.playlist_url is None:
+            self.playlist_url = blob.public_url
+            logger.info(f"📡 HLS playlist live at {self.playlist_url}")
+            if self.on_playlist:
+                self.on_playlist(self.playlist_url)
+        self._last_playlist = playlist
+
+    def stop(self):
+        """Stop polling without a final upload (e.g. the render failed)"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def finish(self) -> str:
+        """
+        Stop polling and upload whatever ffmpeg wrote last (including the end marker).
+
+        Returns:
+            The public playlist URL
+
+        Raises:
+            Exception: if the final upload fails
+        """
+        self.stop()
+        self.sync()
+        if self.playlist_url is None:
+            raise Exception(f"No HLS playlist was produced in {self.local_dir}")
+        logger.info(f"✅ Uploaded {self.segments_uploaded} HLS segments")
+        return self.playlist_url
@@ -0,0 +1,176 @@
+import logging
+import threading
+import time
+import weakref
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from app.core.config import settings
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Methods that are safe to resend after a read error or a 5xx; POSTs are only
+# retried when the connection could not be made at all
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "PUT", "DELETE", "OPTIONS"])
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+
+def _host(url: str) -> str:
+    return urlsplit(str(url)).hostname or "unknown"
+
+
+class ConnectionCounter:
+    """
+    Counts new connections per host from urllib3's pool counters.
+
+    Each pool's num_connections only grows; the increase since the last
+    response is the number of connections opened, so requests minus new
+    connections is the number served over a kept-alive connection.
+    """
+
+    def __init__(self):
+        self._seen: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, host: str, pool) -> None:
+        if pool is None:
+            return
+        with self._lock:
+            opened = pool.num_connections - self._seen.get(id(pool), 0)
+            self._seen[id(pool)] = pool.num_connections
+        if opened > 0:
+            metrics.incr(f"http.{host}.new_connections", opened)
+
+
+_connections = ConnectionCounter()
+
+
+def _record_response(response: requests.Response, *args, **kwargs):
+    """requests response hook: per-host request count, latency and connection reuse"""
+    host = _host(response.url)
+    metrics.incr(f"http.{host}.requests")
+    metrics.observe(f"http.{host}.latency", response.elapsed.total_seconds())
+    _connections.record(host, getattr(response.raw, "_pool", None))
+
+
+class PooledSession(requests.Session):
+    """
+    requests.Session with keep-alive pools per host, default timeouts,
+    retries with backoff for idempotent calls, and per-host metrics.
+    """
+
+    def __init__(self, timeout, retries: int, pool_maxsize: int):
+        super().__init__()
+        self.timeout = timeout
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.5,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=IDEMPOTENT_METHODS,
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=settings.HTTP_POOL_HOSTS,
+            pool_maxsize=pool_maxsize,
+            max_retries=retry
+        )
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+        self.hooks["response"].append(_record_response)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        try:
+            return super().request(method, url, **kwargs)
+        except requests.RequestException:
+            metrics.incr(f"http.{_host(url)}.errors")
+            raise
+
+
+def _session_profiles() -> Dict[str, Dict[str, Any]]:
+    return {
+        # Spotify, Lyria, Google OAuth
+        "api": {
+            "timeout": (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT),
+            "retries": settings.HTTP_RETRIES,
+            "pool_maxsize": settings.HTTP_POOL_MAXSIZE
+        },
+        # Image fetches for rendering, one connection per download worker of every concurrent job
+        "images": {
+            "timeout": settings.IMAGE_DOWNLOAD_TIMEOUT,
+            "retries": settings.IMAGE_DOWNLOAD_RETRIES,
+            "pool_maxsize": settings.IMAGE_DOWNLOAD_WORKERS * (settings.VIDEO_JOB_WORKERS + settings.VIDEO_DRAFT_JOB_WORKERS)
+        },
+    }
+
+
+_sessions: Dict[str, PooledSession] = {}
+_sessions_lock = threading.Lock()
+
+def get_session(name: str = "api") -> PooledSession:
+    """Shared keep-alive session for a traffic profile ("api" or "images")"""
+    with _sessions_lock:
+        session = _sessions.get(name)
+        if session is None:
+            session = PooledSession(**_session_profiles()[name])
+            _sessions[name] = session
+        return session
+
+
+async def _record_async_request(request: httpx.Request):
+    request.extensions["started"] = time.perf_counter()
+
+
+# Network streams (one per connection) already seen by the async client
+_async_streams: "weakref.WeakSet" = weakref.WeakSet()
+
+async def _record_async_response(response: httpx.Response):
+    host = _host(response.request.url)
+    metrics.incr(f"http.{host}.requests")
+    started = response.request.extensions.get("started")
+    if started is not None:
+        metrics.observe(f"http.{host}.latency", time.perf_counter() - started)
+
+    stream = response.extensions.get("network_stream")
+    try:
+        if stream is not None and stream not in _async_streams:
+            _async_streams.add(stream)
+            metrics.incr(f"http.{host}.new_connections")
+    except TypeError:
+        # Stream type can't be weakly referenced; skip reuse tracking
+        pass
+
+
+_async_client: Optional[httpx.AsyncClient] = None
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Shared httpx client for async endpoints, with the same timeouts and pool
+    limits as the "api" session. Connection failures are retried; create and
+    use it on the server's event loop only.
+    """
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.HTTP_READ_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_POOL_HOSTS * settings.HTTP_POOL_MAXSIZE,
+                max_keepalive_connections=settings.HTTP_POOL_MAXSIZE
+            ),
+            transport=httpx.AsyncHTTPTransport(retries=settings.HTTP_RETRIES),
+            event_hooks={"request": [_record_async_request], "response": [_record_async_response]}
+        )
+    return _async_client
+
+
+async def close_async_client():
+    """Close the shared async client (on application shutdown)"""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
@@ -0,0 +1,76 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from typing import Optional
+from PIL import Image
+import numpy as np
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.utils.file_cache import DiskCache
+
+logger = logging.getLogger(__name__)
+
+
+class ImageCache(DiskCache):
+    """
+    Content-addressed on-disk cache of processed (letterboxed, pre-scaled) images.
+
+    Entries are raw .npy arrays so a hit is a memory map, not a decode. Reads
+    touch the file mtime, which drives LRU eviction once the directory grows
+    past `max_bytes`.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        super().__init__(root, max_bytes, ".npy", "image_cache")
+
+    @staticmethod
+    def make_key(source: str, video_size: tuple, zoom: float) -> str:
+        """Cache key for a source (storage URL or content hash) rendered at video_size and zoom"""
+        raw = f"{source}|{video_size[0]}x{video_size[1]}|{zoom:.4f}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Image.Image]:
+        """Return the cached image for key, or None on a miss"""
+        path = self._path(key)
+        try:
+            pixels = np.load(path, mmap_mode='r')
+            os.utime(path)
+        except (OSError, ValueError):
+            metrics.incr("image_cache.misses")
+            return None
+
+        metrics.incr("image_cache.hits")
+        return Image.fromarray(pixels)
+
+    def put(self, key: str, image: Image.Image):
+        """Store an image under key, evicting least recently used entries past the quota"""
+        # Write to a temp file first so readers never see a partial entry
+        tmp_path = self._temp_path(key)
+        try:
+            with open(tmp_path, "wb") as f:
+                np.save(f, np.asarray(image))
+            self._commit(tmp_path, key)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+
+_image_cache: Optional[ImageCache] = None
+_image_cache_lock = threading.Lock()
+
+def get_image_cache() -> Optional[ImageCache]:
+    """Process-wide image cache, or None if disabled"""
+    global _image_cache
+    if not settings.IMAGE_CACHE_ENABLED:
+        return None
+
+    with _image_cache_lock:
+        if _image_cache is None:
+            root = settings.IMAGE_CACHE_DIR or os.path.join(tempfile.gettempdir(), "soundtrack_cache", "images")
+            _image_cache = ImageCache(root, settings.IMAGE_CACHE_MAX_MB * 1024 * 1024)
+        return _image_cache
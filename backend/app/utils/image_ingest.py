@@ -0,0 +1,201 @@
+import logging
+import posixpath
+import time
+from io import BytesIO
+from typing import Dict, Optional, Tuple
+from urllib.parse import unquote
+from PIL import Image
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.utils.image_loader import get_orientation, load_image
+
+logger = logging.getLogger(__name__)
+
+# Rendition copies live in this folder next to their original
+RENDITION_DIR = "renditions"
+
+# Custom blob metadata marking a rendition, so the upload trigger skips it
+RENDITION_METADATA_KEY = "rendition"
+
+def blob_path_from_url(storage_url: str, bucket_name: str) -> str:
+    """
+    Extract the blob path from a storage URL.
+
+    URL format: https://storage.googleapis.com/bucket-name/path/to/file.jpg
+    """
+    # Split on .app/ to get the path after the bucket name
+    if ".firebasestorage.app/" in storage_url:
+        blob_path = storage_url.split(".firebasestorage.app/")[-1]
+    elif ".appspot.com/" in storage_url:
+        blob_path = storage_url.split(".appspot.com/")[-1]
+    else:
+        # Fallback: try to extract from the URL
+        blob_path = storage_url.split(f"/{bucket_name}/")[-1]
+
+    # URL decode the blob path (to handle spaces and special characters)
+    return unquote(blob_path)
+
+
+def is_rendition_path(blob_path: str) -> bool:
+    """True if the blob is a derived copy written by ingest rather than an original"""
+    return posixpath.basename(posixpath.dirname(blob_path)) == RENDITION_DIR
+
+
+def rendition_blob_path(blob_path: str, name: str) -> str:
+    """Blob path of rendition `name` for an original, e.g. a/b.webp -> a/renditions/b_thumb.jpg"""
+    directory, filename = posixpath.split(blob_path)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, RENDITION_DIR, f"{stem}_{name}.jpg")
+
+
+def encode_rendition(img: Image.Image, max_size: Tuple[int, int], quality: int) -> bytes:
+    """
+    Downscale an image to fit within max_size (never upscaling) and encode it as JPEG.
+
+    Transparency is flattened onto black, matching how the video letterboxes it.
+    """
+    if img.mode in ('RGBA', 'LA', 'P'):
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (0, 0, 0))
+        background.paste(img, mask=img.split()[-1])
+        img = background
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    if img.width > max_size[0] or img.height > max_size[1]:
+        img = img.copy()
+        img.thumbnail(max_size, Image.LANCZOS)
+
+    out = BytesIO()
+    img.save(out, format="JPEG", quality=quality, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+def build_renditions(image_bytes: bytes) -> Dict[str, bytes]:
+    """
+    Produce the ingest renditions of an uploaded image.
+
+    Returns:
+        {"thumb": ..., "working": ...} JPEG bytes. The working copy is bounded
+        by the full-quality video frame, so renders from it look the same as
+        renders from the original. It is left out when the original needs no
+        rotation and is already smaller (e.g. a compact WebP).
+    """
+    max_size = (settings.IMAGE_WORKING_MAX_WIDTH, settings.IMAGE_WORKING_MAX_HEIGHT)
+    with Image.open(BytesIO(image_bytes)) as probe:
+        oriented = get_orientation(probe) == 1
+
+    # Reduced decode, upright: the copies carry no EXIF, so the orientation is baked in
+    img = load_image(image_bytes, max_size, name="image_ingest.decode")
+    renditions = {
+        "thumb": encode_rendition(
+            img,
+            (settings.IMAGE_THUMB_MAX_EDGE, settings.IMAGE_THUMB_MAX_EDGE),
+            settings.IMAGE_THUMB_QUALITY
+        )
+    }
+    working = encode_rendition(img, max_size, settings.IMAGE_WORKING_QUALITY)
+
+    if not (oriented and len(working) >= len(image_bytes)):
+        renditions["working"] = working
+    return renditions
+
+
+def image_mime_type(image_bytes: bytes, content_type: Optional[str] = None) -> str:
+    """
+    MIME type of encoded image bytes: detected from the data, else the
+    stored content type, else image/jpeg.
+    """
+    try:
+        with Image.open(BytesIO(image_bytes)) as probe:
+            detected = Image.MIME.get(probe.format or "")
+        if detected:
+            return detected
+    except Exception:
+        pass
+    if content_type and content_type.startswith("image/"):
+        return content_type
+    return "image/jpeg"
+
+
+def prepare_for_analysis(image_bytes: bytes, content_type: Optional[str] = None) -> Tuple[bytes, str]:
+    """
+    Shrink an uploaded image for Gemini analysis.
+
+    The image is decoded upright, its long edge capped at
+    GEMINI_IMAGE_MAX_EDGE and re-encoded as JPEG. The original is sent
+    instead, with its own MIME type (see image_mime_type), when it already
+    fits and is not larger, or when it can't be decoded.
+
+    Args:
+        image_bytes: The uploaded image
+        content_type: Content type the upload was stored with, if known
+
+    Returns:
+        (image bytes, MIME type)
+    """
+    max_edge = settings.GEMINI_IMAGE_MAX_EDGE
+    started = time.time()
+    try:
+        with Image.open(BytesIO(image_bytes)) as probe:
+            source_mime = Image.MIME.get(probe.format or "") or image_mime_type(image_bytes, content_type)
+            fits = get_orientation(probe) == 1 and max(probe.size) <= max_edge
+
+        img = load_image(image_bytes, (max_edge, max_edge), name="gemini_image.decode")
+        data = encode_rendition(img, (max_edge, max_edge), settings.GEMINI_IMAGE_QUALITY)
+        if fits and len(data) >= len(image_bytes):
+            data, mime_type = image_bytes, source_mime
+        else:
+            mime_type = "image/jpeg"
+    except Exception as e:
+        metrics.incr("gemini_image.prepare_failures")
+        logger.warning(f"⚠️ Sending original image to Gemini, preprocessing failed: {str(e)}")
+        return image_bytes, image_mime_type(image_bytes, content_type)
+
+    metrics.observe("gemini_image.prepare", time.time() - started)
+    metrics.incr("gemini_image.bytes_in", len(image_bytes))
+    metrics.incr("gemini_image.bytes_out", len(data))
+    metrics.incr("gemini_image.bytes_saved", len(image_bytes) - len(data))
+    logger.info(f"🖼️  Image for Gemini: {len(image_bytes)} -> {len(data)} bytes ({mime_type})")
+    return data, mime_type
+
+
+def upload_rendition(bucket, blob_path: str, name: str, data: bytes) -> str:
+    """Upload one rendition publicly next to the original and return its URL"""
+    blob = bucket.blob(rendition_blob_path(blob_path, name))
+    blob.metadata = {RENDITION_METADATA_KEY: name}
+    blob.cache_control = "public, max-age=31536000"
+    blob.upload_from_string(data, content_type="image/jpeg", predefined_acl="publicRead")
+    return blob.public_url
+
+
+def ingest_image(image_bytes: bytes, blob_path: str, bucket) -> Dict[str, Optional[str]]:
+    """
+    Build and upload the thumbnail and working copy of an uploaded image.
+
+    Failures (or a working copy that would not be smaller) leave the URLs
+    unset; readers fall back to the original storage_url.
+
+    Returns:
+        {"thumb_url": ..., "working_url": ...}
+    """
+    urls: Dict[str, Optional[str]] = {"thumb_url": None, "working_url": None}
+    try:
+        started = time.time()
+        renditions = build_renditions(image_bytes)
+        for name, data in renditions.items():
+            urls[f"{name}_url"] = upload_rendition(bucket, blob_path, name, data)
+
+        metrics.observe("image_ingest.renditions", time.time() - started)
+        metrics.incr("image_ingest.bytes_in", len(image_bytes))
+        metrics.incr("image_ingest.bytes_out", sum(len(data) for data in renditions.values()))
+        sizes = ", ".join(f"{name} {len(data)}" for name, data in renditions.items())
+        logger.info(
+            f"🖼️  Ingest renditions for {blob_path} ({len(image_bytes)} bytes): {sizes} bytes "
+            f"in {time.time() - started:.2f}s"
+        )
+    except Exception as e:
+        metrics.incr("image_ingest.failures")
+        logger.warning(f"⚠️ Failed to create renditions for {blob_path}: {str(e)}")
+    return urls
@@ -0,0 +1,100 @@
+import logging
+import math
+import time
+from io import BytesIO
+from typing import Optional, Tuple
+from PIL import Image, ImageOps
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+EXIF_ORIENTATION = 0x0112
+
+# Orientations whose stored pixels are rotated a quarter turn from the displayed image
+QUARTER_TURNS = {5, 6, 7, 8}
+
+# Modes Image.reduce() handles; palette, bilevel and 16-bit images are converted first
+REDUCE_MODES = {"L", "LA", "La", "RGB", "RGBA", "RGBa", "RGBX", "CMYK", "YCbCr", "I", "F"}
+
+
+def get_orientation(img: Image.Image) -> int:
+    """EXIF orientation of an opened image (1 = upright)"""
+    try:
+        return img.getexif().get(EXIF_ORIENTATION, 1)
+    except Exception:
+        return 1
+
+
+def reducible(img: Image.Image) -> Image.Image:
+    """The image in a mode Image.reduce() supports, keeping any transparency"""
+    if img.mode in REDUCE_MODES:
+        return img
+    if img.mode == "1":
+        return img.convert("L")
+    if img.mode.startswith("I;16"):
+        return img.convert("I")
+    if img.mode == "PA" or "transparency" in img.info:
+        return img.convert("RGBA")
+    return img.convert("RGB")
+
+
+def fit_within(size: Tuple[int, int], max_size: Tuple[int, int]) -> Tuple[int, int]:
+    """Size of `size` scaled down to fit inside max_size, keeping the aspect ratio"""
+    scale = min(max_size[0] / size[0], max_size[1] / size[1], 1.0)
+    return max(1, math.ceil(size[0] * scale)), max(1, math.ceil(size[1] * scale))
+
+
+def load_image(data: bytes, max_size: Optional[Tuple[int, int]] = None, name: str = "image_decode") -> Image.Image:
+    """
+    Decode image bytes, upright, at little more resolution than max_size needs.
+
+    JPEGs are decoded with draft(), which lets libjpeg scale by 1/2, 1/4 or
+    1/8 in the DCT domain so the full-size bitmap is never allocated. Formats
+    that support reduce-on-load (JPEG 2000) are reduced while decoding; the
+    rest are decoded in full and shrunk by a cheap integer box reduce. EXIF
+    orientation is applied to the reduced pixels.
+
+    Args:
+        data: Encoded image
+        max_size: Bounding box (width, height) of the displayed image, or None
+            for full resolution
+        name: Metric prefix for the decode timings
+
+    Returns:
+        The loaded image. With max_size it covers the fit of the image inside
+        max_size by less than 2x per side, leaving the final (LANCZOS) resize
+        to the caller
+    """
+    started = time.perf_counter()
+    img = Image.open(BytesIO(data))
+    source_format = (img.format or "unknown").lower()
+    source_size = img.size
+    orientation = get_orientation(img)
+
+    if max_size:
+        # max_size is in display orientation; draft works on stored pixels
+        stored_max = (max_size[1], max_size[0]) if orientation in QUARTER_TURNS else max_size
+        target = fit_within(img.size, stored_max)
+        if img.format == "JPEG":
+            img.draft(img.mode if img.mode in ("RGB", "L") else None, target)
+        elif img.format == "JPEG2000":
+            img.reduce = max(0, int(math.log2(min(img.size[0] / target[0], img.size[1] / target[1]))))
+    img.load()
+
+    if orientation != 1:
+        # Rotate the (already reduced) pixels upright
+        img = ImageOps.exif_transpose(img)
+
+    if max_size:
+        # Cheap box reduce by the whole factor; callers do the final resample
+        target = fit_within(img.size, max_size)
+        factor = min(img.size[0] // target[0], img.size[1] // target[1])
+        if factor >= 2:
+            img = reducible(img).reduce(factor)
+
+    elapsed = time.perf_counter() - started
+    metrics.observe(f"{name}.{source_format}", elapsed)
+    metrics.incr(f"{name}.source_pixels", source_size[0] * source_size[1])
+    metrics.incr(f"{name}.decoded_pixels", img.size[0] * img.size[1])
+    logger.debug(f"Decoded {source_format} {source_size[0]}x{source_size[1]} -> {img.size[0]}x{img.size[1]} in {elapsed * 1000:.0f}ms")
+    return img
@@ -0,0 +1,417 @@
+import hashlib
+import logging
+import os
+import random
+import tempfile
+import threading
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from app.core.config import settings
+from app.models.montage import MontageModel
+from app.utils.audio_prep import prepare_audio_track
+from app.utils.ffmpeg_encoder import concat_segments, encode_frames
+from app.utils.file_cache import FileCache, link_or_copy
+from app.utils.frame_renderer import MOTION_EFFECTS, MontageRenderer
+from app.utils.frame_store import FrameStore
+from app.utils.segment_renderer import Segment, SegmentImages, plan_segments, render_segments
+from app.utils.video_generator import CROSSFADE_SECONDS, download_and_fit_images
+
+logger = logging.getLogger(__name__)
+
+
+class MontageBaseUnavailable(Exception):
+    """The stored montage can't be extended (its tail images could not be fetched again)"""
+
+
+_montage_locks: Dict[str, threading.Lock] = {}
+_montage_locks_lock = threading.Lock()
+
+
+def montage_lock(montage_id: str) -> threading.Lock:
+    """
+    Per-montage lock so two appends to the same day don't interleave on this
+    process. It does not reach other processes or hosts; update_montage saves
+    with a Firestore precondition to catch those.
+    """
+    with _montage_locks_lock:
+        return _montage_locks.setdefault(montage_id, threading.Lock())
+
+
+def plan_tail_segments(clip_frame_starts: List[int], n_frames: int, first_clip: int, n_segments: int) -> List[Segment]:
+    """
+    Segments covering clips first_clip..last. The last clip always gets a
+    segment of its own: it is the only one whose frames change (its fade-out
+    becomes a cut to the next clip) when more clips are appended later.
+    """
+    last_clip = len(clip_frame_starts) - 1
+    segments: List[Segment] = []
+    if first_clip < last_clip:
+        offset = clip_frame_starts[first_clip]
+        relative_starts = [start - offset for start in clip_frame_starts[first_clip:last_clip]]
+        for first, last, start_frame, stop_frame in plan_segments(
+            relative_starts, clip_frame_starts[last_clip] - offset, n_segments
+        ):
+            segments.append((first + first_clip, last + first_clip, start_frame + offset, stop_frame + offset))
+    segments.append((last_clip, last_clip, clip_frame_starts[last_clip], n_frames))
+    return segments
+
+
+_montage_cache: Optional[FileCache] = None
+_montage_cache_lock = threading.Lock()
+
+def get_montage_cache() -> FileCache:
+    """
+    Local copies of stored montage segments and music, so appends rarely
+    download them. Bounded by MONTAGE_CACHE_MAX_MB; an evicted file is simply
+    downloaded again by fetch_stored_file.
+    """
+    global _montage_cache
+    with _montage_cache_lock:
+        if _montage_cache is None:
+            root = settings.MONTAGE_CACHE_DIR or os.path.join(tempfile.gettempdir(), "soundtrack_cache", "montage_files")
+            # ffmpeg and the WAV reader detect the format from the content, not the name
+            _montage_cache = FileCache(root, settings.MONTAGE_CACHE_MAX_MB * 1024 * 1024, ".blob", "montage_cache")
+        return _montage_cache
+
+
+def montage_cache_key(blob_path: str) -> str:
+    return hashlib.sha256(blob_path.encode("utf-8")).hexdigest()
+
+
+def stored_file_path(work_dir: str, blob_path: str) -> str:
+    """Where a job's own copy of a stored montage file lives in its work_dir"""
+    return os.path.join(work_dir, "stored", *blob_path.split("/"))
+
+
+def fetch_stored_file(bucket, blob_path: str, work_dir: str) -> str:
+    """
+    Local copy of a stored montage file in work_dir: linked from the cache,
+    or downloaded (and cached) on a miss. Cache evictions by other jobs can't
+    remove it while it is in use.
+    """
+    path = stored_file_path(work_dir, blob_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    cache = get_montage_cache()
+    key = montage_cache_key(blob_path)
+    cached = cache.get(key)
+    if cached:
+        try:
+            return link_or_copy(cached, path)
+        except OSError:
+            # Evicted between get and link
+            pass
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    try:
+        bucket.blob(blob_path).download_to_filename(tmp_path)
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    cache.put(key, path)
+    return path
+
+
+def store_file(bucket, local_path: str, blob_path: str, content_type: str):
+    """Upload a montage file and keep a cached copy for the next append"""
+    bucket.blob(blob_path).upload_from_filename(local_path, content_type=content_type)
+    get_montage_cache().put(montage_cache_key(blob_path), local_path)
+
+
+def stored_blob_paths(state: Optional[Dict[str, Any]]) -> set:
+    """Segment and music blobs a montage state refers to"""
+    if not state:
+        return set()
+    paths = {segment["blob_path"] for segment in state.get("segments", [])}
+    if state.get("audio_blob"):
+        paths.add(state["audio_blob"])
+    return paths
+
+
+def delete_stored_files(bucket, blob_paths):
+    """Delete montage blobs and their local copies"""
+    for blob_path in blob_paths:
+        try:
+            bucket.blob(blob_path).delete()
+        except Exception as e:
+            logger.warning(f"⚠️ Could not delete old montage file {blob_path}: {str(e)}")
+        get_montage_cache().remove(montage_cache_key(blob_path))
+
+
+def load_montage_music(
+    state: Optional[Dict[str, Any]],
+    music_prompt: str,
+    negative_prompt: str,
+    bucket,
+    work_dir: str
+) -> Optional[str]:
+    """
+    The montage's stored music track if it was generated for the same prompts.
+
+    Returns:
+        Path of the track in work_dir, or None if new music is needed
+    """
+    if not state or not state.get("audio_blob"):
+        return None
+    if state.get("music_prompt") != music_prompt or state.get("negative_prompt") != negative_prompt:
+        return None
+    try:
+        return fetch_stored_file(bucket, state["audio_blob"], work_dir)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not load montage music {state['audio_blob']}: {str(e)}")
+        return None
+
+
+def can_append(state: Optional[Dict[str, Any]], media_ids: List[str], quality: str, profile: Dict[str, Any], duration_per_image: float) -> bool:
+    """Whether `media_ids` extends the stored montage rendered with the same settings"""
+    if not state or not state.get("segments"):
+        return False
+    rendered = state.get("media_ids", [])
+    return (
+        state.get("quality") == quality
+        and tuple(state.get("video_size") or ()) == tuple(profile["video_size"])
+        and state.get("fps") == profile["fps"]
+        and state.get("duration_per_image") == duration_per_image
+        and state.get("transition") == CROSSFADE_SECONDS
+        and len(rendered) <= len(media_ids)
+        and media_ids[:len(rendered)] == rendered
+    )
+
+
+def update_montage(
+    montage_id: str,
+    images: List[Tuple[str, str]],
+    audio_path: Optional[str],
+    output_path: str,
+    quality: str,
+    profile: Dict[str, Any],
+    work_dir: str,
+    bucket,
+    music_prompt: str = "",
+    negative_prompt: str = "",
+    duration_per_image: float = 2.0,
+    render_workers: Optional[int] = None,
+    progress_callback: Optional[Callable[[float], None]] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Render the montage for `images` ((media_id, url) pairs, in order) to
+    output_path, reusing the stored segments of an earlier render of a prefix
+    of the same list.
+
+    Only the previous last clip (its fade-out turns into a crossfade) and the
+    new clips are rendered; the stored segments before them are joined with a
+    stream-copy concat and the audio is re-muxed for the new length. Anything
+    else (different settings, reordered or removed media) renders from scratch.
+
+    Returns:
+        The montage state, or None if the render failed. The state is not
+        saved when another process updated the montage during the render
+
+    Raises:
+        EncodeCancelled: if the render was cancelled through progress_callback
+    """
+    model = MontageModel()
+    media_ids = [media_id for media_id, _ in images]
+
+    with montage_lock(montage_id):
+        state = model.get(montage_id)
+        base = state if can_append(state, media_ids, quality, profile, duration_per_image) else None
+        if state and base is None:
+            logger.info(f"🔄 Montage {montage_id} changed, rendering from scratch")
+
+        args = (montage_id, images, audio_path, output_path, quality, profile, work_dir, bucket,
+                music_prompt, negative_prompt, duration_per_image, render_workers, progress_callback)
+        try:
+            new_state = render_montage(base, *args)
+        except MontageBaseUnavailable as e:
+            logger.warning(f"⚠️ {str(e)}, rendering from scratch")
+            new_state = render_montage(None, *args)
+        if new_state is None:
+            return None
+
+        saved = model.save_if_unchanged(
+            montage_id,
+            {**new_state, "created_at": (state or {}).get("created_at") or datetime.utcnow()},
+            state
+        )
+        if not saved:
+            # Another process or host updated the montage while we rendered. The
+            # video is still valid for this job; drop the files only we stored
+            logger.warning(f"⚠️ Montage {montage_id} was updated elsewhere, not saving this render")
+            delete_stored_files(bucket, stored_blob_paths(new_state) - stored_blob_paths(state))
+            return new_state
+
+        # Drop stored files that are no longer part of the montage
+        delete_stored_files(bucket, stored_blob_paths(state) - stored_blob_paths(new_state))
+
+        logger.info(f"✅ Montage {montage_id} now has {len(new_state['media_ids'])} clips in {len(new_state['segments'])} segments")
+        return new_state
+
+
+def render_montage(
+    base: Optional[Dict[str, Any]],
+    montage_id: str,
+    images: List[Tuple[str, str]],
+    audio_path: Optional[str],
+    output_path: str,
+    quality: str,
+    profile: Dict[str, Any],
+    work_dir: str,
+    bucket,
+    music_prompt: str,
+    negative_prompt: str,
+    duration_per_image: float,
+    render_workers: Optional[int],
+    progress_callback: Optional[Callable[[float], None]]
+) -> Optional[Dict[str, Any]]:
+    """
+    One render of update_montage: extend `base` (a stored state accepted by
+    can_append) or, with base None, render every clip.
+
+    Returns:
+        The new state (not yet saved), or None if the render failed
+
+    Raises:
+        MontageBaseUnavailable: if base's tail clips could not be fetched again
+    """
+    video_size = tuple(profile["video_size"])
+    fps = profile["fps"]
+    media_ids = [media_id for media_id, _ in images]
+    urls = dict(images)
+
+    if base:
+        kept_segments = base["segments"][:-1]
+        first_clip = base["segments"][-1]["first_clip"]
+        rendered_ids = base["media_ids"]
+        effects = list(base["effects"])
+        logger.info(f"➕ Appending {len(media_ids) - len(rendered_ids)} images to montage {montage_id} "
+                    f"(re-rendering from clip {first_clip})")
+    else:
+        kept_segments = []
+        first_clip = 0
+        rendered_ids = []
+        effects = []
+
+    try:
+        kept_paths = [fetch_stored_file(bucket, segment["blob_path"], work_dir) for segment in kept_segments]
+    except Exception as e:
+        raise MontageBaseUnavailable(f"Could not load stored segments of montage {montage_id}: {str(e)}")
+
+    # Previously rendered clips from first_clip on must come back; new ones may be skipped
+    tail_ids = rendered_ids[first_clip:] + media_ids[len(rendered_ids):]
+    store = FrameStore(settings.VIDEO_FRAME_MEMORY_BUDGET_MB * 1024 * 1024, spill_dir=os.path.join(work_dir, "frames"))
+    try:
+        download_and_fit_images([urls[media_id] for media_id in tail_ids], video_size, store)
+        fetched = set(store.indices())
+        if not all(i in fetched for i in range(len(rendered_ids) - first_clip)):
+            raise MontageBaseUnavailable(f"Could not re-fetch rendered images of montage {montage_id}")
+
+        kept_ids = rendered_ids[:first_clip]
+        arrays = {}
+        for i, media_id in enumerate(tail_ids):
+            if i not in fetched:
+                logger.warning(f"⚠️ Skipping image {media_id} due to download failure")
+                continue
+            arrays[len(kept_ids)] = np.asarray(store.get(i))
+            kept_ids.append(media_id)
+            if len(effects) < len(kept_ids):
+                effects.append(random.choice(MOTION_EFFECTS))
+
+        if not kept_ids:
+            logger.error("❌ No images were downloaded successfully")
+            return None
+
+        renderer = MontageRenderer(
+            SegmentImages(len(kept_ids), arrays),
+            effects,
+            duration_per_image=duration_per_image,
+            transition=CROSSFADE_SECONDS,
+            fps=fps,
+            video_size=video_size
+        )
+
+        workers = render_workers if render_workers is not None else settings.VIDEO_RENDER_WORKERS
+        if workers <= 0:
+            workers = os.cpu_count() or 1
+        new_segments = plan_tail_segments(renderer.clip_frame_starts(), renderer.n_frames, first_clip, workers)
+        segment_paths = [os.path.join(work_dir, f"montage_segment_{i:04d}.mp4") for i in range(len(new_segments))]
+        logger.info(f"🧩 Rendering {len(new_segments)} new segments of montage {montage_id}")
+
+        ok = False
+        if workers > 1 and len(new_segments) > 1:
+            ok = render_segments(renderer, new_segments, segment_paths, workers,
+                                 preset=profile["preset"], progress_callback=progress_callback)
+            if not ok:
+                logger.warning("⚠️ Parallel segment render failed, falling back to a single encoder")
+        if not ok:
+            total = sum(stop_frame - start_frame for _, _, start_frame, stop_frame in new_segments)
+            done = 0
+            ok = True
+            for path, (_, _, start_frame, stop_frame) in zip(segment_paths, new_segments):
+                ok = encode_frames(renderer.iter_frames(start_frame, stop_frame), path, video_size,
+                                   fps=fps, preset=profile["preset"])
+                if not ok:
+                    break
+                done += stop_frame - start_frame
+                if progress_callback:
+                    progress_callback(done / total)
+        if not ok:
+            return None
+    finally:
+        store.close()
+
+    # Join stored and new segments and mux the music for the new length
+    all_paths = kept_paths + segment_paths
+    audio_codec = "aac"
+    muxed_audio = audio_path
+    if audio_path:
+        prepared = prepare_audio_track(audio_path, renderer.duration, os.path.join(work_dir, "montage_audio.m4a"))
+        if prepared:
+            muxed_audio, audio_codec = prepared, "copy"
+    if not concat_segments(all_paths, output_path, muxed_audio, renderer.duration, audio_codec=audio_codec):
+        return None
+
+    # Persist the new segments (and new music) for the next append. Blob names
+    # carry a render id and are never rewritten, so a local copy of a stored
+    # file (see fetch_stored_file) can't go stale when another host re-renders
+    prefix = f"montages/{montage_id}"
+    render_id = uuid.uuid4().hex[:12]
+    segments = list(kept_segments)
+    for path, (first, last, start_frame, stop_frame) in zip(segment_paths, new_segments):
+        blob_path = f"{prefix}/segment_{start_frame:07d}_{stop_frame:07d}_{render_id}.mp4"
+        store_file(bucket, path, blob_path, "video/mp4")
+        segments.append({
+            "first_clip": first,
+            "last_clip": last,
+            "start_frame": start_frame,
+            "stop_frame": stop_frame,
+            "blob_path": blob_path
+        })
+
+    audio_blob = None
+    if audio_path:
+        if base and base.get("audio_blob") and audio_path == stored_file_path(work_dir, base["audio_blob"]):
+            audio_blob = base["audio_blob"]
+        else:
+            audio_blob = f"{prefix}/music_{render_id}{os.path.splitext(audio_path)[1] or '.wav'}"
+            bucket.blob(audio_blob).upload_from_filename(audio_path)
+
+    return {
+        "media_ids": kept_ids,
+        "effects": effects,
+        "quality": quality,
+        "video_size": list(video_size),
+        "fps": fps,
+        "duration_per_image": duration_per_image,
+        "transition": CROSSFADE_SECONDS,
+        "segments": segments,
+        "music_prompt": music_prompt,
+        "negative_prompt": negative_prompt,
+        "audio_blob": audio_blob
+    }
@@ -1,37 +1,280 @@
 import base64
+import hashlib
 import os
 import logging
 import json
-from typing import Optional
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timezone
+from typing import BinaryIO, Callable, Dict, List, Optional
 from google.oauth2 import service_account
 import google.auth.transport.requests
-import requests
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.utils.file_cache import FileCache
+from app.utils.http_client import get_session
 
 logger = logging.getLogger(__name__)
 
-def get_google_access_token() -> str:
-    """Get Google Cloud access token using Firebase service account credentials"""
+LYRIA_MODEL = "lyria-002"
+
+# Response bytes read at a time while decoding audio
+STREAM_CHUNK_SIZE = 64 * 1024
+
+GOOGLE_SCOPES = ['https://www.googleapis.com/auth/cloud-platform']
+
+
+def load_google_credentials() -> service_account.Credentials:
+    """Load the Firebase service account credentials (not yet holding a token)"""
     # Try to get credentials from environment variable first
     firebase_creds_json = os.getenv("FIREBASE_CREDENTIALS")
 
     if firebase_creds_json:
         cred_dict = json.loads(firebase_creds_json)
-        credentials = service_account.Credentials.from_service_account_info(
-            cred_dict,
-            scopes=['https://www.googleapis.com/auth/cloud-platform']
-        )
+        return service_account.Credentials.from_service_account_info(cred_dict, scopes=GOOGLE_SCOPES)
     elif settings.FIREBASE_CREDENTIALS_PATH and os.path.exists(settings.FIREBASE_CREDENTIALS_PATH):
-        credentials = service_account.Credentials.from_service_account_file(
-            settings.FIREBASE_CREDENTIALS_PATH,
-            scopes=['https://www.googleapis.com/auth/cloud-platform']
-        )
+        return service_account.Credentials.from_service_account_file(settings.FIREBASE_CREDENTIALS_PATH, scopes=GOOGLE_SCOPES)
     else:
         raise Exception("Firebase credentials not found")
 
-    auth_req = google.auth.transport.requests.Request()
-    credentials.refresh(auth_req)
-    return credentials.token
+
+class GoogleTokenProvider:
+    """
+    Process-wide cache of the service account's OAuth access token.
+
+    Credentials are loaded once. A token with more than `refresh_ahead`
+    seconds left is returned as is; inside that window one background thread
+    refreshes it while callers keep using the current token. Only when less
+    than `min_ttl` seconds remain do callers block on the refresh. Refreshes
+    are single-flight: concurrent callers wait for the one in progress.
+    """
+
+    def __init__(self, refresh_ahead: float, min_ttl: float):
+        self.refresh_ahead = refresh_ahead
+        self.min_ttl = min_ttl
+        self._credentials: Optional[service_account.Credentials] = None
+        self._token: Optional[str] = None
+        self._expiry: float = 0.0  # Unix time
+        self._lock = threading.Lock()
+        self._background: Optional[threading.Thread] = None
+
+    def _ttl(self) -> float:
+        return self._expiry - time.time()
+
+    def _refresh(self):
+        """Fetch a new token; caller holds the lock"""
+        started = time.time()
+        if self._credentials is None:
+            self._credentials = load_google_credentials()
+        self._credentials.refresh(google.auth.transport.requests.Request(session=get_session()))
+
+        expiry = self._credentials.expiry  # Naive UTC
+        self._expiry = expiry.replace(tzinfo=timezone.utc).timestamp() if expiry else started + 3600
+        self._token = self._credentials.token
+        metrics.incr("google_token.refreshes")
+        metrics.observe("google_token.refresh", time.time() - started)
+        logger.info(f"🔑 Refreshed Google access token (valid for {self._ttl():.0f}s)")
+
+    def _refresh_in_background(self):
+        try:
+            with self._lock:
+                if self._ttl() <= self.refresh_ahead:
+                    self._refresh()
+        except Exception as e:
+            # The current token is still valid; the next caller retries
+            metrics.incr("google_token.refresh_errors")
+            logger.warning(f"⚠️ Background Google token refresh failed: {str(e)}")
+        finally:
+            self._background = None
+
+    def get_token(self) -> str:
+        """Return a valid access token, refreshing only when needed"""
+        ttl = self._ttl()
+        if self._token and ttl > self.min_ttl:
+            metrics.incr("google_token.hits")
+            if ttl <= self.refresh_ahead and self._background is None and not self._lock.locked():
+                self._background = threading.Thread(target=self._refresh_in_background, name="google-token-refresh", daemon=True)
+                self._background.start()
+            return self._token
+
+        with self._lock:
+            # Another caller may have refreshed while we waited
+            if not self._token or self._ttl() <= self.min_ttl:
+                metrics.incr("google_token.misses")
+                self._refresh()
+            return self._token
+
+
+_token_provider: Optional[GoogleTokenProvider] = None
+_token_provider_lock = threading.Lock()
+
+def get_token_provider() -> GoogleTokenProvider:
+    """Shared token provider for all Google API calls in this process"""
+    global _token_provider
+    with _token_provider_lock:
+        if _token_provider is None:
+            _token_provider = GoogleTokenProvider(
+                refresh_ahead=settings.GOOGLE_TOKEN_REFRESH_AHEAD_SECONDS,
+                min_ttl=settings.GOOGLE_TOKEN_MIN_TTL_SECONDS
+            )
+        return _token_provider
+
+
+def get_google_access_token() -> str:
+    """Get Google Cloud access token using Firebase service account credentials (cached)"""
+    return get_token_provider().get_token()
+
+class Base64FieldDecoder:
+    """
+    Decodes every "bytesBase64Encoded" string of a JSON body fed in chunks.
+
+    The body is never held whole: the decoder scans for the field name, then
+    base64-decodes its value to the output opened for that sample in
+    4-character-aligned pieces. Memory use is bounded by the chunk size.
+    """
+
+    FIELD = b'"bytesBase64Encoded"'
+
+    def __init__(self, open_output: Callable[[int], BinaryIO]):
+        self.open_output = open_output
+        self.count = 0  # Values decoded so far (including one in progress)
+        self.bytes_written = 0
+
+        self._state = "search"
+        self._pending = b""  # Tail that may be the start of FIELD
+        self._carry = b""  # Base64 characters not yet forming a full quantum
+        self._output: Optional[BinaryIO] = None
+
+    def feed(self, chunk: bytes):
+        data = self._pending + chunk if self._pending else chunk
+        self._pending = b""
+        pos = 0
+        while pos < len(data):
+            if self._state == "search":
+                found = data.find(self.FIELD, pos)
+                if found < 0:
+                    self._pending = data[max(pos, len(data) - len(self.FIELD) + 1):]
+                    return
+                pos = found + len(self.FIELD)
+                self._state = "key"
+            elif self._state == "key":
+                char = data[pos:pos + 1]
+                pos += 1
+                if char == b'"':
+                    self._output = self.open_output(self.count)
+                    self.count += 1
+                    self._state = "value"
+                elif char not in b" \t\r\n:":
+                    raise ValueError("Malformed Lyria response: bytesBase64Encoded is not a string")
+            else:
+                end = data.find(b'"', pos)
+                self._write(data[pos:] if end < 0 else data[pos:end], final=end >= 0)
+                if end < 0:
+                    return
+                pos = end + 1
+                self._output.close()
+                self._output = None
+                self._state = "search"
+
+    def _write(self, piece: bytes, final: bool):
+        # The only JSON escape base64 can contain is "\/"
+        buf = self._carry + piece.replace(b"\\", b"")
+        usable = len(buf) if final else len(buf) - len(buf) % 4
+        if usable:
+            decoded = base64.b64decode(buf[:usable])
+            self._output.write(decoded)
+            self.bytes_written += len(decoded)
+        self._carry = buf[usable:]
+
+    def close(self):
+        """Check the body ended outside a value and release any open output"""
+        if self._output is not None:
+            self._output.close()
+            self._output = None
+            raise ValueError("Lyria response ended inside an audio value")
+
+
+def stream_tracks(
+    prompt: str,
+    negative_prompt: str,
+    sample_count: int,
+    output_path_for: Callable[[int], Optional[str]]
+) -> List[str]:
+    """
+    Call the Lyria predict endpoint and decode each sample straight to disk.
+
+    The response is streamed, so neither the JSON nor the base64 strings are
+    held in memory (they are several MB per sample).
+
+    Args:
+        output_path_for: Maps a sample index to its file path; None discards
+            that sample
+
+    Returns:
+        Paths of the saved samples
+
+    Raises:
+        requests.HTTPError: if the API call fails
+    """
+    # Get access token
+    access_token = get_google_access_token()
+
+    # Lyria API endpoint
+    project_id = settings.FIREBASE_PROJECT_ID
+    api_endpoint = f"https://us-central1-aiplatform.googleapis.com/v1/projects/{project_id}/locations/us-central1/publishers/google/models/{LYRIA_MODEL}:predict"
+
+    # Prepare request
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json",
+    }
+
+    data = {
+        "instances": [{
+            "prompt": prompt,
+            "negative_prompt": negative_prompt,
+            "sample_count": sample_count
+        }],
+        "parameters": {}
+    }
+
+    logger.info(f"🎵 Generating {sample_count} track(s) with Lyria API: '{prompt}'")
+
+    paths: List[str] = []
+
+    def open_output(index: int) -> BinaryIO:
+        path = output_path_for(index)
+        if path is None:
+            return open(os.devnull, "wb")
+        paths.append(path)
+        return open(path, "wb")
+
+    # Make API request
+    started = time.time()
+    decoder = Base64FieldDecoder(open_output)
+    try:
+        timeout = (settings.HTTP_CONNECT_TIMEOUT, settings.LYRIA_READ_TIMEOUT)
+        with get_session().post(api_endpoint, headers=headers, json=data, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                decoder.feed(chunk)
+        decoder.close()
+    except Exception:
+        # Don't leave partial tracks behind
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        raise
+
+    metrics.observe("lyria.predict", time.time() - started)
+    metrics.incr("lyria.audio_bytes", decoder.bytes_written)
+    return paths
+
 
 def generate_music(prompt: str, negative_prompt: str = "", sample_count: int = 1, output_path: str = None) -> Optional[str]:
     """
@@ -40,70 +283,164 @@ def generate_music(prompt: str, negative_prompt: str = "", sample_count: int = 1
     Args:
         prompt: Music generation prompt
         negative_prompt: What to avoid in the music
-        sample_count: Number of samples to generate (we'll use the first one)
+        sample_count: Number of samples to generate (we'll use the first one;
+            use generate_music_samples to keep them all)
         output_path: Path to save the generated audio file
 
     Returns:
         Path to the generated audio file or None if failed
     """
+    def output_path_for(index: int) -> Optional[str]:
+        if index > 0:
+            return None
+        if output_path:
+            return output_path
+        # Unique path by default so concurrent calls don't collide
+        fd, path = tempfile.mkstemp(prefix="lyria_", suffix=".wav")
+        os.close(fd)
+        return path
+
     try:
-        # Get access token
-        access_token = get_google_access_token()
-
-        # Lyria API endpoint
-        project_id = settings.FIREBASE_PROJECT_ID
-        api_endpoint = f"https://us-central1-aiplatform.googleapis.com/v1/projects/{project_id}/locations/us-central1/publishers/google/models/lyria-002:predict"
-
-        # Prepare request
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json",
-        }
-
-        data = {
-            "instances": [{
-                "prompt": prompt,
-                "negative_prompt": negative_prompt,
-                "sample_count": sample_count
-            }],
-            "parameters": {}
-        }
-
-        logger.info(f"🎵 Generating music with Lyria API: '{prompt}'")
-
-        # Make API request
-        response = requests.post(api_endpoint, headers=headers, json=data)
-        response.raise_for_status()
-        result = response.json()
-
-        # Extract audio from response
-        predictions = result.get("predictions", [])
-        if not predictions:
-            logger.error("❌ No predictions returned from Lyria API")
+        paths = stream_tracks(prompt, negative_prompt, sample_count, output_path_for)
+        if not paths:
+            logger.error("❌ No audio returned from Lyria API")
             return None
 
-        # Get first prediction
-        first_prediction = predictions[0]
-        bytes_b64 = first_prediction.get("bytesBase64Encoded")
+        logger.info(f"✅ Music generated and saved to: {paths[0]}")
+        return paths[0]
 
-        if not bytes_b64:
-            logger.error("❌ No audio bytes in Lyria response")
-            return None
+    except Exception as e:
+        logger.error(f"❌ Failed to generate music with Lyria: {str(e)}")
+        return None
 
-        # Decode audio
-        decoded_audio_data = base64.b64decode(bytes_b64)
 
-        # Save to file
-        if not output_path:
-            os.makedirs("temp_audio", exist_ok=True)
-            output_path = os.path.join("temp_audio", "generated_music.wav")
+def generate_music_samples(prompt: str, negative_prompt: str = "", sample_count: int = 1, output_dir: str = None) -> List[str]:
+    """
+    Generate several tracks in one Lyria request and keep every one of them.
 
-        with open(output_path, "wb") as f:
-            f.write(decoded_audio_data)
+    Returns:
+        Paths of the saved tracks in output_dir (empty if the request failed)
+    """
+    def output_path_for(index: int) -> str:
+        fd, path = tempfile.mkstemp(prefix="lyria_", suffix=".wav", dir=output_dir)
+        os.close(fd)
+        return path
 
-        logger.info(f"✅ Music generated and saved to: {output_path}")
-        return output_path
+    try:
+        paths = stream_tracks(prompt, negative_prompt, sample_count, output_path_for)
+        metrics.incr("lyria.samples", len(paths))
+        logger.info(f"✅ Generated {len(paths)} of {sample_count} requested tracks")
+        return paths
 
     except Exception as e:
         logger.error(f"❌ Failed to generate music with Lyria: {str(e)}")
+        return []
+
+
+_music_cache: Optional[FileCache] = None
+_music_cache_lock = threading.Lock()
+
+def get_music_cache() -> Optional[FileCache]:
+    """Process-wide cache of generated tracks, or None if disabled"""
+    global _music_cache
+    if not settings.MUSIC_CACHE_ENABLED:
         return None
+
+    with _music_cache_lock:
+        if _music_cache is None:
+            root = settings.MUSIC_CACHE_DIR or os.path.join(tempfile.gettempdir(), "soundtrack_cache", "music")
+            ttl = settings.MUSIC_CACHE_TTL_HOURS * 3600 or None
+            _music_cache = FileCache(root, settings.MUSIC_CACHE_MAX_MB * 1024 * 1024, ".wav", "music_cache", ttl=ttl)
+        return _music_cache
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Case- and whitespace-insensitive form of a prompt"""
+    return " ".join((prompt or "").lower().split())
+
+
+def music_cache_key(prompt: str, negative_prompt: str = "") -> str:
+    """Cache key of the track generated for a (prompt, negative_prompt) pair"""
+    raw_key = json.dumps([LYRIA_MODEL, normalize_prompt(prompt), normalize_prompt(negative_prompt)])
+    return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+
+def cache_music(prompt: str, negative_prompt: str, audio_path: str) -> bool:
+    """
+    Add a generated track to the music cache unless the prompt already has one.
+
+    Returns:
+        True if the track was cached
+    """
+    cache = get_music_cache()
+    if not cache:
+        return False
+    key = music_cache_key(prompt, negative_prompt)
+    try:
+        if not cache.get(key):
+            cache.put(key, audio_path)
+            return True
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to cache generated music: {str(e)}")
+    return False
+
+
+# One lock per prompt key being generated, so concurrent jobs with the same prompt
+# call Lyria once. Entries are reference counted and dropped by the last holder,
+# since prompts are free-form text
+_inflight: Dict[str, list] = {}  # Key -> [lock, holders and waiters]
+_inflight_lock = threading.Lock()
+
+
+@contextmanager
+def _prompt_lock(key: str):
+    with _inflight_lock:
+        entry = _inflight.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _inflight_lock:
+            entry[1] -= 1
+            if not entry[1]:
+                del _inflight[key]
+
+def get_music(prompt: str, negative_prompt: str = "", output_path: str = None, force_refresh: bool = False) -> Optional[str]:
+    """
+    Music for a prompt, from the cache when the same prompt was generated before.
+
+    Args:
+        prompt: Music generation prompt
+        negative_prompt: What to avoid in the music
+        output_path: Path to write the track to (a copy when served from cache)
+        force_refresh: Generate a new track even if one is cached, replacing it
+
+    Returns:
+        Path to the audio file or None if generation failed
+    """
+    cache = get_music_cache()
+    if not cache:
+        return generate_music(prompt, negative_prompt, sample_count=1, output_path=output_path)
+
+    key = music_cache_key(prompt, negative_prompt)
+    with _prompt_lock(key):
+        cached = None if force_refresh else cache.get(key)
+        if cached:
+            if not output_path:
+                fd, output_path = tempfile.mkstemp(prefix="lyria_", suffix=".wav")
+                os.close(fd)
+            # Copy so eviction can't remove the track while a job is using it
+            shutil.copyfile(cached, output_path)
+            logger.info(f"🎵 Reusing cached music for '{prompt}'")
+            return output_path
+
+        if force_refresh:
+            metrics.incr("music_cache.forced_refreshes")
+        audio_path = generate_music(prompt, negative_prompt, sample_count=1, output_path=output_path)
+        if audio_path:
+            try:
+                cache.put(key, audio_path)
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to cache generated music: {str(e)}")
+    return audio_path
@@ -0,0 +1,190 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.utils.lyria import cache_music, generate_music_samples, music_cache_key
+
+logger = logging.getLogger(__name__)
+
+# Tracks are generated here and moved into a bucket only once complete
+INCOMING_DIR = ".incoming"
+
+
+class MusicPool:
+    """
+    Ready-made Lyria tracks for a fixed set of prompts (mood presets), so
+    video jobs using them don't wait on generation.
+
+    Each prompt bucket is a directory of unused tracks. Taking a track moves
+    it out of the pool; once fewer than `refill_below` are left, a background
+    refill asks Lyria for up to `batch` samples in one request and keeps all
+    of them. Other prompts are never pooled. Buckets live on disk, so a
+    restart keeps the tracks already generated.
+    """
+
+    def __init__(self, root: str, size: int, batch: int, refill_below: int, prompts: List[Tuple[str, str]]):
+        self.root = root
+        self.size = size
+        self.batch = batch
+        self.refill_below = min(max(1, refill_below), size)
+
+        self._lock = threading.Lock()
+        # Bucket key -> (prompt, negative_prompt), only the allow-listed prompts
+        self._prompts: Dict[str, Tuple[str, str]] = {
+            music_cache_key(prompt, negative_prompt): (prompt, negative_prompt)
+            for prompt, negative_prompt in prompts
+        }
+        self._refilling: Set[str] = set()
+        # One refill at a time keeps the background load on Lyria bounded
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="music-pool")
+        os.makedirs(os.path.join(root, INCOMING_DIR), exist_ok=True)
+        for key in self._prompts:
+            os.makedirs(self._bucket_dir(key), exist_ok=True)
+
+    def _bucket_dir(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def _ready(self, key: str) -> List[str]:
+        """Unused tracks of a bucket, oldest first"""
+        bucket_dir = self._bucket_dir(key)
+        tracks = []
+        try:
+            for name in os.listdir(bucket_dir):
+                if name.endswith(".wav"):
+                    path = os.path.join(bucket_dir, name)
+                    tracks.append((os.path.getmtime(path), path))
+        except FileNotFoundError:
+            # Bucket removed, or a track taken by another process meanwhile
+            pass
+        return [path for _, path in sorted(tracks)]
+
+    def take(self, prompt: str, negative_prompt: str, output_path: str) -> Optional[str]:
+        """
+        Move a ready track for the prompt to output_path.
+
+        An empty bucket is not refilled here: the caller is about to generate
+        the job's track in the foreground, and calls refill() afterwards.
+
+        Returns:
+            output_path, or None if the prompt isn't pooled or has no track ready
+        """
+        key = music_cache_key(prompt, negative_prompt)
+        if key not in self._prompts:
+            return None
+
+        taken = None
+        with self._lock:
+            tracks = self._ready(key)
+            for track in tracks:
+                try:
+                    shutil.move(track, output_path)
+                    taken = track
+                    break
+                except FileNotFoundError:
+                    # Taken by another worker process sharing the pool directory
+                    continue
+
+        if not taken:
+            metrics.incr("music_pool.misses")
+            return None
+
+        metrics.incr("music_pool.hits")
+        logger.info(f"🎵 Took pooled track for '{prompt}' ({len(tracks) - 1} left)")
+        self.refill(prompt, negative_prompt)
+        return output_path
+
+    def refill(self, prompt: str, negative_prompt: str = ""):
+        """Schedule a background refill of a pooled prompt's bucket once it runs low"""
+        key = music_cache_key(prompt, negative_prompt)
+        if key not in self._prompts:
+            return
+        with self._lock:
+            if key in self._refilling or len(self._ready(key)) >= self.refill_below:
+                return
+            self._refilling.add(key)
+        self._executor.submit(self._refill, key, prompt, negative_prompt)
+
+    def _refill(self, key: str, prompt: str, negative_prompt: str):
+        try:
+            while True:
+                missing = self.size - len(self._ready(key))
+                if missing <= 0:
+                    break
+                paths = generate_music_samples(
+                    prompt,
+                    negative_prompt,
+                    sample_count=min(missing, self.batch),
+                    output_dir=os.path.join(self.root, INCOMING_DIR)
+                )
+                if not paths:
+                    # Retried on the next take
+                    metrics.incr("music_pool.refill_errors")
+                    break
+                # Seed the get_music cache if it has nothing for this prompt, with a
+                # sample kept out of the pool so no two jobs get the same track
+                if cache_music(prompt, negative_prompt, paths[0]):
+                    os.remove(paths.pop(0))
+                for path in paths:
+                    os.replace(path, os.path.join(self._bucket_dir(key), os.path.basename(path)))
+                metrics.incr("music_pool.tracks_generated", len(paths))
+                logger.info(f"🎵 Music pool for '{prompt}' now has {len(self._ready(key))}/{self.size} tracks")
+        except Exception as e:
+            metrics.incr("music_pool.refill_errors")
+            logger.error(f"❌ Music pool refill failed for '{prompt}': {str(e)}")
+        finally:
+            with self._lock:
+                self._refilling.discard(key)
+
+    def warm(self):
+        """
+        Refill every pooled prompt that is running low, and drop leftovers:
+        buckets of prompts no longer pooled and partial tracks in .incoming
+        """
+        for name in os.listdir(self.root):
+            if name != INCOMING_DIR and name not in self._prompts:
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+        # Partial tracks left by a refill interrupted by the last shutdown
+        incoming_dir = os.path.join(self.root, INCOMING_DIR)
+        for name in os.listdir(incoming_dir):
+            try:
+                os.remove(os.path.join(incoming_dir, name))
+            except OSError:
+                pass
+
+        for prompt, negative_prompt in list(self._prompts.values()):
+            self.refill(prompt, negative_prompt)
+
+
+_music_pool: Optional[MusicPool] = None
+_music_pool_lock = threading.Lock()
+
+def get_music_pool() -> Optional[MusicPool]:
+    """Process-wide music pool, or None if disabled"""
+    global _music_pool
+    if not settings.MUSIC_POOL_ENABLED:
+        return None
+
+    with _music_pool_lock:
+        if _music_pool is None:
+            root = settings.MUSIC_POOL_DIR or os.path.join(tempfile.gettempdir(), "soundtrack_cache", "music_pool")
+            _music_pool = MusicPool(
+                root,
+                settings.MUSIC_POOL_SIZE,
+                settings.MUSIC_POOL_BATCH,
+                settings.MUSIC_POOL_REFILL_BELOW,
+                [(prompt, "") for prompt in settings.get_music_pool_prompts()]
+            )
+        return _music_pool
+
+
+def start_music_pool():
+    """Fill the pool for the configured prompts"""
+    pool = get_music_pool()
+    if pool:
+        pool.warm()
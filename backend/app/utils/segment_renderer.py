@@ -0,0 +1,237 @@
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
+from PIL import Image
+import numpy as np
+from app.utils.frame_renderer import MontageRenderer
+from app.utils.ffmpeg_encoder import EncodeTarget, encode_frames, concat_segments
+
+logger = logging.getLogger(__name__)
+
+# (first clip, last clip, start frame, stop frame) of one segment
+Segment = Tuple[int, int, int, int]
+
+
+class SegmentImages:
+    """
+    Sparse stand-in for the full image list inside a segment worker.
+
+    Only the clips a segment draws are shipped to its process, but the
+    renderer still sees the full clip count so clip timing and the first-clip
+    fade-in are computed exactly as in a single-process render.
+    """
+
+    def __init__(self, total: int, arrays: Dict[int, np.ndarray]):
+        self.total = total
+        self.arrays = arrays
+
+    def __len__(self) -> int:
+        return self.total
+
+    def __getitem__(self, index: int) -> Image.Image:
+        return Image.fromarray(self.arrays[index])
+
+
+def plan_segments(clip_frame_starts: List[int], n_frames: int, n_segments: int) -> List[Segment]:
+    """
+    Split the timeline into up to n_segments runs of whole clips with roughly
+    equal frame counts. Boundaries fall on the frame where the incoming clip
+    is first drawn on top, so each 0.8 s overlap belongs to exactly one segment.
+    """
+    n_clips = len(clip_frame_starts)
+    n_segments = max(1, min(n_segments, n_clips))
+    target = n_frames / n_segments
+
+    segments: List[Segment] = []
+    first_clip = 0
+    for clip in range(n_clips):
+        start_frame = clip_frame_starts[first_clip]
+        stop_frame = clip_frame_starts[clip + 1] if clip + 1 < n_clips else n_frames
+        is_last = clip == n_clips - 1
+        if is_last or (len(segments) < n_segments - 1 and stop_frame - start_frame >= target):
+            if stop_frame > start_frame:
+                segments.append((first_clip, clip, start_frame, stop_frame))
+            first_clip = clip + 1
+    return segments
+
+
+def render_segment(
+    segment_path: str,
+    segment: Segment,
+    arrays: Dict[int, np.ndarray],
+    effects: List[str],
+    duration_per_image: float,
+    transition: float,
+    fps: int,
+    video_size: tuple,
+    preset: str,
+    renditions: Optional[List[EncodeTarget]] = None
+) -> bool:
+    """Process-pool worker: render and encode one segment (video only) in every rendition"""
+    first_clip, last_clip, start_frame, stop_frame = segment
+    renderer = MontageRenderer(
+        SegmentImages(len(effects), arrays),
+        effects,
+        duration_per_image=duration_per_image,
+        transition=transition,
+        fps=fps,
+        video_size=video_size
+    )
+    return encode_frames(
+        renderer.iter_frames(start_frame, stop_frame),
+        segment_path,
+        video_size,
+        fps=fps,
+        preset=preset,
+        renditions=renditions
+    )
+
+
+def render_segments(
+    renderer: MontageRenderer,
+    segments: List[Segment],
+    segment_paths: List[str],
+    workers: int,
+    preset: str = "medium",
+    progress_callback: Optional[Callable[[float], None]] = None,
+    renditions: Optional[List[EncodeTarget]] = None,
+    rendition_paths: Optional[List[List[str]]] = None
+) -> bool:
+    """
+    Render and encode `segments` of the montage (video only) to segment_paths
+    on a process pool. rendition_paths[r][i] receives segment i of rendition r.
+    At most `workers` segments are in flight, which bounds the source images
+    copied out of the frame store.
+
+    Returns:
+        True if every segment was encoded, False otherwise (including a
+        worker that crashed or raised)
+    """
+    renditions = list(renditions or [])
+    rendition_paths = rendition_paths or []
+    total_frames = sum(stop_frame - start_frame for _, _, start_frame, stop_frame in segments)
+
+    # Spawn (not fork) so workers don't inherit the server's threads and locks
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        def submit(i: int):
+            # Images are read from the frame store only when their segment is
+            # submitted, so at most `workers` segments' images are held at once
+            segment = segments[i]
+            first_clip, last_clip = segment[0], segment[1]
+            arrays = {
+                clip: np.asarray(renderer.images[clip])
+                for clip in range(first_clip, last_clip + 1)
+            }
+            return pool.submit(
+                render_segment,
+                segment_paths[i],
+                segment,
+                arrays,
+                renderer.effects,
+                renderer.duration_per_image,
+                renderer.transition,
+                renderer.fps,
+                renderer.video_size,
+                preset,
+                [target.with_path(paths[i]) for target, paths in zip(renditions, rendition_paths)]
+            )
+
+        futures = {}
+        next_segment = 0
+        frames_done = 0
+        ok = True
+        try:
+            while ok and (futures or next_segment < len(segments)):
+                while next_segment < len(segments) and len(futures) < workers:
+                    futures[submit(next_segment)] = segments[next_segment]
+                    next_segment += 1
+
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    first_clip, last_clip, start_frame, stop_frame = futures.pop(future)
+                    try:
+                        rendered = future.result()
+                    except Exception as e:
+                        logger.error(f"❌ Segment worker for frames {start_frame}-{stop_frame} failed: {str(e)}")
+                        rendered = False
+                    if not rendered:
+                        # The caller re-renders with a single encoder; stop submitting
+                        ok = False
+                        continue
+                    frames_done += stop_frame - start_frame
+                    if progress_callback:
+                        progress_callback(frames_done / total_frames)
+        except BaseException:
+            # Don't wait for queued segments of a cancelled or failed render
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    if not ok:
+        logger.error("❌ One or more segments failed to render")
+    return ok
+
+
+def render_parallel(
+    renderer: MontageRenderer,
+    output_path: str,
+    audio_path: Optional[str],
+    work_dir: str,
+    workers: int,
+    preset: str = "medium",
+    segments: Optional[List[Segment]] = None,
+    progress_callback: Optional[Callable[[float], None]] = None,
+    renditions: Optional[List[EncodeTarget]] = None,
+    audio_codec: str = "aac"
+) -> bool:
+    """
+    Render the montage as independent segments on a process pool, then join
+    them with a stream-copy concat and mux the audio. Each segment is encoded
+    in every rendition by its worker, and each rendition is joined separately.
+
+    Returns:
+        True if successful, False otherwise
+    """
+    if segments is None:
+        segments = plan_segments(renderer.clip_frame_starts(), renderer.n_frames, workers)
+    logger.info(f"🧩 Rendering {len(segments)} segments on {workers} processes")
+
+    started = time.time()
+    renditions = list(renditions or [])
+    segment_paths = [os.path.join(work_dir, f"segment_{i:04d}.mp4") for i in range(len(segments))]
+    # rendition_paths[r][i]: segment i of rendition r
+    rendition_paths = [
+        [os.path.join(work_dir, f"segment_{i:04d}_r{r}.mp4") for i in range(len(segments))]
+        for r in range(len(renditions))
+    ]
+
+    try:
+        if not render_segments(
+            renderer,
+            segments,
+            segment_paths,
+            workers,
+            preset=preset,
+            progress_callback=progress_callback,
+            renditions=renditions,
+            rendition_paths=rendition_paths
+        ):
+            return False
+
+        logger.info(f"✅ Segments rendered in {time.time() - started:.1f}s, joining...")
+        if not concat_segments(segment_paths, output_path, audio_path, renderer.duration, audio_codec=audio_codec):
+            return False
+        for target, paths in zip(renditions, rendition_paths):
+            if not concat_segments(paths, target.path, audio_path, renderer.duration, audio_codec=audio_codec):
+                return False
+        return True
+
+    finally:
+        for path in segment_paths + [path for paths in rendition_paths for path in paths]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
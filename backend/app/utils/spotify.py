@@ -1,19 +1,34 @@
-import requests
+import asyncio
 import base64
-from typing import Optional, Dict, Any
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Optional, Dict, Any, List, Tuple
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.utils.http_client import get_async_client, get_session
+from app.utils.track_catalog import get_track_catalog
+from app.utils.ttl_cache import MemoryStore, SQLiteStore, TTLCache
 import logging
 
 logger = logging.getLogger(__name__)
 
-def get_spotify_token() -> Optional[str]:
+SEARCH_URL = "https://api.spotify.com/v1/search"
+
+def request_spotify_token() -> Tuple[str, float]:
     """
-    Get Spotify access token using client credentials flow.
-    Returns the bearer token or None if failed.
+    Request a new access token using client credentials flow.
+
+    Returns:
+        The bearer token and its lifetime in seconds
+
+    Raises:
+        Exception: if credentials are missing or the request fails
     """
     if not settings.SPOTIFY_CLIENT_ID or not settings.SPOTIFY_CLIENT_SECRET:
-        logger.error("Spotify credentials not configured")
-        return None
+        raise Exception("Spotify credentials not configured")
 
     # Encode client credentials
     auth_str = f"{settings.SPOTIFY_CLIENT_ID}:{settings.SPOTIFY_CLIENT_SECRET}"
@@ -30,65 +45,384 @@ def get_spotify_token() -> Optional[str]:
         "grant_type": "client_credentials"
     }
 
+    response = get_session().post(url, headers=headers, data=data)
+    response.raise_for_status()
+    token_data = response.json()
+    return token_data["access_token"], float(token_data.get("expires_in", 3600))
+
+
+class SpotifyTokenManager:
+    """
+    Process-wide cache of the client-credentials bearer token.
+
+    The token is reused until `refresh_margin` seconds before it expires
+    (from `expires_in`). Refreshes are single-flight: concurrent callers wait
+    for the one in progress instead of each requesting a token. A token the
+    API rejects is invalidated so the next call fetches a new one.
+    """
+
+    def __init__(self, refresh_margin: float):
+        self.refresh_margin = refresh_margin
+        self._token: Optional[str] = None
+        self._expiry: float = 0.0  # Unix time
+        self._lock = threading.Lock()
+
+    def _valid(self) -> bool:
+        return self._token is not None and self._expiry - time.time() > self.refresh_margin
+
+    def get_token(self) -> Optional[str]:
+        """Return a valid bearer token, or None if one can't be obtained"""
+        if self._valid():
+            metrics.incr("spotify_token.hits")
+            return self._token
+
+        with self._lock:
+            # Another caller may have refreshed while we waited
+            if self._valid():
+                return self._token
+            try:
+                started = time.time()
+                token, expires_in = request_spotify_token()
+                self._token, self._expiry = token, started + expires_in
+                metrics.incr("spotify_token.refreshes")
+                metrics.observe("spotify_token.refresh", time.time() - started)
+                logger.info(f"🔑 Refreshed Spotify token (valid for {expires_in:.0f}s)")
+                return token
+            except Exception as e:
+                metrics.incr("spotify_token.refresh_errors")
+                logger.error(f"Failed to get Spotify token: {str(e)}")
+                return None
+
+    def invalidate(self, token: str):
+        """Drop `token` (e.g. after a 401) unless it was already replaced"""
+        with self._lock:
+            if self._token == token:
+                self._token = None
+                self._expiry = 0.0
+                metrics.incr("spotify_token.invalidations")
+
+
+_token_manager: Optional[SpotifyTokenManager] = None
+_token_manager_lock = threading.Lock()
+
+def get_token_manager() -> SpotifyTokenManager:
+    """Shared token manager for all Spotify calls in this process"""
+    global _token_manager
+    with _token_manager_lock:
+        if _token_manager is None:
+            _token_manager = SpotifyTokenManager(settings.SPOTIFY_TOKEN_REFRESH_MARGIN_SECONDS)
+        return _token_manager
+
+
+def get_spotify_token() -> Optional[str]:
+    """
+    Get Spotify access token using client credentials flow (cached).
+    Returns the bearer token or None if failed.
+    """
+    return get_token_manager().get_token()
+
+_search_cache: Optional[TTLCache] = None
+_search_cache_lock = threading.Lock()
+
+def get_search_cache() -> Optional[TTLCache]:
+    """Process-wide cache of track searches, or None if disabled"""
+    global _search_cache
+    backend = settings.SPOTIFY_SEARCH_CACHE_BACKEND
+    if backend == "none":
+        return None
+
+    with _search_cache_lock:
+        if _search_cache is None:
+            max_entries = settings.SPOTIFY_SEARCH_CACHE_MAX_ENTRIES
+            if backend == "disk":
+                path = settings.SPOTIFY_SEARCH_CACHE_PATH or os.path.join(tempfile.gettempdir(), "soundtrack_cache", "spotify_search.sqlite3")
+                store = SQLiteStore(path, max_entries)
+            else:
+                store = MemoryStore(max_entries)
+            _search_cache = TTLCache(
+                store,
+                ttl=settings.SPOTIFY_SEARCH_CACHE_TTL_HOURS * 3600,
+                negative_ttl=settings.SPOTIFY_SEARCH_CACHE_NEGATIVE_TTL_MINUTES * 60,
+                name="spotify_search_cache"
+            )
+        return _search_cache
+
+
+# "feat. X", "(ft. X)", "featuring X" through the end of the string
+_FEATURING = re.compile(r"\s*[\(\[]?\b(feat\b\.?|ft\.|featuring\b).*$")
+_APOSTROPHES = re.compile(r"['\u2019]")
+_PUNCTUATION = re.compile(r"[^\w\s]|_")
+
+def normalize_search_text(text: str) -> str:
+    """Case-folded song or artist name without punctuation or featured artists"""
+    text = (text or "").casefold()
+    # Keep names that start with "feat" (e.g. "Featuring Artist") whole
+    text = _FEATURING.sub("", text) or text
+    text = _APOSTROPHES.sub("", text)
+    return " ".join(_PUNCTUATION.sub(" ", text).split())
+
+
+def search_cache_key(song_name: str, artist_name: str) -> str:
+    return f"{normalize_search_text(song_name)}|{normalize_search_text(artist_name)}"
+
+
+def catalog_lookup(song_name: str, artist_name: str) -> Optional[Dict[str, Any]]:
+    """Track this song and artist resolved to before, from the local catalog"""
+    catalog = get_track_catalog()
+    if not catalog:
+        return None
     try:
-        response = requests.post(url, headers=headers, data=data)
-        response.raise_for_status()
-        token_data = response.json()
-        return token_data.get("access_token")
+        return catalog.lookup(search_cache_key(song_name, artist_name))
     except Exception as e:
-        logger.error(f"Failed to get Spotify token: {str(e)}")
+        logger.warning(f"⚠️ Track catalog read failed: {str(e)}")
         return None
 
+
+def catalog_record(key: str, result: Optional[Dict[str, Any]]):
+    """Add a resolved track to the local catalog"""
+    catalog = get_track_catalog()
+    if not catalog or not result:
+        return
+    try:
+        catalog.record(key, result)
+    except Exception as e:
+        logger.warning(f"⚠️ Track catalog write failed: {str(e)}")
+
+
 def search_track(song_name: str, artist_name: str) -> Optional[Dict[str, Any]]:
     """
     Search for a track on Spotify.
     Returns track data including name, artist, and embed link.
+
+    Results (including "not found") are cached by normalized song and artist
+    name; failed requests are not cached.
     """
-    token = get_spotify_token()
-    if not token:
+    cache = get_search_cache()
+    key = search_cache_key(song_name, artist_name)
+    if cache:
+        found, cached = cache.get(key)
+        if found:
+            logger.info(f"✅ Spotify search cache hit for: {song_name} by {artist_name}")
+            return dict(cached) if cached else None
+
+    try:
+        result = fetch_track(song_name, artist_name)
+    except Exception as e:
+        logger.error(f"Failed to search Spotify track: {str(e)}")
+        return None
+
+    if cache:
+        cache.set(key, result)
+    catalog_record(key, result)
+    return result
+
+
+async def search_track_async(song_name: str, artist_name: str) -> Optional[Dict[str, Any]]:
+    """search_track for async endpoints: same cache, non-blocking request"""
+    cache = get_search_cache()
+    key = search_cache_key(song_name, artist_name)
+    if cache:
+        found, cached = cache.get(key)
+        if found:
+            logger.info(f"✅ Spotify search cache hit for: {song_name} by {artist_name}")
+            return dict(cached) if cached else None
+
+    try:
+        result = await fetch_track_async(song_name, artist_name)
+    except Exception as e:
+        logger.error(f"Failed to search Spotify track: {str(e)}")
         return None
 
+    if cache:
+        cache.set(key, result)
+    catalog_record(key, result)
+    return result
+
+
+def build_search_params(song_name: str, artist_name: str) -> Dict[str, Any]:
+    """Query parameters of the track search"""
     # Build search query
     query = f"track:{song_name} artist:{artist_name}"
-
-    # Search for track
-    url = "https://api.spotify.com/v1/search"
-    headers = {
-        "Authorization": f"Bearer {token}"
-    }
-    params = {
+    return {
         "q": query,
         "type": "track",
         "limit": 1
     }
 
-    try:
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()
-        data = response.json()
-
-        tracks = data.get("tracks", {}).get("items", [])
-        if not tracks:
-            logger.warning(f"No Spotify track found for: {song_name} by {artist_name}")
-            return None
-
-        track = tracks[0]
-
-        # Extract track info
-        track_id = track.get("id")
-        track_name = track.get("name")
-        track_artists = ", ".join([artist.get("name") for artist in track.get("artists", [])])
-        embed_url = f"https://open.spotify.com/embed/track/{track_id}"
-
-        logger.info(f"✅ Found Spotify track: {track_name} by {track_artists}")
-
-        return {
-            "song": track_name,
-            "song_artist": track_artists,
-            "embed": embed_url,
-            "spotify_id": track_id
-        }
 
-    except Exception as e:
-        logger.error(f"Failed to search Spotify track: {str(e)}")
+def parse_search_result(data: Dict[str, Any], song_name: str, artist_name: str) -> Optional[Dict[str, Any]]:
+    """Track data of the first search hit, or None if there is none"""
+    tracks = data.get("tracks", {}).get("items", [])
+    if not tracks:
+        logger.warning(f"No Spotify track found for: {song_name} by {artist_name}")
         return None
+
+    track = tracks[0]
+
+    # Extract track info
+    track_id = track.get("id")
+    track_name = track.get("name")
+    track_artists = ", ".join([artist.get("name") for artist in track.get("artists", [])])
+    embed_url = f"https://open.spotify.com/embed/track/{track_id}"
+
+    logger.info(f"✅ Found Spotify track: {track_name} by {track_artists}")
+
+    return {
+        "song": track_name,
+        "song_artist": track_artists,
+        "embed": embed_url,
+        "spotify_id": track_id
+    }
+
+
+def fetch_track(song_name: str, artist_name: str) -> Optional[Dict[str, Any]]:
+    """
+    Query the Spotify search API for a track.
+
+    Returns:
+        The track data, or None if Spotify has no match
+
+    Raises:
+        Exception: if no token is available or the request fails
+    """
+    token_manager = get_token_manager()
+    params = build_search_params(song_name, artist_name)
+
+    # A rejected (revoked or expired) token is replaced and the search retried once
+    for attempt in range(2):
+        token = token_manager.get_token()
+        if not token:
+            raise Exception("No Spotify access token")
+        headers = {
+            "Authorization": f"Bearer {token}"
+        }
+        response = get_session().get(SEARCH_URL, headers=headers, params=params)
+        if response.status_code != 401 or attempt:
+            break
+        logger.warning("⚠️ Spotify rejected the cached token, refreshing")
+        token_manager.invalidate(token)
+
+    response.raise_for_status()
+    return parse_search_result(response.json(), song_name, artist_name)
+
+
+async def fetch_track_async(song_name: str, artist_name: str) -> Optional[Dict[str, Any]]:
+    """fetch_track on the shared async client, for async endpoints"""
+    token_manager = get_token_manager()
+    params = build_search_params(song_name, artist_name)
+
+    for attempt in range(2):
+        # Token refreshes are rare and blocking; keep them off the event loop
+        token = await asyncio.to_thread(token_manager.get_token)
+        if not token:
+            raise Exception("No Spotify access token")
+        headers = {
+            "Authorization": f"Bearer {token}"
+        }
+        response = await get_async_client().get(SEARCH_URL, headers=headers, params=params)
+        if response.status_code != 401 or attempt:
+            break
+        logger.warning("⚠️ Spotify rejected the cached token, refreshing")
+        token_manager.invalidate(token)
+
+    response.raise_for_status()
+    return parse_search_result(response.json(), song_name, artist_name)
+
+
+# Separators between artists in a requested credit ("A & B", "A feat. B", "A x B")
+_ARTIST_SEPARATORS = re.compile(r",|&|\s+(?:and|with|x|feat\.?|ft\.|featuring)\s+", re.IGNORECASE)
+
+def requested_artists(artist_name: str) -> set:
+    """Normalized names a requested artist credit may appear under on Spotify"""
+    names = {normalize_search_text(artist_name)}
+    names.update(normalize_search_text(part) for part in _ARTIST_SEPARATORS.split(artist_name or ""))
+    names.discard("")
+    return names
+
+
+def is_confident_match(song_name: str, artist_name: str, result: Dict[str, Any]) -> bool:
+    """
+    Whether a search hit is the requested song: same normalized title (allowing
+    suffixes like "- Remastered 2011") and a requested artist exactly equal to
+    one of its artists ("Eve" doesn't match "Steve Lacy").
+    """
+    wanted_song = normalize_search_text(song_name)
+    found_song = normalize_search_text(result.get("song", ""))
+    wanted_artists = requested_artists(artist_name)
+    # parse_search_result joins the track's artists with ", "
+    found_artists = {normalize_search_text(name) for name in (result.get("song_artist") or "").split(", ")}
+    if not wanted_song or not wanted_artists:
+        return False
+    title_matches = found_song == wanted_song or found_song.startswith(wanted_song + " ")
+    return title_matches and not wanted_artists.isdisjoint(found_artists)
+
+
+async def resolve_candidates(candidates: List[Dict[str, str]]) -> Optional[Tuple[int, Dict[str, Any]]]:
+    """
+    Resolve ranked song candidates, from the local track catalog if possible,
+    otherwise by searching Spotify for all of them concurrently.
+
+    The best-ranked confident match in the catalog is used without any
+    request. On Spotify the best-ranked confident match wins: as soon as one
+    is found and every better-ranked candidate has come back without one, the
+    remaining searches are cancelled. Without any confident match the
+    best-ranked hit is used.
+
+    Args:
+        candidates: [{"name", "artist"}] in order of preference
+
+    Returns:
+        (candidate index, track data), or None if no candidate was found
+    """
+    for i, c in enumerate(candidates):
+        track = catalog_lookup(c.get("name", ""), c.get("artist", ""))
+        if track and is_confident_match(c.get("name", ""), c.get("artist", ""), track):
+            metrics.incr("spotify_resolve.catalog")
+            logger.info(f"📚 Resolved '{c.get('name')}' by {c.get('artist')} from the track catalog")
+            return i, track
+
+    tasks = {
+        asyncio.ensure_future(search_track_async(c.get("name", ""), c.get("artist", ""))): i
+        for i, c in enumerate(candidates)
+    }
+    results: Dict[int, Optional[Dict[str, Any]]] = {}
+    confident: Optional[int] = None
+
+    try:
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                i = tasks[task]
+                results[i] = task.result()
+                if results[i] and is_confident_match(candidates[i].get("name", ""), candidates[i].get("artist", ""), results[i]):
+                    confident = i if confident is None else min(confident, i)
+
+            if confident is not None:
+                # Worse-ranked searches can no longer win
+                for task in list(pending):
+                    if tasks[task] > confident:
+                        task.cancel()
+                        pending.discard(task)
+                if all(i in results for i in range(confident)):
+                    break
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+    cancelled = len(candidates) - len(results)
+    if cancelled:
+        metrics.incr("spotify_resolve.cancelled", cancelled)
+
+    if confident is not None:
+        metrics.incr("spotify_resolve.confident")
+        return confident, results[confident]
+
+    for i in sorted(results):
+        if results[i]:
+            metrics.incr("spotify_resolve.fallback")
+            return i, results[i]
+
+    metrics.incr("spotify_resolve.not_found")
+    return None
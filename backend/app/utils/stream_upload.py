@@ -0,0 +1,99 @@
+import logging
+import time
+from typing import Optional
+from google.cloud.storage.retry import DEFAULT_RETRY
+from app.core.config import settings
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Log upload progress every this many bytes
+LOG_EVERY_BYTES = 16 * 1024 * 1024
+
+
+class StreamingUpload:
+    """
+    Resumable upload to Firebase Storage fed while the file is still being written.
+
+    Used as the encoder's output stream: bytes are buffered only up to one
+    chunk, and each full chunk is sent as one request of a resumable upload
+    session, so a network error retries that chunk instead of the whole file.
+    """
+
+    def __init__(
+        self,
+        bucket,
+        blob_path: str,
+        content_type: str = "video/mp4",
+        chunk_size: Optional[int] = None
+    ):
+        self.blob = bucket.blob(blob_path)
+        self.content_type = content_type
+        # Resumable chunks must be a multiple of 256 KB
+        self.chunk_size = chunk_size or settings.VIDEO_UPLOAD_CHUNK_MB * 1024 * 1024
+        self.bytes_written = 0
+
+        self._writer = None
+        self._started = time.time()
+        self._next_log = LOG_EVERY_BYTES
+
+    def write(self, data: bytes) -> int:
+        """Queue bytes for upload (sent whenever a full chunk is buffered)"""
+        if self._writer is None:
+            self._started = time.time()
+            self._writer = self.blob.open(
+                "wb",
+                chunk_size=self.chunk_size,
+                ignore_flush=True,
+                retry=DEFAULT_RETRY,
+                content_type=self.content_type
+            )
+        self._writer.write(data)
+        self.bytes_written += len(data)
+        metrics.incr("video_upload.bytes", len(data))
+
+        if self.bytes_written >= self._next_log:
+            logger.info(f"☁️ Uploaded {self.bytes_written / (1024 * 1024):.0f} MB so far")
+            self._next_log += LOG_EVERY_BYTES
+        return len(data)
+
+    def close(self) -> str:
+        """
+        Send the last partial chunk, finalize the upload and make it public.
+
+        Returns:
+            The public URL of the uploaded file
+        """
+        if self._writer is None:
+            raise Exception("Nothing was written to the upload stream")
+        self._writer.close()
+        self._writer = None
+        self.blob.make_public()
+
+        elapsed = time.time() - self._started
+        metrics.observe("video_upload.stream", elapsed)
+        logger.info(f"✅ Streamed {self.bytes_written / (1024 * 1024):.1f} MB to {self.blob.name} in {elapsed:.1f}s")
+        return self.blob.public_url
+
+    def abort(self):
+        """
+        Cancel the upload without finalizing it (the partial object never
+        appears). A resumable session already opened is deleted rather than
+        left to expire, so failed or cancelled jobs don't leave it behind.
+        """
+        writer, self._writer = self._writer, None
+        if writer is None:
+            return
+
+        # BlobWriter.terminate() deletes the initiation URL, not the session
+        # URI, so cancel the session directly
+        upload_and_transport = getattr(writer, "_upload_and_transport", None)
+        try:
+            if upload_and_transport and upload_and_transport[0].resumable_url:
+                upload, transport = upload_and_transport
+                # GCS answers a DELETE on the session URI with 499 once cancelled
+                transport.delete(upload.resumable_url, timeout=settings.HTTP_READ_TIMEOUT)
+                metrics.incr("video_upload.aborted")
+                logger.info(f"🛑 Cancelled upload session for {self.blob.name} after {self.bytes_written} bytes")
+        except Exception as e:
+            logger.warning(f"⚠️ Could not cancel upload session for {self.blob.name}: {str(e)}")
@@ -0,0 +1,140 @@
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+EMBED_URL = "https://open.spotify.com/embed/track/{}"
+
+
+def normalize_mood(mood: Optional[str]) -> str:
+    """Case-folded mood with collapsed whitespace ("Calm  and Peaceful" -> "calm and peaceful")"""
+    return " ".join((mood or "").casefold().split())
+
+
+class TrackCatalog:
+    """
+    Local index of every Spotify track the app has resolved.
+
+    One SQLite file with three tables: the tracks themselves (id, name and
+    artists; the embed link is derived from the id), the normalized
+    "song|artist" searches that resolved to each track, and the image/user
+    moods each track was recommended for. Entries never expire: a track id
+    stays valid, so after warm-up most lookups are answered locally.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS tracks ("
+                "spotify_id TEXT PRIMARY KEY, song TEXT, song_artist TEXT, added_at REAL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS searches ("
+                "key TEXT PRIMARY KEY, spotify_id TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS moods ("
+                "spotify_id TEXT NOT NULL, image_mood TEXT NOT NULL, user_mood TEXT NOT NULL, "
+                "times_chosen INTEGER NOT NULL DEFAULT 0, chosen_at REAL, "
+                "PRIMARY KEY (image_mood, user_mood, spotify_id))"
+            )
+
+    @staticmethod
+    def _track(row) -> Dict[str, Any]:
+        spotify_id, song, song_artist = row
+        return {
+            "song": song,
+            "song_artist": song_artist,
+            "embed": EMBED_URL.format(spotify_id),
+            "spotify_id": spotify_id
+        }
+
+    def record(self, key: str, track: Dict[str, Any]):
+        """Store a resolved track and the normalized search key that found it"""
+        spotify_id = track.get("spotify_id")
+        if not spotify_id:
+            return
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO tracks (spotify_id, song, song_artist, added_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (spotify_id) DO UPDATE SET song = excluded.song, song_artist = excluded.song_artist",
+                (spotify_id, track.get("song"), track.get("song_artist"), time.time())
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO searches (key, spotify_id) VALUES (?, ?)",
+                (key, spotify_id)
+            )
+
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        """Track a normalized search key resolved to before, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT t.spotify_id, t.song, t.song_artist FROM searches s "
+                "JOIN tracks t ON t.spotify_id = s.spotify_id WHERE s.key = ?",
+                (key,)
+            ).fetchone()
+        metrics.incr("track_catalog.hits" if row else "track_catalog.misses")
+        return self._track(row) if row else None
+
+    def record_mood(self, spotify_id: str, image_mood: Optional[str], user_mood: Optional[str]):
+        """Count a recommendation of a catalogued track for an image/user mood pair"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO moods (spotify_id, image_mood, user_mood, times_chosen, chosen_at) "
+                "VALUES (?, ?, ?, 1, ?) ON CONFLICT (image_mood, user_mood, spotify_id) "
+                "DO UPDATE SET times_chosen = times_chosen + 1, chosen_at = excluded.chosen_at",
+                (spotify_id, normalize_mood(image_mood), normalize_mood(user_mood), time.time())
+            )
+
+    def by_mood(self, image_mood: Optional[str], user_mood: Optional[str] = "", limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Tracks recommended before for an image mood.
+
+        Tracks chosen for the same user mood as well come first, then the
+        most often chosen.
+        """
+        image_mood, user_mood = normalize_mood(image_mood), normalize_mood(user_mood)
+        if not image_mood:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT t.spotify_id, t.song, t.song_artist FROM moods m "
+                "JOIN tracks t ON t.spotify_id = m.spotify_id WHERE m.image_mood = ? "
+                "GROUP BY t.spotify_id "
+                "ORDER BY MAX(m.user_mood = ?) DESC, SUM(m.times_chosen) DESC, MAX(m.chosen_at) DESC "
+                "LIMIT ?",
+                (image_mood, user_mood, limit)
+            ).fetchall()
+        return [self._track(row) for row in rows]
+
+
+_track_catalog: Optional[TrackCatalog] = None
+_track_catalog_lock = threading.Lock()
+
+def get_track_catalog() -> Optional[TrackCatalog]:
+    """Process-wide track catalog, or None if disabled or unavailable"""
+    global _track_catalog
+    if not settings.TRACK_CATALOG_ENABLED:
+        return None
+
+    with _track_catalog_lock:
+        if _track_catalog is None:
+            path = settings.TRACK_CATALOG_PATH or os.path.join(tempfile.gettempdir(), "soundtrack_cache", "track_catalog.sqlite3")
+            try:
+                _track_catalog = TrackCatalog(path)
+            except Exception as e:
+                metrics.incr("track_catalog.errors")
+                logger.error(f"❌ Failed to open track catalog at {path}: {str(e)}")
+                return None
+        return _track_catalog
@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Marks a cached "no result" so it can be told apart from a miss
+_NEGATIVE = {"__negative__": True}
+
+
+class MemoryStore:
+    """In-process LRU storage for TTLCache"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[float, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, stored_at: float, value: Any):
+        with self._lock:
+            self._entries[key] = (stored_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class SQLiteStore:
+    """
+    On-disk LRU storage for TTLCache: one SQLite file, values stored as JSON.
+
+    Survives restarts and can be shared by several worker processes.
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, stored_at REAL, used_at REAL, value TEXT)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_used_at ON entries (used_at)")
+
+    def get(self, key: str) -> Optional[Tuple[float, Any]]:
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT stored_at, value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE entries SET used_at = ? WHERE key = ?", (time.time(), key))
+        return row[0], json.loads(row[1])
+
+    def set(self, key: str, stored_at: float, value: Any):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, stored_at, used_at, value) VALUES (?, ?, ?, ?)",
+                (key, stored_at, stored_at, json.dumps(value))
+            )
+            # Trim the least recently used entries beyond max_entries
+            self._conn.execute(
+                "DELETE FROM entries WHERE key IN ("
+                "SELECT key FROM entries ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def delete(self, key: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+
+class TTLCache:
+    """
+    LRU cache with a TTL for results and a shorter one for "not found".
+
+    Storage is pluggable (MemoryStore or SQLiteStore). Values must be
+    JSON-serializable for the on-disk store.
+    """
+
+    def __init__(self, store, ttl: float, negative_ttl: float, name: str):
+        self.store = store
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.name = name  # Metric prefix, e.g. "spotify_search_cache"
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """
+        Look up key.
+
+        Returns:
+            (found, value): found is False on a miss or expired entry; value is
+            None for a cached negative result
+        """
+        try:
+            entry = self.store.get(key)
+        except Exception as e:
+            logger.warning(f"⚠️ {self.name} read failed: {str(e)}")
+            entry = None
+
+        if entry is not None:
+            stored_at, value = entry
+            negative = value == _NEGATIVE
+            if time.time() - stored_at <= (self.negative_ttl if negative else self.ttl):
+                metrics.incr(f"{self.name}.negative_hits" if negative else f"{self.name}.hits")
+                return True, None if negative else value
+            metrics.incr(f"{self.name}.expired")
+
+        metrics.incr(f"{self.name}.misses")
+        return False, None
+
+    def set(self, key: str, value: Any):
+        """Cache a result; None caches a negative result"""
+        try:
+            self.store.set(key, time.time(), _NEGATIVE if value is None else value)
+        except Exception as e:
+            logger.warning(f"⚠️ {self.name} write failed: {str(e)}")
@@ -1,284 +1,406 @@
 import os
 import logging
 import random
+import shutil
 import tempfile
-from typing import List
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import BinaryIO, Callable, Iterator, List, Optional
 from PIL import Image
 import requests
-from io import BytesIO
 import numpy as np
 
 # Fix for Pillow/moviepy compatibility
 if not hasattr(Image, 'ANTIALIAS'):
     Image.ANTIALIAS = Image.LANCZOS
 
-from moviepy.editor import ImageClip, concatenate_videoclips, AudioFileClip
+from moviepy.editor import VideoClip, AudioFileClip
+from moviepy.audio.fx.all import audio_loop
+from app.core.config import settings
+from app.utils.frame_renderer import MOTION_EFFECTS, MAX_ZOOM, MontageRenderer, prescale_source
+from app.utils.image_cache import ImageCache, get_image_cache
+from app.utils.ffmpeg_encoder import EncodeCancelled, EncodeTarget, encode_frames
+from app.utils.segment_renderer import render_parallel
+from app.utils.frame_store import FrameStore, CompactFrameStore
+from app.utils.audio_prep import prepare_audio_track
+from app.utils.image_loader import load_image
+from app.utils.http_client import get_session
 
 logger = logging.getLogger(__name__)
 
-# Ken Burns style motion effects (all images get continuous motion)
-MOTION_EFFECTS = [
-    'zoom_and_pan_right',
-    'zoom_and_pan_left',
-    'zoom_and_pan_down',
-    'zoom_and_pan_up',
-    'slow_zoom_in',
-    'slow_zoom_out',
-    'diagonal_drift_1',
-    'diagonal_drift_2'
-]
-
-def ease_in_out(t):
-    """Smooth easing function for natural motion"""
-    return t * t * (3 - 2 * t)
-
-def apply_motion_effect(clip, effect_type: str, duration: float):
-    """Apply continuous Ken Burns style motion effects to make images feel alive"""
-    w, h = clip.size
-
-    if effect_type == 'zoom_and_pan_right':
-        # Zoom in while panning right
-        return clip.resize(lambda t: 1 + 0.15 * ease_in_out(t / duration)).set_position(
-            lambda t: (-(w * 0.1) * ease_in_out(t / duration), 'center')
-        )
+# Render settings per quality level ("draft" is a fast low-resolution preview)
+RENDER_PROFILES = {
+    'full': {'video_size': (1920, 1080), 'fps': 24, 'preset': 'medium'},
+    'draft': {'video_size': (854, 480), 'fps': 12, 'preset': 'ultrafast'},
+}
 
-    elif effect_type == 'zoom_and_pan_left':
-        # Zoom in while panning left
-        return clip.resize(lambda t: 1 + 0.15 * ease_in_out(t / duration)).set_position(
-            lambda t: ((w * 0.1) * ease_in_out(t / duration), 'center')
-        )
+# Overlap between consecutive clips (seconds)
+CROSSFADE_SECONDS = 0.8
 
-    elif effect_type == 'zoom_and_pan_down':
-        # Zoom in while panning down
-        return clip.resize(lambda t: 1 + 0.15 * ease_in_out(t / duration)).set_position(
-            lambda t: ('center', -(h * 0.1) * ease_in_out(t / duration))
-        )
+# Extra output sizes that can be encoded alongside the main video from the same render
+RENDITION_PROFILES = {
+    '1080p': {'video_size': (1920, 1080), 'bitrate': '5000k', 'preset': 'medium'},
+    '720p': {'video_size': (1280, 720), 'bitrate': '2500k', 'preset': 'medium'},
+    '480p': {'video_size': (854, 480), 'bitrate': '1000k', 'preset': 'medium'},
+}
 
-    elif effect_type == 'zoom_and_pan_up':
-        # Zoom in while panning up
-        return clip.resize(lambda t: 1 + 0.15 * ease_in_out(t / duration)).set_position(
-            lambda t: ('center', (h * 0.1) * ease_in_out(t / duration))
-        )
+def resize_and_fit_image(img: Image.Image, target_size: tuple) -> Image.Image:
+    """
+    Resize image to fit within target size while maintaining aspect ratio.
+    Creates a black background canvas and centers the image (letterbox/pillarbox).
+    """
+    # Convert RGBA to RGB (remove transparency)
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', img.size, (0, 0, 0))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        img = background
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    img_width, img_height = img.size
+    target_width, target_height = target_size
+
+    # Calculate aspect ratios
+    img_aspect = img_width / img_height
+    target_aspect = target_width / target_height
+
+    # Resize to fit within bounds (contain, not cover)
+    if img_aspect > target_aspect:
+        # Image is wider - fit to width
+        new_width = target_width
+        new_height = int(target_width / img_aspect)
+    else:
+        # Image is taller - fit to height
+        new_height = target_height
+        new_width = int(target_height * img_aspect)
 
-    elif effect_type == 'slow_zoom_in':
-        # Subtle continuous zoom in
-        return clip.resize(lambda t: 1 + 0.2 * ease_in_out(t / duration))
+    # Resize image
+    img = img.resize((new_width, new_height), Image.LANCZOS)
 
-    elif effect_type == 'slow_zoom_out':
-        # Start zoomed, zoom out
-        return clip.resize(lambda t: 1.2 - 0.2 * ease_in_out(t / duration))
+    # Create black canvas and paste image in center
+    canvas = Image.new('RGB', target_size, (0, 0, 0))
+    paste_x = (target_width - new_width) // 2
+    paste_y = (target_height - new_height) // 2
+    canvas.paste(img, (paste_x, paste_y))
 
-    elif effect_type == 'diagonal_drift_1':
-        # Drift diagonally top-left to bottom-right
-        return clip.resize(1.15).set_position(
-            lambda t: (
-                -(w * 0.075) * ease_in_out(t / duration),
-                -(h * 0.075) * ease_in_out(t / duration)
-            )
-        )
+    logger.info(f"✂️  Resized and fitted image to {target_width}x{target_height}")
+    return canvas
 
-    elif effect_type == 'diagonal_drift_2':
-        # Drift diagonally top-right to bottom-left
-        return clip.resize(1.15).set_position(
-            lambda t: (
-                (w * 0.075) * ease_in_out(t / duration),
-                -(h * 0.075) * ease_in_out(t / duration)
-            )
-        )
+def download_image(url: str, session: Optional[requests.Session] = None) -> Optional[bytes]:
+    """Download image from URL and return its bytes"""
+    try:
+        session = session or get_session("images")
+        response = session.get(url, timeout=settings.IMAGE_DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+        return response.content
+    except Exception as e:
+        logger.error(f"Failed to download image from {url}: {str(e)}")
+        return None
 
-    else:
-        # Default: subtle zoom in
-        return clip.resize(lambda t: 1 + 0.1 * ease_in_out(t / duration))
+def download_and_fit_images(image_urls: List[str], video_size: tuple, store: FrameStore) -> CompactFrameStore:
+    """
+    Download all images concurrently over the pooled session and letterbox each
+    one in memory as soon as its bytes arrive. Images already in the on-disk
+    image cache skip both the download and the resize.
+
+    Returns:
+        The processed images in the original order (failed downloads skipped)
+    """
+    session = get_session("images")
+    cache = get_image_cache()
+
+    def fetch_and_fit(i: int, url: str) -> bool:
+        key = ImageCache.make_key(url, video_size, MAX_ZOOM)
+        if cache:
+            cached = cache.get(key)
+            if cached is not None:
+                store.put(i, cached)
+                return True
+
+        data = download_image(url, session=session)
+        if data is None:
+            return False
+        # Reduced decode, then fit to video size (no stretching) and pre-scale for the renderer
+        img = load_image(data, video_size)
+        source = prescale_source(resize_and_fit_image(img, video_size), video_size)
+
+        if cache:
+            try:
+                cache.put(key, source)
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to cache image {i}: {str(e)}")
+        store.put(i, source)
+        return True
 
+    workers = max(1, min(settings.IMAGE_DOWNLOAD_WORKERS, len(image_urls)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fetch_and_fit, i, url): i for i, url in enumerate(image_urls)}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                ok = future.result()
+            except Exception as e:
+                logger.error(f"Failed to resize/fit image {i}: {str(e)}")
+                ok = False
+            if not ok:
+                logger.warning(f"⚠️ Skipping image {i} due to download failure")
 
-def resize_and_fit_image(image_path: str, target_size: tuple) -> str:
+    if store.spilled:
+        logger.info(f"💽 {store.spilled} images spilled to disk (memory budget {store.memory_budget // (1024 * 1024)} MB)")
+    return store.compact()
+
+def report_progress(
+    frames: Iterator[np.ndarray],
+    total: int,
+    every: int,
+    progress_callback: Optional[Callable[[float], None]]
+) -> Iterator[np.ndarray]:
+    """Pass frames through, reporting the fraction done every `every` frames"""
+    for i, frame in enumerate(frames, 1):
+        yield frame
+        if progress_callback and (i % every == 0 or i == total):
+            progress_callback(i / total)
+
+def copy_to_stream(path: str, stream: BinaryIO, chunk_size: int = 1024 * 1024):
+    """Send a finished file through an output stream chunk by chunk"""
+    with open(path, 'rb') as f:
+        shutil.copyfileobj(f, stream, chunk_size)
+
+def write_with_moviepy(
+    renderer: MontageRenderer,
+    audio_path: Optional[str],
+    output_path: str,
+    work_dir: Optional[str] = None,
+    preset: str = 'medium',
+    renditions: Optional[List[EncodeTarget]] = None
+):
     """
-    Resize image to fit within target size while maintaining aspect ratio.
-    Creates a black background canvas and centers the image (letterbox/pillarbox).
+    Encode the rendered montage through moviepy's write_videofile (fallback path).
+    Renditions are written one after another from resized copies of the clip.
     """
-    try:
-        img = Image.open(image_path)
-
-        # Convert RGBA to RGB (remove transparency)
-        if img.mode in ('RGBA', 'LA', 'P'):
-            background = Image.new('RGB', img.size, (0, 0, 0))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-            img = background
-        elif img.mode != 'RGB':
-            img = img.convert('RGB')
-
-        img_width, img_height = img.size
-        target_width, target_height = target_size
-
-        # Calculate aspect ratios
-        img_aspect = img_width / img_height
-        target_aspect = target_width / target_height
-
-        # Resize to fit within bounds (contain, not cover)
-        if img_aspect > target_aspect:
-            # Image is wider - fit to width
-            new_width = target_width
-            new_height = int(target_width / img_aspect)
-        else:
-            # Image is taller - fit to height
-            new_height = target_height
-            new_width = int(target_height * img_aspect)
-
-        # Resize image
-        img = img.resize((new_width, new_height), Image.LANCZOS)
-
-        # Create black canvas and paste image in center
-        canvas = Image.new('RGB', target_size, (0, 0, 0))
-        paste_x = (target_width - new_width) // 2
-        paste_y = (target_height - new_height) // 2
-        canvas.paste(img, (paste_x, paste_y))
-
-        # Save the processed image as JPEG
-        canvas.save(image_path, 'JPEG', quality=95)
-        logger.info(f"✂️  Resized and fitted image to {target_width}x{target_height}")
-        return image_path
+    final_video = VideoClip(renderer.make_frame, duration=renderer.duration)
+    audio_clip = None
 
-    except Exception as e:
-        logger.error(f"Failed to resize/fit image: {str(e)}")
-        return image_path
+    if audio_path:
+        # Add audio
+        logger.info("🎵 Adding audio to video...")
+        audio_clip = AudioFileClip(audio_path)
 
-def download_image(url: str, output_path: str) -> bool:
-    """Download image from URL to local path"""
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
+        # If audio is longer than video, trim it
+        if audio_clip.duration > final_video.duration:
+            audio_clip = audio_clip.subclip(0, final_video.duration)
+        # If video is longer than audio, loop the audio
+        elif final_video.duration > audio_clip.duration:
+            # Loop audio to match video duration (AudioFileClip has no .loop method)
+            audio_clip = audio_loop(audio_clip, duration=final_video.duration)
 
-        with open(output_path, 'wb') as f:
-            f.write(response.content)
+        final_video = final_video.set_audio(audio_clip)
 
-        return True
-    except Exception as e:
-        logger.error(f"Failed to download image from {url}: {str(e)}")
-        return False
+    targets = [EncodeTarget(output_path, renderer.video_size, preset=preset)] + list(renditions or [])
+    temp_dir = tempfile.mkdtemp(dir=work_dir)
+    try:
+        for target in targets:
+            clip = final_video
+            if target.video_size != tuple(renderer.video_size):
+                clip = final_video.resize(newsize=target.video_size)
+
+            # Write output video
+            logger.info(f"💾 Writing video to {target.path}{'' if audio_clip else ' without audio'}...")
+            clip.write_videofile(
+                target.path,
+                fps=renderer.fps,
+                codec='libx264',
+                preset=target.preset,
+                bitrate=target.bitrate,
+                audio=audio_clip is not None,
+                audio_codec='aac',
+                temp_audiofile=os.path.join(temp_dir, 'temp_audio.m4a'),
+                remove_temp=True
+            )
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+        # Cleanup
+        if audio_clip:
+            audio_clip.close()
+        final_video.close()
 
 def create_video_from_images(
     image_urls: List[str],
-    audio_path: str,
+    audio_path: Optional[str],
     output_path: str,
     duration_per_image: float = 2.0,
     transition_duration: float = 0.5,
-    video_size: tuple = (1920, 1080)  # Standard 1080p HD
+    video_size: tuple = (1920, 1080),  # Standard 1080p HD
+    fps: int = 24,
+    preset: str = 'medium',
+    work_dir: Optional[str] = None,
+    render_workers: Optional[int] = None,
+    progress_callback: Optional[Callable[[float], None]] = None,
+    renditions: Optional[List[EncodeTarget]] = None,
+    hls_time: Optional[float] = None,
+    output_stream: Optional[BinaryIO] = None
 ) -> bool:
     """
     Create a video from a list of image URLs with transitions and audio
 
     Args:
         image_urls: List of image URLs
-        audio_path: Path to audio file
+        audio_path: Path to audio file (None renders a silent video)
         output_path: Path to save the output video
         duration_per_image: Duration each image is displayed (seconds)
         transition_duration: Duration of transition effects (seconds)
         video_size: Size of output video (width, height)
+        fps: Output frame rate
+        preset: x264 encoder preset (e.g. 'ultrafast' for drafts)
+        work_dir: Scratch directory for spilled images and render segments
+            (temp directories are created on demand if not given)
+        render_workers: Processes for segmented rendering (defaults to
+            VIDEO_RENDER_WORKERS; 1 renders in a single encoder, 0 uses every core)
+        progress_callback: Called with the fraction of frames rendered so far;
+            raising EncodeCancelled from it stops the render
+        renditions: Extra outputs (own path, size, bitrate and preset) encoded
+            from the same rendered frames as output_path
+        hls_time: Write output_path as an HLS playlist with segments of about
+            this many seconds, in frame order so they can be published while
+            the render is still running (ffmpeg encoder only)
+        output_stream: Writable stream (e.g. a resumable upload) that receives
+            the main video as it is encoded instead of output_path; paths that
+            only produce a finished file copy it into the stream afterwards
 
     Returns:
         True if successful, False otherwise
+
+    Raises:
+        EncodeCancelled: if the render was cancelled through progress_callback
     """
+    # Letterboxed images stay in memory; only spill to disk beyond the budget
+    prepared_audio_path = None
+    store = FrameStore(
+        settings.VIDEO_FRAME_MEMORY_BUDGET_MB * 1024 * 1024,
+        spill_dir=os.path.join(work_dir, "frames") if work_dir else None
+    )
+
     try:
         logger.info(f"🎬 Creating video from {len(image_urls)} images at {video_size[0]}x{video_size[1]}")
 
-        # Create temp directory for downloaded images
-        temp_dir = tempfile.mkdtemp()
-
-        # Download all images and resize/fit them
-        image_paths = []
-        for i, url in enumerate(image_urls):
-            img_path = os.path.join(temp_dir, f"image_{i}.jpg")
-            if download_image(url, img_path):
-                # Resize and fit to video size (no stretching)
-                resize_and_fit_image(img_path, video_size)
-                image_paths.append(img_path)
-            else:
-                logger.warning(f"⚠️ Skipping image {i} due to download failure")
+        # Download all images in parallel and resize/fit them in memory
+        images = download_and_fit_images(image_urls, video_size, store)
 
-        if not image_paths:
+        if not len(images):
             logger.error("❌ No images were downloaded successfully")
             return False
 
-        logger.info(f"✅ Downloaded and processed {len(image_paths)} images")
-
-        # Create video clips from images with continuous Ken Burns motion
-        clips = []
+        logger.info(f"✅ Downloaded and processed {len(images)} images")
 
         # Use smooth crossfade transitions
-        smooth_transition = 0.8
+        smooth_transition = CROSSFADE_SECONDS
 
-        for i, img_path in enumerate(image_paths):
-            # Create image clip
-            clip = ImageClip(img_path, duration=duration_per_image)
-
-            # Randomly select a Ken Burns motion effect for this clip
+        # Randomly select a Ken Burns motion effect for each image
+        effects = []
+        for i in range(len(images)):
             motion_type = random.choice(MOTION_EFFECTS)
-
-            # Apply continuous motion effect to the clip
-            clip = apply_motion_effect(clip, motion_type, duration_per_image)
-
+            effects.append(motion_type)
             logger.info(f"🎨 Image {i}: '{motion_type}' motion | crossfade")
 
-            # Fade in first image, fade out all images
-            if i == 0:
-                clip = clip.fadein(smooth_transition)
-            clip = clip.fadeout(smooth_transition)
-
-            clips.append(clip)
-
-        # Concatenate all clips with crossfade
+        # Render frames from precomputed motion tables instead of per-frame resizes
         logger.info("🔗 Building video with crossfade transitions...")
-        final_video = concatenate_videoclips(clips, method="compose", padding=-smooth_transition)
-
-        # Add audio
-        logger.info("🎵 Adding audio to video...")
-        audio_clip = AudioFileClip(audio_path)
-
-        # If audio is longer than video, trim it
-        if audio_clip.duration > final_video.duration:
-            audio_clip = audio_clip.subclip(0, final_video.duration)
-        # If video is longer than audio, loop the audio
-        elif final_video.duration > audio_clip.duration:
-            # Loop audio to match video duration
-            loops_needed = int(final_video.duration / audio_clip.duration) + 1
-            audio_clip = audio_clip.loop(n=loops_needed).subclip(0, final_video.duration)
-
-        final_video = final_video.set_audio(audio_clip)
-
-        # Write output video
-        logger.info(f"💾 Writing video to {output_path}...")
-        final_video.write_videofile(
-            output_path,
-            fps=24,
-            codec='libx264',
-            audio_codec='aac',
-            temp_audiofile=os.path.join(temp_dir, 'temp_audio.m4a'),
-            remove_temp=True
+        renderer = MontageRenderer(
+            images,
+            effects,
+            duration_per_image=duration_per_image,
+            transition=smooth_transition,
+            fps=fps,
+            video_size=video_size
         )
 
-        # Cleanup
-        for clip in clips:
-            clip.close()
-        audio_clip.close()
-        final_video.close()
+        # Loop/trim/fade and encode the music once (or reuse a cached encode),
+        # then every output muxes it with stream copy
+        audio_codec = 'aac'
+        if audio_path and settings.VIDEO_ENCODER == "ffmpeg":
+            prepared_audio_path = os.path.join(work_dir or tempfile.gettempdir(), f"audio_{os.getpid()}_{id(renderer)}.m4a")
+            prepared = prepare_audio_track(audio_path, renderer.duration, prepared_audio_path)
+            if prepared:
+                audio_path, audio_codec = prepared, 'copy'
+
+        written = False
+        workers = render_workers if render_workers is not None else settings.VIDEO_RENDER_WORKERS
+        if workers <= 0:
+            workers = os.cpu_count() or 1
+
+        if hls_time and settings.VIDEO_ENCODER != "ffmpeg":
+            logger.error("❌ HLS output needs the ffmpeg encoder")
+            return False
 
-        # Remove temp images
-        for img_path in image_paths:
+        # HLS segments must come out in order, so streamed output always uses one encoder
+        if settings.VIDEO_ENCODER == "ffmpeg" and workers > 1 and len(images) > 1 and not hls_time:
+            if work_dir:
+                segment_dir = os.path.join(work_dir, "segments")
+                os.makedirs(segment_dir, exist_ok=True)
+            else:
+                segment_dir = tempfile.mkdtemp(prefix="segments_")
             try:
-                os.remove(img_path)
-            except:
-                pass
-
-        try:
-            os.rmdir(temp_dir)
-        except:
-            pass
+                written = render_parallel(
+                    renderer,
+                    output_path,
+                    audio_path,
+                    segment_dir,
+                    workers,
+                    preset=preset,
+                    progress_callback=progress_callback,
+                    renditions=renditions,
+                    audio_codec=audio_codec
+                )
+            finally:
+                shutil.rmtree(segment_dir, ignore_errors=True)
+            if not written:
+                logger.warning("⚠️ Parallel render failed, falling back to a single encoder")
+            elif output_stream is not None:
+                copy_to_stream(output_path, output_stream)
+
+        if not written and settings.VIDEO_ENCODER == "ffmpeg":
+            logger.info(f"💾 Streaming {renderer.n_frames} frames to ffmpeg: {output_path}...")
+            written = encode_frames(
+                report_progress(renderer.iter_frames(), renderer.n_frames, renderer.fps, progress_callback),
+                output_path,
+                video_size,
+                fps=renderer.fps,
+                audio_path=audio_path,
+                duration=renderer.duration,
+                preset=preset,
+                renditions=renditions,
+                hls_time=hls_time,
+                output_stream=output_stream,
+                audio_codec=audio_codec
+            )
+            if not written and (hls_time or output_stream is not None):
+                # Part of the output may already be published, so don't start over
+                logger.error("❌ ffmpeg streaming encode failed")
+                return False
+            if not written:
+                logger.warning("⚠️ ffmpeg pipe encode failed, falling back to moviepy")
+
+        if not written:
+            write_with_moviepy(renderer, audio_path, output_path, work_dir=work_dir, preset=preset, renditions=renditions)
+            if output_stream is not None:
+                copy_to_stream(output_path, output_stream)
 
         logger.info(f"✅ Video created successfully: {output_path}")
         return True
 
+    except EncodeCancelled:
+        logger.info("🛑 Video render cancelled")
+        raise
+
     except Exception as e:
         logger.error(f"❌ Failed to create video: {str(e)}")
         return False
+
+    finally:
+        store.close()
+        if prepared_audio_path:
+            try:
+                os.remove(prepared_audio_path)
+            except OSError:
+                pass
@@ -0,0 +1,463 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Set, Tuple
+from firebase_admin import storage
+from app.core.config import settings
+from app.models.media import MediaModel
+from app.models.video_job import VideoJobModel, JOB_STAGES
+from app.models.montage import MontageModel
+from app.utils.lyria import get_music
+from app.utils.music_pool import get_music_pool
+from app.utils.ffmpeg_encoder import EncodeCancelled, EncodeTarget
+from app.utils.hls_uploader import HLSUploader
+from app.utils.incremental_montage import load_montage_music, update_montage
+from app.utils.stream_upload import StreamingUpload
+from app.utils.video_generator import RENDER_PROFILES, RENDITION_PROFILES, create_video_from_images
+from app.utils.workspace import JobWorkspace
+
+logger = logging.getLogger(__name__)
+
+# Give up on a job that keeps getting interrupted by restarts
+MAX_JOB_ATTEMPTS = 3
+
+_executors: Dict[str, ThreadPoolExecutor] = {}
+_executor_lock = threading.Lock()
+_pending: Set[str] = set()
+_cancelled: Set[str] = set()
+
+
+class JobCancelled(EncodeCancelled):
+    """Raised inside a running job once it has been cancelled"""
+
+
+class JobProgress:
+    """Writes stage and per-stage progress of a job to its record, throttled"""
+
+    def __init__(self, job_model: VideoJobModel, job_id: str):
+        self.job_model = job_model
+        self.job_id = job_id
+        self.stages = {stage: 0.0 for stage in JOB_STAGES}
+        self._last_write = 0.0
+
+    def check_cancelled(self):
+        """Raise JobCancelled if the job was cancelled"""
+        if self.job_id in _cancelled:
+            raise JobCancelled(f"Job {self.job_id} was cancelled")
+
+    def start(self, stage: str):
+        """Mark `stage` as the current stage"""
+        self.check_cancelled()
+        self.job_model.update(self.job_id, {"stage": stage, "stages": dict(self.stages)})
+        self._last_write = time.time()
+
+    def update(self, stage: str, fraction: float):
+        """Record progress of `stage` (written at most once a second unless complete)"""
+        self.check_cancelled()
+        self.stages[stage] = round(min(max(fraction, 0.0), 1.0), 3)
+        if fraction >= 1.0 or time.time() - self._last_write >= 1.0:
+            self.job_model.update(self.job_id, {"stages": dict(self.stages)})
+            self._last_write = time.time()
+
+    def publish(self, fields: Dict[str, Any]):
+        """Write extra fields to the job record right away (e.g. an early playlist_url)"""
+        self.job_model.update(self.job_id, dict(fields))
+
+
+def get_job_executor(quality: str = "full") -> ThreadPoolExecutor:
+    """Bounded pool of background render workers (drafts get their own pool)"""
+    pool = "draft" if quality == "draft" else "full"
+    with _executor_lock:
+        executor = _executors.get(pool)
+        if executor is None:
+            workers = settings.VIDEO_DRAFT_JOB_WORKERS if pool == "draft" else settings.VIDEO_JOB_WORKERS
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"video-job-{pool}")
+            _executors[pool] = executor
+        return executor
+
+
+def submit_video_job(job_id: str, quality: str = "full"):
+    """
+    Queue a job for the background workers.
+
+    Raises:
+        RuntimeError: if too many jobs are already queued or running on this process
+    """
+    with _executor_lock:
+        if job_id in _pending:
+            return
+        if len(_pending) >= settings.VIDEO_JOB_MAX_PENDING:
+            raise RuntimeError("Too many video jobs in progress, try again later")
+        _pending.add(job_id)
+
+    get_job_executor(quality).submit(run_video_job, job_id)
+    logger.info(f"📥 Queued video job {job_id}")
+
+
+def cancel_video_job(job_id: str) -> bool:
+    """
+    Ask a queued or running job on this process to stop. The job notices at
+    its next progress update and its workspace is removed.
+
+    Returns:
+        True if the job was in progress on this process
+    """
+    with _executor_lock:
+        if job_id not in _pending:
+            return False
+        _cancelled.add(job_id)
+    logger.info(f"🛑 Cancelling video job {job_id}")
+    return True
+
+
+def active_job_ids() -> Set[str]:
+    """Jobs queued or running on this process"""
+    with _executor_lock:
+        return set(_pending)
+
+
+def run_video_job(job_id: str):
+    """Worker entry point: run the pipeline for a job and record the outcome"""
+    job_model = VideoJobModel()
+    try:
+        job = job_model.get(job_id)
+        if not job:
+            logger.error(f"❌ Video job not found: {job_id}")
+            return
+        if job.get("status") == "cancelled" or job_id in _cancelled:
+            job_model.update(job_id, {"status": "cancelled"})
+            return
+
+        attempts = job.get("attempts", 0) + 1
+        job_model.update(job_id, {"status": "running", "attempts": attempts, "error": None})
+
+        progress = JobProgress(job_model, job_id)
+        with JobWorkspace(job_id) as workspace:
+            result = run_video_pipeline(job.get("request", {}), progress, workspace)
+
+        job_model.update(job_id, {
+            "status": "completed",
+            "stage": None,
+            "stages": dict(progress.stages),
+            "video_url": result["video_url"],
+            "result": result
+        })
+        logger.info(f"✅ Video job {job_id} completed")
+
+    except JobCancelled:
+        logger.info(f"🛑 Video job {job_id} cancelled")
+        job_model.update(job_id, {"status": "cancelled", "stage": None})
+
+    except Exception as e:
+        logger.error(f"❌ Video job {job_id} failed: {str(e)}", exc_info=True)
+        try:
+            job_model.update(job_id, {"status": "failed", "error": str(e)})
+        except Exception as update_error:
+            logger.error(f"❌ Failed to record failure of job {job_id}: {str(update_error)}")
+
+    finally:
+        with _executor_lock:
+            _pending.discard(job_id)
+            _cancelled.discard(job_id)
+
+
+def resume_pending_jobs() -> int:
+    """
+    Re-queue jobs left queued or running by a previous process (called on startup).
+
+    Returns:
+        Number of jobs re-queued
+    """
+    job_model = VideoJobModel()
+    resumed = 0
+    for job in job_model.get_by_status(["queued", "running"]):
+        if job.get("attempts", 0) >= MAX_JOB_ATTEMPTS:
+            job_model.update(job["id"], {"status": "failed", "error": "Interrupted too many times"})
+            continue
+        job_model.update(job["id"], {"status": "queued"})
+        try:
+            submit_video_job(job["id"], quality=job.get("quality", "full"))
+            resumed += 1
+        except RuntimeError:
+            # Leave it queued; the next restart will pick it up
+            break
+
+    if resumed:
+        logger.info(f"🔁 Resumed {resumed} interrupted video jobs")
+    return resumed
+
+
+def fetch_image_urls(media_ids: List[str], media_model: MediaModel) -> List[str]:
+    """Resolve media IDs to image storage URLs, skipping missing or non-image items"""
+    return [url for _, url in fetch_images(media_ids, media_model)]
+
+
+def fetch_images(media_ids: List[str], media_model: MediaModel) -> List[Tuple[str, str]]:
+    """
+    Resolve media IDs to (media_id, image URL) pairs, skipping missing or non-image items.
+
+    The downscaled working copy made at ingest is preferred over the original.
+    """
+    images = []
+    for media_id in media_ids:
+        try:
+            logger.info(f"  📄 Fetching media ID: {media_id}")
+            media_item = media_model.get(media_id)
+            if not media_item:
+                logger.warning(f"  ⚠️ Media item not found: {media_id}")
+                continue
+
+            if media_item.get("type") != "image":
+                logger.warning(f"  ⚠️ Media item is not an image: {media_id} (type: {media_item.get('type')})")
+                continue
+
+            storage_url = media_item.get("working_url") or media_item.get("storage_url")
+            if storage_url:
+                images.append((media_id, storage_url))
+                logger.info(f"  ✅ Got {'working' if media_item.get('working_url') else 'storage'} URL for {media_id}")
+            else:
+                logger.warning(f"  ⚠️ No storage URL for media: {media_id}")
+        except Exception as e:
+            logger.error(f"  ❌ Error fetching media {media_id}: {str(e)}", exc_info=True)
+            continue
+    return images
+
+
+def plan_renditions(names: List[str], video_size: tuple, workspace: JobWorkspace) -> Dict[str, EncodeTarget]:
+    """
+    Encode targets for the requested renditions. Sizes equal to or larger than
+    the rendered size are skipped: the main video already covers them.
+    """
+    targets = {}
+    for name in names:
+        profile = RENDITION_PROFILES.get(name)
+        if profile is None:
+            logger.warning(f"⚠️ Unknown rendition: {name}")
+            continue
+        if profile["video_size"][1] >= video_size[1]:
+            continue
+        targets[name] = EncodeTarget(
+            workspace.path(f"generated_video_{name}.mp4"),
+            profile["video_size"],
+            preset=profile["preset"],
+            bitrate=profile["bitrate"]
+        )
+    return targets
+
+
+def upload_video(bucket, local_path: str, blob_path: str) -> str:
+    """Upload a rendered video and return its public URL"""
+    blob = bucket.blob(blob_path)
+    blob.upload_from_filename(local_path, content_type='video/mp4')
+    blob.make_public()
+    return blob.public_url
+
+
+def run_video_pipeline(request: Dict[str, Any], progress: JobProgress, workspace: JobWorkspace) -> Dict[str, Any]:
+    """
+    Fetch media, generate music, render and upload the video for one job.
+    All intermediate files live in the job's workspace.
+
+    Returns:
+        The VideoGenerateResponse payload
+
+    Raises:
+        Exception: with a user-facing message if any stage fails
+    """
+    media_ids = request.get("media_ids", [])
+    music_prompt = request.get("music_prompt", "")
+    negative_prompt = request.get("negative_prompt", "")
+    refresh_music = request.get("refresh_music", False)
+    quality = request.get("quality", "full")
+    profile = RENDER_PROFILES.get(quality, RENDER_PROFILES["full"])
+    rendition_names = request.get("renditions", [])
+    output_format = request.get("output_format", "mp4")
+    montage_id = request.get("montage_id")
+    if montage_id and (rendition_names or output_format != "mp4"):
+        # Stored montage segments are single-rendition MP4
+        logger.warning("⚠️ Montage appends produce a single MP4, ignoring renditions/output format")
+        rendition_names, output_format = [], "mp4"
+
+    logger.info("=" * 80)
+    logger.info("🎬 VIDEO GENERATION JOB STARTED")
+    logger.info(f"📋 Media IDs: {media_ids}")
+    logger.info(f"🎵 Music Prompt: {music_prompt}")
+    logger.info(f"🎚️  Quality: {quality}")
+    logger.info(f"📐 Renditions: {rendition_names}")
+    logger.info(f"📦 Output format: {output_format}")
+    logger.info(f"🗓️  Montage: {montage_id}")
+    logger.info("=" * 80)
+
+    # Fetch media items and get their storage URLs
+    progress.start("fetch_media")
+    logger.info(f"🔍 Fetching media items for {len(media_ids)} IDs...")
+    images = fetch_images(media_ids, MediaModel())
+    image_urls = [url for _, url in images]
+    if not image_urls:
+        raise Exception("No valid images found from provided media IDs")
+    progress.update("fetch_media", 1.0)
+    logger.info(f"✅ Found {len(image_urls)} valid images")
+
+    bucket = storage.bucket()
+
+    progress.start("music")
+    # An appended montage keeps its music if the prompts haven't changed
+    montage_music = None
+    if montage_id and quality != "draft" and not refresh_music:
+        montage_music = load_montage_music(MontageModel().get(montage_id), music_prompt, negative_prompt, bucket, workspace.root)
+
+    if montage_music:
+        audio_path = montage_music
+        logger.info(f"🎵 Reusing music of montage {montage_id}")
+    elif quality == "draft":
+        # Drafts skip Lyria: use the placeholder track if configured, else render silent
+        audio_path = settings.VIDEO_DRAFT_AUDIO_PATH or None
+        if audio_path and not os.path.exists(audio_path):
+            logger.warning(f"⚠️ Draft audio not found: {audio_path}, rendering without audio")
+            audio_path = None
+        logger.info(f"🎵 Draft render, skipping Lyria (audio: {audio_path})")
+    else:
+        # Take a pre-generated track if the prompt is a pooled preset with one ready,
+        # otherwise generate with Lyria (or reuse the cached track for this prompt)
+        temp_audio_path = workspace.path("generated_music.wav")
+        pool = get_music_pool() if not refresh_music else None
+        audio_path = pool.take(music_prompt, negative_prompt, temp_audio_path) if pool else None
+        if not audio_path:
+            logger.info("🎵 Generating music with Lyria...")
+            audio_path = get_music(
+                prompt=music_prompt,
+                negative_prompt=negative_prompt,
+                output_path=temp_audio_path,
+                force_refresh=refresh_music
+            )
+            if pool:
+                # Fill the pool for the next job only now, so this one doesn't compete with it
+                pool.refill(music_prompt, negative_prompt)
+        if not audio_path:
+            raise Exception("Failed to generate music")
+        logger.info(f"✅ Music generated: {audio_path}")
+    progress.update("music", 1.0)
+
+    # Everything this job uploads goes under one videos/ prefix. The job id keeps
+    # jobs finishing in the same second (parallel and draft workers) apart
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    suffix = "_draft" if quality == "draft" else ""
+    blob_prefix = f"videos/video_{timestamp}_{workspace.job_id}{suffix}"
+
+    # Create video
+    progress.start("render")
+    logger.info(f"🎬 Creating video from {len(image_urls)} images...")
+    temp_video_path = workspace.path("generated_video.mp4")
+    renditions = plan_renditions(rendition_names, profile["video_size"], workspace)
+
+    uploader = None
+    if output_format == "hls":
+        # Segments are uploaded as ffmpeg finishes them; the playlist URL is
+        # published on the job as soon as the first one is live
+        hls_dir = workspace.path("hls")
+        os.makedirs(hls_dir, exist_ok=True)
+        temp_video_path = os.path.join(hls_dir, "playlist.m3u8")
+        uploader = HLSUploader(
+            hls_dir,
+            "playlist.m3u8",
+            bucket,
+            blob_prefix,
+            on_playlist=lambda url: progress.publish({"playlist_url": url})
+        )
+        uploader.start()
+
+    upload = None
+    if output_format != "hls" and settings.VIDEO_STREAM_UPLOAD and not montage_id:
+        # The MP4 goes into a resumable upload while it is encoded instead of after
+        upload = StreamingUpload(bucket, f"{blob_prefix}.mp4")
+
+    # The main video and each rendition are an equal share of the upload stage
+    upload_count = len(renditions) + 1
+
+    def on_render_progress(fraction: float):
+        progress.update("render", fraction)
+        if uploader or upload:
+            # Upload of the main video keeps pace with the encoder
+            progress.update("upload", fraction / upload_count)
+
+    try:
+        if montage_id:
+            # Only the clips added since the last render of this montage are rendered
+            success = update_montage(
+                montage_id,
+                images,
+                audio_path,
+                temp_video_path,
+                quality,
+                profile,
+                workspace.root,
+                bucket,
+                music_prompt=music_prompt,
+                negative_prompt=negative_prompt,
+                duration_per_image=2.0,
+                progress_callback=on_render_progress
+            ) is not None
+        else:
+            success = create_video_from_images(
+                image_urls=image_urls,
+                audio_path=audio_path,
+                output_path=temp_video_path,
+                duration_per_image=2.0,
+                transition_duration=0.5,
+                video_size=profile["video_size"],
+                fps=profile["fps"],
+                preset=profile["preset"],
+                work_dir=workspace.root,
+                progress_callback=on_render_progress,
+                renditions=list(renditions.values()),
+                hls_time=settings.VIDEO_HLS_SEGMENT_SECONDS if uploader else None,
+                output_stream=upload
+            )
+        if not success:
+            raise Exception("Failed to create video")
+        progress.update("render", 1.0)
+        logger.info(f"✅ Video created: {temp_video_path}")
+
+        # Upload video and its renditions to Firebase Storage
+        progress.start("upload")
+        logger.info("☁️ Uploading video to Firebase Storage...")
+        if uploader:
+            # Only the tail segments and the final playlist are left to upload
+            video_url = uploader.finish()
+        elif upload:
+            # Only the last partial chunk is left to send
+            video_url = upload.close()
+        else:
+            video_url = upload_video(bucket, temp_video_path, f"{blob_prefix}.mp4")
+    except Exception:
+        if upload:
+            upload.abort()
+        raise
+    finally:
+        if uploader:
+            uploader.stop()
+    progress.update("upload", 1.0 / upload_count)
+    logger.info(f"✅ Video uploaded to: {video_url}")
+
+    rendition_urls = {}
+    for i, (name, target) in enumerate(renditions.items(), 2):
+        rendition_urls[name] = upload_video(bucket, target.path, f"{blob_prefix}_{name}.mp4")
+        progress.update("upload", i / upload_count)
+        logger.info(f"✅ {name} rendition uploaded to: {rendition_urls[name]}")
+
+    # Requested sizes not smaller than the main video are served by the main video
+    for name in rendition_names:
+        if name in RENDITION_PROFILES and name not in rendition_urls:
+            rendition_urls[name] = video_url
+    logger.info("=" * 80)
+
+    return {
+        "message": "Video generated successfully",
+        "video_url": video_url,
+        "media_ids": media_ids,
+        "renditions": rendition_urls,
+        "playlist_url": video_url if uploader else None
+    }
@@ -0,0 +1,159 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Callable, Optional, Set
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+MARKER_FILE = ".workspace.json"
+MARKERLESS_GRACE_SECONDS = 300
+
+
+def get_workspace_root() -> str:
+    """Directory holding one workspace per render job"""
+    root = settings.VIDEO_WORKSPACE_DIR or os.path.join(tempfile.gettempdir(), "soundtrack_jobs")
+    os.makedirs(root, exist_ok=True)
+    return root
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return total
+
+
+def ensure_workspace_capacity():
+    """
+    Admission check before accepting a render job.
+
+    Raises:
+        RuntimeError: if free disk space or the workspace quota would be exceeded
+    """
+    root = get_workspace_root()
+    free_mb = shutil.disk_usage(root).free / (1024 * 1024)
+    if free_mb < settings.VIDEO_WORKSPACE_MIN_FREE_MB:
+        raise RuntimeError(f"Not enough free disk space for a render ({free_mb:.0f} MB free)")
+
+    used_mb = _dir_size(root) / (1024 * 1024)
+    if used_mb + settings.VIDEO_WORKSPACE_JOB_MB > settings.VIDEO_WORKSPACE_QUOTA_MB:
+        raise RuntimeError(f"Render workspace quota exceeded ({used_mb:.0f} MB in use)")
+
+
+class JobWorkspace:
+    """
+    Private scratch directory for one render job.
+
+    Used as a context manager: the directory is created on enter and removed
+    on exit whether the job succeeded, failed or was cancelled. A marker file
+    records the owning process so the janitor can tell orphans apart.
+    """
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.root = os.path.join(get_workspace_root(), job_id)
+
+    def __enter__(self) -> "JobWorkspace":
+        ensure_workspace_capacity()
+        # A leftover from an interrupted attempt of the same job is stale
+        shutil.rmtree(self.root, ignore_errors=True)
+        os.makedirs(self.root)
+        with open(os.path.join(self.root, MARKER_FILE), "w") as f:
+            json.dump({"job_id": self.job_id, "pid": os.getpid(), "created_at": time.time()}, f)
+        logger.info(f"📂 Created workspace {self.root}")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup()
+        return False
+
+    def path(self, *parts: str) -> str:
+        """Path of a file inside the workspace"""
+        return os.path.join(self.root, *parts)
+
+    def cleanup(self):
+        """Remove the workspace and everything in it"""
+        shutil.rmtree(self.root, ignore_errors=True)
+        logger.info(f"🧹 Removed workspace {self.root}")
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def clean_orphaned_workspaces(
+    active_job_ids: Optional[Set[str]] = None,
+    max_age_seconds: Optional[float] = None
+) -> int:
+    """
+    Remove workspaces whose owning process is gone, that this process owns but
+    no longer runs a job for, or that outlived max_age_seconds.
+
+    Returns:
+        Number of workspaces removed
+    """
+    if max_age_seconds is None:
+        max_age_seconds = settings.VIDEO_WORKSPACE_MAX_AGE_HOURS * 3600
+
+    root = get_workspace_root()
+    now = time.time()
+    removed = 0
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if not os.path.isdir(path):
+            continue
+
+        try:
+            with open(os.path.join(path, MARKER_FILE)) as f:
+                marker = json.load(f)
+            pid = marker.get("pid")
+            created_at = marker.get("created_at", 0)
+        except (OSError, ValueError):
+            # No marker yet: either being created right now or left half-made
+            pid = None
+            created_at = os.path.getmtime(path)
+
+        if pid is None:
+            orphaned = now - created_at > MARKERLESS_GRACE_SECONDS
+        elif pid == os.getpid():
+            orphaned = active_job_ids is not None and name not in active_job_ids
+        else:
+            orphaned = not _pid_alive(pid)
+        orphaned = orphaned or now - created_at > max_age_seconds
+
+        if orphaned:
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+            logger.info(f"🧹 Janitor removed orphaned workspace {path}")
+
+    return removed
+
+
+def start_workspace_janitor(active_job_ids: Callable[[], Set[str]]) -> threading.Thread:
+    """Run clean_orphaned_workspaces now and then every VIDEO_WORKSPACE_JANITOR_MINUTES"""
+    def loop():
+        while True:
+            try:
+                clean_orphaned_workspaces(active_job_ids())
+            except Exception as e:
+                logger.error(f"❌ Workspace janitor failed: {str(e)}")
+            time.sleep(settings.VIDEO_WORKSPACE_JANITOR_MINUTES * 60)
+
+    thread = threading.Thread(target=loop, name="workspace-janitor", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,38 @@
+from io import BytesIO
+import pytest
+from PIL import Image
+from app.utils.image_loader import load_image
+
+
+def encode(img: Image.Image, format: str, **params) -> bytes:
+    out = BytesIO()
+    img.save(out, format=format, **params)
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("mode,format,params", [
+    ("P", "PNG", {}),
+    ("P", "PNG", {"transparency": 0}),
+    ("P", "GIF", {}),
+    ("1", "PNG", {}),
+    ("I;16", "PNG", {}),
+])
+def test_large_images_in_modes_reduce_cannot_handle(mode, format, params):
+    data = encode(Image.new(mode, (2000, 1500)), format, **params)
+
+    img = load_image(data, (400, 300))
+
+    # Box-reduced to within 2x of the target instead of failing
+    assert 400 <= img.width < 800 and 300 <= img.height < 600
+
+
+def test_transparent_palette_keeps_alpha():
+    data = encode(Image.new("P", (2000, 1500)), "PNG", transparency=0)
+
+    assert load_image(data, (400, 300)).mode == "RGBA"
+
+
+def test_small_palette_image_is_left_alone():
+    data = encode(Image.new("P", (300, 200)), "PNG")
+
+    assert load_image(data, (400, 300)).mode == "P"
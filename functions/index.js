@@ -22,6 +22,12 @@ exports.onImageUpload = functions.storage.object().onFinalize(async (object) =>
     return null;
   }
 
+  // Skip the thumbnail/working copies the backend writes at ingest
+  if (object.metadata && object.metadata.rendition) {
+    console.log(`Skipping ingest rendition: ${filePath}`);
+    return null;
+  }
+
   console.log(`New image uploaded: ${filePath}`);
 
   const storageUrl = `https://storage.googleapis.com/${bucket}/${filePath}`;